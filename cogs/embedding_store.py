@@ -0,0 +1,119 @@
+"""EmbeddingStore: lazily memory-mapped game embedding matrix.
+
+`scripts/convert_embeddings.py` turns data/game_embeddings.pkl into a
+pre-centered, pre-normalized float32 .npy matrix and a JSON names index.
+The store opens that matrix with np.load(mmap_mode='r') the first time it
+is needed, so importing the recommender costs nothing and only the pages
+for titles actually looked up are read from disk. numpy itself is imported
+on that first use too.
+"""
+import json
+import os
+import pickle
+import threading
+from typing import TYPE_CHECKING
+
+from cogs.ui_constants import LOG_OK
+
+if TYPE_CHECKING:
+    import numpy as np
+
+NPY_PATH = 'data/game_embeddings.npy'
+NAMES_PATH = 'data/game_embeddings.names.json'
+PKL_PATH = 'data/game_embeddings.pkl'
+
+
+def center_and_normalize(vectors) -> 'np.ndarray':
+    """Mean-center the rows, L2-normalize them, and return a contiguous float32 matrix."""
+    import numpy as np
+    mat = np.asarray(vectors, dtype=np.float64)
+    mat -= mat.mean(axis=0)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(mat / norms, dtype=np.float32)
+
+
+class EmbeddingStore:
+    """Title -> embedding row lookup backed by a read-only memory map.
+
+    Falls back to unpickling (and centering in-process) when only the
+    legacy .pkl exists, and to an empty (0 x 0) matrix when neither does.
+    """
+
+    def __init__(self, npy_path: str = NPY_PATH, names_path: str = NAMES_PATH,
+                 pkl_path: str = PKL_PATH):
+        self.npy_path = npy_path
+        self.names_path = names_path
+        self.pkl_path = pkl_path
+        self._matrix: 'np.ndarray | None' = None
+        self._index: dict[str, int] | None = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        import numpy as np
+        with self._lock:
+            if self._matrix is not None:
+                return
+            matrix, names = np.zeros((0, 0), dtype=np.float32), []
+            try:
+                if os.path.exists(self.npy_path) and os.path.exists(self.names_path):
+                    matrix = np.load(self.npy_path, mmap_mode='r')
+                    with open(self.names_path, 'r', encoding='utf-8') as f:
+                        names = json.load(f)
+                    print(f"{LOG_OK} Mapped {len(names)} game embeddings from {self.npy_path}")
+                elif os.path.exists(self.pkl_path):
+                    with open(self.pkl_path, 'rb') as f:
+                        raw = pickle.load(f)
+                    if raw:
+                        names = list(raw)
+                        matrix = center_and_normalize([raw[g] for g in names])
+                    print(f"Loaded {len(names)} game embeddings (Applied Mean Centering). "
+                          f"Run scripts/convert_embeddings.py for faster startup.")
+            except Exception as e:
+                print(f"Failed to load game embeddings: {e}")
+                matrix, names = np.zeros((0, 0), dtype=np.float32), []
+            self._index = {g: i for i, g in enumerate(names)}
+            self._matrix = matrix
+
+    @property
+    def matrix(self) -> 'np.ndarray':
+        if self._matrix is None:
+            self._load()
+        return self._matrix
+
+    @property
+    def index(self) -> dict[str, int]:
+        if self._index is None:
+            self._load()
+        return self._index
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def game_matrix(self, all_games):
+        """Embedding rows aligned to all_games, plus a mask of titles that have one.
+
+        Titles without an embedding get a zero row. The width comes from the
+        loaded matrix (0 when no embeddings are available).
+        """
+        import numpy as np
+        index, matrix = self.index, self.matrix
+        rows = np.fromiter((index.get(g, -1) for g in all_games),
+                           dtype=np.intp, count=len(all_games))
+        has_emb = rows >= 0
+        game_embs = np.zeros((len(all_games), matrix.shape[1]), dtype=np.float32)
+        # Fancy indexing copies just these rows; the rest of the map stays on disk
+        game_embs[has_emb] = matrix[rows[has_emb]]
+        return game_embs, has_emb
+
+
+_store: EmbeddingStore | None = None
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """Return the process-wide EmbeddingStore (nothing is read until first use)."""
+    global _store
+    if _store is None:
+        _store = EmbeddingStore()
+    return _store
@@ -0,0 +1,153 @@
+"""Events: typed write records produced by the gateway listeners.
+
+Listeners only update their in-memory state and hand one of these records
+to `Storage.submit`; the writer thread calls `record.apply(conn)` inside
+the batch transaction. Each record holds plain values captured at event
+time (no discord objects), so it can wait in the queue safely.
+"""
+import sqlite3
+from datetime import datetime
+from typing import NamedTuple
+
+from cogs.schema import to_epoch
+
+# Closed sessions are folded into the rollups; the row's start day/hour owns the whole session.
+_UPSERT_DAILY_STATS = '''
+    INSERT INTO daily_user_game_stats (day, user_id, game_name, session_count, total_seconds)
+    VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT(day, user_id, game_name) DO UPDATE SET
+        session_count = session_count + 1,
+        total_seconds = total_seconds + excluded.total_seconds
+'''
+_UPSERT_HOUR_STATS = '''
+    INSERT INTO user_hour_stats (user_id, hour, session_count)
+    VALUES (?, ?, 1)
+    ON CONFLICT(user_id, hour) DO UPDATE SET session_count = session_count + 1
+'''
+
+# Shared with TrackerCog's startup reconciliation, which applies them with executemany
+INSERT_PARTY_SESSION = '''
+    INSERT INTO party_sessions
+    (party_id, user_id, game_name, party_size_current, party_size_max, joined_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+CLOSE_PARTY_SESSION = '''
+    UPDATE party_sessions SET left_at=?
+    WHERE party_id=? AND user_id=? AND left_at IS NULL
+'''
+
+
+def apply_rollups(conn: sqlite3.Connection, user_id: str, game_name: str,
+                  start_time: datetime, duration: int):
+    """Add one closed session to daily_user_game_stats / user_hour_stats."""
+    conn.execute(_UPSERT_DAILY_STATS,
+                 (start_time.date().isoformat(), user_id, game_name, duration))
+    conn.execute(_UPSERT_HOUR_STATS, (user_id, start_time.hour))
+
+
+class GameStarted(NamedTuple):
+    user_id: str
+    user_name: str
+    game_name: str
+    start_time: datetime
+    details: str | None
+
+    def apply(self, conn: sqlite3.Connection):
+        conn.execute('''
+            INSERT INTO game_sessions
+            (user_id, user_name, game_name, start_time, end_time, duration, details,
+             start_epoch)
+            VALUES (?, ?, ?, ?, NULL, 0, ?, ?)
+        ''', (self.user_id, self.user_name, self.game_name, self.start_time.isoformat(),
+              self.details, to_epoch(self.start_time)))
+
+
+class GameEnded(NamedTuple):
+    user_id: str
+    game_name: str
+    start_time: datetime
+    end_time: datetime
+    duration: int
+
+    def apply(self, conn: sqlite3.Connection):
+        # 書き込みは非同期に行うため行IDは持たず、未終了の最新の行だけを閉じる
+        # （異常終了の残りなどで重複していても、rollup と同じ1セッション分にする）
+        closed = conn.execute('''
+            UPDATE game_sessions
+            SET end_time=?, duration=?, end_epoch=?
+            WHERE id = (SELECT MAX(id) FROM game_sessions
+                        WHERE user_id=? AND game_name=? AND end_time IS NULL)
+        ''', (self.end_time.isoformat(), self.duration, to_epoch(self.end_time),
+              self.user_id, self.game_name)).rowcount
+        if closed:
+            apply_rollups(conn, self.user_id, self.game_name, self.start_time, self.duration)
+
+
+class VoiceInterval(NamedTuple):
+    """One member's stay in one voice channel; pair overlaps are derived by cogs.voice_overlap."""
+    user_id: str
+    channel_id: str
+    channel_name: str | None
+    game_name: str | None
+    join_time: datetime
+    leave_time: datetime
+
+    def apply(self, conn: sqlite3.Connection):
+        conn.execute('''
+            INSERT INTO voice_intervals
+            (user_id, channel_id, channel_name, game_name,
+             join_time, leave_time, join_epoch, leave_epoch)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (self.user_id, self.channel_id, self.channel_name, self.game_name,
+              self.join_time.isoformat(), self.leave_time.isoformat(),
+              to_epoch(self.join_time), to_epoch(self.leave_time)))
+
+
+class PartyJoined(NamedTuple):
+    party_id: str
+    user_id: str
+    game_name: str
+    size_current: int | None
+    size_max: int | None
+    joined_at: datetime
+
+    def row(self) -> tuple:
+        return (self.party_id, self.user_id, self.game_name,
+                self.size_current, self.size_max, self.joined_at.isoformat())
+
+    def apply(self, conn: sqlite3.Connection):
+        conn.execute(INSERT_PARTY_SESSION, self.row())
+
+
+class PartyLeft(NamedTuple):
+    party_id: str
+    user_id: str
+    left_at: datetime
+
+    def row(self) -> tuple:
+        return (self.left_at.isoformat(), self.party_id, self.user_id)
+
+    def apply(self, conn: sqlite3.Connection):
+        conn.execute(CLOSE_PARTY_SESSION, self.row())
+
+
+class PartiesClosed(NamedTuple):
+    """Every open party_sessions row closed at once (shutdown)."""
+    left_at: datetime
+
+    def apply(self, conn: sqlite3.Connection):
+        conn.execute('UPDATE party_sessions SET left_at=? WHERE left_at IS NULL',
+                     (self.left_at.isoformat(),))
+
+
+class MentionLogged(NamedTuple):
+    from_user_id: str
+    to_user_id: str
+    channel_id: str
+    timestamp: datetime
+
+    def apply(self, conn: sqlite3.Connection):
+        conn.execute('''
+            INSERT INTO mention_logs (from_user_id, to_user_id, channel_id, timestamp)
+            VALUES (?, ?, ?, ?)
+        ''', (self.from_user_id, self.to_user_id, self.channel_id, self.timestamp.isoformat()))
@@ -0,0 +1,71 @@
+"""Executor: shared thread pool for the blocking parts of command handlers.
+
+SQLite reads, NumPy scoring and image rendering run here through
+`run_blocking`, so the event loop (gateway heartbeat, other members'
+commands) only waits for the await. Each call logs how long it queued and
+how long it ran under LOG_PERF. `log_task_errors` is the done callback for
+fire-and-forget tasks, so a failure is printed when it happens instead of
+as "Task exception was never retrieved" at garbage collection.
+
+The worker count comes from BOT_EXECUTOR_WORKERS (default: CPU count + 2,
+at most 8).
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from cogs.ui_constants import LOG_PERF
+
+
+def _worker_count() -> int:
+    try:
+        return max(1, int(os.environ['BOT_EXECUTOR_WORKERS']))
+    except (KeyError, ValueError):
+        return min(8, (os.cpu_count() or 1) + 2)
+
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool (created on first use)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=_worker_count(), thread_name_prefix='bot-worker')
+    return _executor
+
+
+def _timed(fn, queued_at: float):
+    started = time.perf_counter()
+    return fn(), started - queued_at, time.perf_counter() - started
+
+
+async def run_blocking(label: str, fn, *args, **kwargs):
+    """Run `fn(*args, **kwargs)` on the shared pool and log its queue / run time."""
+    loop = asyncio.get_running_loop()
+    result, waited, ran = await loop.run_in_executor(
+        get_executor(), _timed, partial(fn, *args, **kwargs), time.perf_counter())
+    print(f"{LOG_PERF} {label}: {ran * 1000:.0f}ms (queued {waited * 1000:.0f}ms)")
+    return result
+
+
+def log_task_errors(label: str):
+    """Done callback for a task nobody awaits: print its exception (cancellation is not an error)."""
+    def callback(task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"{label} failed: {error!r}")
+    return callback
+
+
+def shutdown_executor():
+    """Stop accepting work; running jobs finish in the background."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
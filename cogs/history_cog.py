@@ -1,20 +1,34 @@
 """HistoryCog: ゲームセッション記録・履歴コマンド"""
-import discord
 from discord.ext import commands
 import sqlite3
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timedelta
+from functools import partial
 
+from cogs import queries
+from cogs.events import GameEnded, GameStarted, apply_rollups
+from cogs.executor import run_blocking
+from cogs.match_cache import get_match_cache
+from cogs.presence import PresenceChange, get_presence
+from cogs.render_cache import get_render_cache
+from cogs.resync import GatewaySnapshot, get_resync
+from cogs.schema import apply_migrations, rebuild_rollups, to_epoch
+from cogs.storage import get_storage
 from cogs.ui_constants import LOG_CLEAN, LOG_GAME, LOG_OK, LOG_SAVE, LOG_STOP
 
 DB_PATH = 'data/game_history.db'
 
 
+def _since_day(days: int) -> str:
+    """First rollup day (inclusive) of a `days`-day window ending today."""
+    return (datetime.now() - timedelta(days=days)).date().isoformat()
+
+
 class HistoryCog(commands.Cog, name='History'):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.active_sessions: dict = {}
+        self.storage = get_storage()
         self._init_db()
 
     def _init_db(self):
@@ -25,202 +39,200 @@ class HistoryCog(commands.Cog, name='History'):
             start_time TEXT, end_time TEXT, duration INTEGER, details TEXT
         )''')
         conn.commit()
+        apply_migrations(conn)
         conn.close()
         print(f"{LOG_OK} HistoryCog: DBテーブル初期化完了")
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        now = datetime.now()
-        conn = sqlite3.connect(DB_PATH, timeout=10)
+    async def cog_load(self):
+        await self.storage.open()
+        get_presence().subscribe(self.bot, self._on_presence_change)
+        get_resync().subscribe(self.bot, initial=self._initial_sync, users=self._open_users)
+
+    async def _open_users(self) -> set[int]:
+        """Users with an open game_sessions row (fetched first when the member cache is lazy)."""
+        rows = await self.storage.run(lambda conn: conn.execute(
+            'SELECT DISTINCT user_id FROM game_sessions WHERE end_time IS NULL').fetchall())
+        return {int(uid) for (uid,) in rows}
+
+    async def _initial_sync(self, snapshot: GatewaySnapshot):
+        """Reconcile open game_sessions rows with the first gateway snapshot (ResyncEngine)."""
+        now = snapshot.at
+
+        # 1. 現在Discord上でプレイ中のゲーム
+        current_playing = {}
+        for uid, games in snapshot.playing.items():
+            for p in games:
+                current_playing[(str(uid), p.name)] = (snapshot.names.get(uid, str(uid)), p.details)
+
+        # DB照合の間に届いたプレゼンス更新が二重に開始しないよう、先に仮登録する
+        for (uid, game_name), (_, details) in current_playing.items():
+            self.active_sessions.setdefault(
+                (int(uid), game_name), {'start_time': now, 'details': details})
+
+        # 2〜4. DBとの照合は書き込みスレッドで行う
+        restored = await self.storage.run(
+            partial(self._reconcile_sessions, current_playing, now))
+        get_match_cache().invalidate()
+        get_render_cache().bump_all()
+        for (uid, game_name), session in restored.items():
+            key = (int(uid), game_name)
+            # 照合中にゲームを終了していれば復元しない
+            if key in self.active_sessions:
+                self.active_sessions[key] = session
+        print(f"{LOG_OK} HistoryCog: 起動時セッション処理完了")
+
+    def _reconcile_sessions(self, current_playing: dict, now: datetime, conn: sqlite3.Connection) -> dict:
+        """Match open DB rows against current presences (writer thread).
+
+        Returns {(user_id, game_name): session} for sessions restored from the DB.
+        """
         c = conn.cursor()
-        
-        # 1. DB上の未終了(NULL)セッションを読み込む
+
+        # 2. DB上の未終了(NULL)セッションを読み込む
         c.execute('''
             SELECT id, user_id, game_name, start_time, details 
             FROM game_sessions 
             WHERE end_time IS NULL
         ''')
-        null_sessions = c.fetchall()
         db_active = {}
-        for row in null_sessions:
+        for row in c.fetchall():
             db_active[(str(row[1]), row[2])] = {
                 'id': row[0],
                 'start_time': datetime.fromisoformat(row[3]),
                 'details': row[4]
             }
 
-        # 2. 現在Discord上でプレイ中のゲームを取得
-        current_playing = {}
-        for guild in self.bot.guilds:
-            for member in guild.members:
-                for activity in member.activities:
-                    if activity.type == discord.ActivityType.playing:
-                        current_playing[(str(member.id), activity.name)] = {
-                            'member': member,
-                            'activity': activity
-                        }
-
         # 3. 状態の照合
-        for key, data in current_playing.items():
-            member, activity = data['member'], data['activity']
+        restored, started = {}, 0
+        for key, (member_name, details) in current_playing.items():
             if key in db_active:
                 # 既にDBにNULLで存在するので継続
-                self.active_sessions[(member.id, activity.name)] = db_active[key]
-                print(f"{LOG_GAME} [復元] ゲームプレイ継続中: {member.name} - {activity.name}")
-                del db_active[key]
+                restored[key] = db_active.pop(key)
             else:
                 # 新規開始
-                details = getattr(activity, 'details', None)
-                c.execute('''
-                    INSERT INTO game_sessions
-                    (user_id, user_name, game_name, start_time, end_time, duration, details)
-                    VALUES (?, ?, ?, ?, NULL, 0, ?)
-                ''', (str(member.id), member.name, activity.name, now.isoformat(), details))
-                self.active_sessions[(member.id, activity.name)] = {
-                    'start_time': now,
-                    'id': c.lastrowid,
-                    'details': details
-                }
-                print(f"{LOG_GAME} [新規] ゲームプレイ開始: {member.name} - {activity.name}")
+                GameStarted(key[0], member_name, key[1], now, details).apply(conn)
+                started += 1
 
         # 4. DBにはNULLで残っているが、現在はもうプレイしていないセッションを閉じる
         for key, session_data in db_active.items():
             duration = int((now - session_data['start_time']).total_seconds())
             c.execute('''
                 UPDATE game_sessions
-                SET end_time=?, duration=?
+                SET end_time=?, duration=?, end_epoch=?
                 WHERE id=?
-            ''', (now.isoformat(), duration, session_data['id']))
-            print(f"{LOG_CLEAN} [クリーンアップ] オフライン中に終了: {key[0]} - {key[1]} ({duration}秒)")
-            
-        conn.commit()
-        conn.close()
-        print(f"{LOG_OK} HistoryCog: 起動時セッション処理完了")
+            ''', (now.isoformat(), duration, to_epoch(now), session_data['id']))
+            apply_rollups(conn, key[0], key[1], session_data['start_time'], duration)
+        print(f"{LOG_GAME} [起動時照合] 継続 {len(restored)}件 / 新規 {started}件")
+        if db_active:
+            print(f"{LOG_CLEAN} [クリーンアップ] オフライン中に終了: {len(db_active)}件")
+        return restored
 
     async def cog_unload(self):
+        get_presence().unsubscribe(self._on_presence_change)
+        get_resync().unsubscribe(initial=self._initial_sync, users=self._open_users)
         # 以前のように強制的にend_timeを書き込む処理は廃止。
         # DB上はNULLのまま残し、次回on_readyで復元またはクリーンアップする。
+        # キューに残った開始・終了の書き込みだけはコミットしてから終了する。
+        await self.storage.close()
         print(f"{LOG_STOP} HistoryCog: 終了（セッション状態はDBに保持）")
 
     # ── プレゼンス監視（ゲームセッション記録） ─────────
-    @commands.Cog.listener()
-    async def on_presence_update(self, before: discord.Member, after: discord.Member):
+    def _on_presence_change(self, change: PresenceChange):
+        """Record game starts/ends; called once per member transition by the presence dispatcher."""
         # ゲーム開始
-        if after.activities:
-            for activity in after.activities:
-                if activity.type == discord.ActivityType.playing:
-                    if (after.id, activity.name) in self.active_sessions:
-                        continue
-                    
-                    if (not before.activities or activity.name not in [a.name for a in before.activities]):
-                        now = datetime.now()
-                        details = getattr(activity, 'details', None)
-                        
-                        conn = sqlite3.connect(DB_PATH, timeout=10)
-                        c = conn.cursor()
-                        c.execute('''
-                            INSERT INTO game_sessions
-                            (user_id, user_name, game_name, start_time, end_time, duration, details)
-                            VALUES (?, ?, ?, ?, NULL, 0, ?)
-                        ''', (str(after.id), after.name, activity.name, now.isoformat(), details))
-                        conn.commit()
-                        
-                        self.active_sessions[(after.id, activity.name)] = {
-                            'start_time': now,
-                            'id': c.lastrowid,
-                            'details': details
-                        }
-                        conn.close()
-                        print(f"{LOG_GAME} ゲーム開始: {after.name} - {activity.name}")
+        for act in change.started:
+            key = (change.user_id, act.name)
+            if key in self.active_sessions:
+                continue
+            self.storage.submit(GameStarted(
+                str(change.user_id), change.user_name, act.name, change.at, act.details))
+            self.active_sessions[key] = {
+                'start_time': change.at,
+                'details': act.details
+            }
+            self.storage.notify(partial(get_render_cache().bump, change.user_id))
+            print(f"{LOG_GAME} ゲーム開始: {change.user_name} - {act.name}")
 
         # ゲーム終了
-        if before.activities:
-            for activity in before.activities:
-                if (activity.type == discord.ActivityType.playing and
-                        (not after.activities or activity.name not in [a.name for a in after.activities])):
-                    session = self.active_sessions.pop((before.id, activity.name), None)
-                    if not session:
-                        continue
-                    
-                    end_time = datetime.now()
-                    duration = int((end_time - session['start_time']).total_seconds())
-                    
-                    conn = sqlite3.connect(DB_PATH, timeout=10)
-                    conn.execute('''
-                        UPDATE game_sessions
-                        SET end_time=?, duration=?
-                        WHERE id=?
-                    ''', (end_time.isoformat(), duration, session['id']))
-                    conn.commit()
-                    conn.close()
-                    print(f"{LOG_SAVE} ゲーム終了: {before.name} - {activity.name} ({duration}秒)")
+        for act in change.stopped:
+            session = self.active_sessions.pop((change.user_id, act.name), None)
+            if not session:
+                continue
+            duration = int((change.at - session['start_time']).total_seconds())
+            self.storage.submit(GameEnded(
+                str(change.user_id), act.name, session['start_time'], change.at, duration))
+            # マッチング用・カレンダー画像のキャッシュはコミット後に無効化する
+            self.storage.notify(get_match_cache().invalidate)
+            self.storage.notify(partial(get_render_cache().bump, change.user_id))
+            print(f"{LOG_SAVE} ゲーム終了: {change.user_name} - {act.name} ({duration}秒)")
 
     # ── コマンド ──────────────────────────────────────
     @commands.command(name='history')
     async def show_history(self, ctx, days: int = 7):
         """サーバー全体のプレイ履歴を表示"""
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        df = pd.read_sql_query('''
-            SELECT user_name, game_name,
-                   COUNT(*) as session_count, SUM(duration) as total_duration
-            FROM game_sessions
-            WHERE datetime(start_time) > datetime('now', ?)
-            GROUP BY user_name, game_name ORDER BY total_duration DESC
-        ''', conn, params=(f'-{days} days',))
-        conn.close()
-        if df.empty:
+        rows, recorded = await run_blocking('!history', self._history_rows, days)
+        if not rows:
             await ctx.send(f"過去{days}日間のプレイ記録はありません。")
             return
+        # 表示名はボットのキャッシュを優先（ループ上で読む）、なければ記録済みの user_name
+        names = {}
+        for uid in recorded:
+            user = self.bot.get_user(int(uid))
+            names[uid] = user.name if user else (recorded[uid] or uid)
+        await ctx.send(self._history_text(days, rows, names))
+
+    def _history_rows(self, days: int):
+        """Rollup rows plus the latest recorded user_name of each user in them (worker pool)."""
+        rows = queries.history_totals(_since_day(days))
+        return rows, {uid: queries.latest_user_name(uid) for uid in {r.user_id for r in rows}}
+
+    def _history_text(self, days: int, rows, names: dict[str, str]) -> str:
         lines = [f"過去{days}日間のプレイ記録:\n```"]
-        for _, row in df.iterrows():
-            hours = row['total_duration'] / 3600
-            lines.append(f"{row['user_name']} - {row['game_name']}: {hours:.1f}h ({row['session_count']}回)")
+        for r in rows:
+            hours = r.total_seconds / 3600
+            lines.append(f"{names[r.user_id]} - {r.game_name}: {hours:.1f}h ({r.session_count}回)")
         lines.append("```")
-        await ctx.send('\n'.join(lines))
+        return '\n'.join(lines)
 
     @commands.command(name='top')
     async def show_top_games(self, ctx, days: int = 7):
         """サーバーで人気のゲームを表示"""
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        df = pd.read_sql_query('''
-            SELECT game_name, COUNT(DISTINCT user_id) as player_count,
-                   COUNT(*) as session_count, SUM(duration) as total_duration
-            FROM game_sessions WHERE datetime(start_time) > datetime('now', ?)
-            GROUP BY game_name ORDER BY player_count DESC, total_duration DESC LIMIT 10
-        ''', conn, params=(f'-{days} days',))
-        conn.close()
-        if df.empty:
-            await ctx.send(f"過去{days}日間のプレイ記録はありません。")
-            return
+        await ctx.send(await run_blocking('!top', self._top_games_text, days))
+
+    def _top_games_text(self, days: int) -> str:
+        rows = queries.popular_games(_since_day(days))
+        if not rows:
+            return f"過去{days}日間のプレイ記録はありません。"
         lines = [f"過去{days}日間の人気ゲーム:\n```"]
-        for _, row in df.iterrows():
-            hours = row['total_duration'] / 3600
-            lines.append(f"{row['game_name']}: {row['player_count']}人 / {hours:.1f}h")
+        for r in rows:
+            hours = r.total_seconds / 3600
+            lines.append(f"{r.game_name}: {r.player_count}人 / {hours:.1f}h")
         lines.append("```")
-        await ctx.send('\n'.join(lines))
+        return '\n'.join(lines)
 
     @commands.command(name='mygames')
     async def show_my_games(self, ctx, days: int = 7):
         """自分のプレイ統計を表示"""
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        df = pd.read_sql_query('''
-            SELECT game_name, COUNT(*) as session_count,
-                   SUM(duration) as total_duration, AVG(duration) as avg_duration
-            FROM game_sessions
-            WHERE user_id=? AND datetime(start_time) > datetime('now', ?)
-            GROUP BY game_name ORDER BY total_duration DESC
-        ''', conn, params=(str(ctx.author.id), f'-{days} days'))
-        conn.close()
-        if df.empty:
-            await ctx.send(f"過去{days}日間のプレイ記録はありません。")
-            return
+        await ctx.send(await run_blocking('!mygames', self._my_games_text, str(ctx.author.id), days))
+
+    def _my_games_text(self, user_id: str, days: int) -> str:
+        rows = queries.my_games(user_id, _since_day(days))
+        if not rows:
+            return f"過去{days}日間のプレイ記録はありません。"
         lines = [f"あなたの過去{days}日間:\n```"]
-        for _, row in df.iterrows():
-            h = row['total_duration'] / 3600
-            avg_m = row['avg_duration'] / 60
-            lines.append(f"{row['game_name']}: {h:.1f}h / 平均{avg_m:.0f}分 ({row['session_count']}回)")
+        for r in rows:
+            h = r.total_seconds / 3600
+            avg_m = r.avg_seconds / 60
+            lines.append(f"{r.game_name}: {h:.1f}h / 平均{avg_m:.0f}分 ({r.session_count}回)")
         lines.append("```")
-        await ctx.send('\n'.join(lines))
+        return '\n'.join(lines)
+
+    @commands.command(name='rebuild_stats')
+    @commands.is_owner()
+    async def rebuild_stats(self, ctx):
+        """[管理者用] 集計テーブルを game_sessions から再構築"""
+        rows = await self.storage.run(rebuild_rollups)
+        await ctx.send(f"集計テーブルを再構築しました（{rows}行）。")
 
     @commands.command(name='dummy_history')
     async def dummy_history(self, ctx):
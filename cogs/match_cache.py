@@ -0,0 +1,131 @@
+"""MatchCache: shared user x game / user x hour matrices for the matching commands.
+
+!similar, /discover and !recommend all score against the same matrices.
+Entries are keyed by (scope, days) and built off the event loop; concurrent
+requests for a key that is being built wait on the same build instead of
+starting their own. HistoryCog calls `invalidate()` once a closed session is
+committed, and entries older than `max_age` are rebuilt regardless, since
+the `days` window keeps sliding.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+from cogs.executor import get_executor
+from cogs.ui_constants import LOG_PERF
+
+if TYPE_CHECKING:
+    import numpy as np  # built by cogs.matching; not needed to import this module
+
+# Seconds an entry is served without any invalidation (window drift bound)
+MAX_AGE = 300.0
+# Distinct (scope, days) entries kept; each holds full user x game matrices
+MAX_ENTRIES = 4
+
+
+class MatchContext(NamedTuple):
+    user_ids: list[str]
+    all_games: list[str]
+    game_mat: 'np.ndarray'  # or scipy.sparse.csr_matrix on large windows
+    hour_mat: 'np.ndarray'
+    game_embs: 'np.ndarray'
+    has_emb: 'np.ndarray'
+    user_embs: 'np.ndarray'
+    norms: 'tuple[np.ndarray, np.ndarray, np.ndarray]'  # row norms of game_mat, hour_mat, user_embs
+    user_index: dict[str, int]
+    version: int
+    built_at: float
+
+
+def freeze(*arrays):
+    """Mark shared arrays read-only so no caller can modify a cached entry in place.
+
+    Sparse (CSR) matrices are frozen through their data / index arrays.
+    """
+    for arr in arrays:
+        parts = (arr.data, arr.indices, arr.indptr) if hasattr(arr, 'indptr') else (arr,)
+        for part in parts:
+            part.flags.writeable = False
+
+
+class MatchCache:
+    """(scope, days) -> MatchContext with single-flight builds and version invalidation.
+
+    Scope is None for now: game_sessions rows carry no guild, so every
+    server shares one global entry per window.
+    """
+
+    def __init__(self, max_age: float = MAX_AGE, max_entries: int = MAX_ENTRIES):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict[tuple, MatchContext] = OrderedDict()
+        self._building: dict[tuple, asyncio.Task] = {}
+
+    def invalidate(self):
+        """Make every cached entry stale (called after session writes commit)."""
+        self.version += 1
+
+    def _fresh(self, entry: MatchContext) -> bool:
+        return (entry.version == self.version
+                and time.monotonic() - entry.built_at < self.max_age)
+
+    async def get(self, days: int, build: Callable[[int], MatchContext],
+                  scope=None) -> MatchContext:
+        """Cached context for (scope, days); `build(version)` runs on the shared pool."""
+        key = (scope, days)
+        entry = self._entries.get(key)
+        if entry is not None and self._fresh(entry):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        task = self._building.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(self._build(key, build))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        # shield: one caller giving up must not cancel the build the others wait on
+        return await asyncio.shield(task)
+
+    async def _build(self, key: tuple, build) -> MatchContext:
+        started = time.perf_counter()
+        entry = await asyncio.get_running_loop().run_in_executor(
+            get_executor(), build, self.version)
+        print(f"{LOG_PERF} match cache build {key}: "
+              f"{(time.perf_counter() - started) * 1000:.0f}ms ({len(entry.user_ids)} users)")
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'entries': len(self._entries),
+            'building': len(self._building),
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+_cache: MatchCache | None = None
+
+
+def get_match_cache() -> MatchCache:
+    """Return the process-wide MatchCache shared by RecommenderCog and HistoryCog."""
+    global _cache
+    if _cache is None:
+        _cache = MatchCache()
+    return _cache
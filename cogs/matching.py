@@ -0,0 +1,348 @@
+"""Matching: the numeric side of !similar, /discover and !recommend.
+
+User x game / user x hour matrices, playtime-weighted taste vectors,
+cosine scoring and the hybrid recommendation scores, in numpy (scipy for
+large sparse windows). RecommenderCog imports this module on the worker
+pool the first time it warms up or scores, so loading the cog does not
+import numpy. Everything here runs off the event loop and returns plain
+ids and numbers.
+"""
+from array import array
+import sqlite3
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from cogs import queries
+from cogs.embedding_store import get_embedding_store
+from cogs.match_cache import MatchContext, freeze
+from cogs.schema import cutoff_epoch
+
+
+@lru_cache(maxsize=None)
+def _scipy_sparse():
+    """scipy.sparse, imported the first time a window is large enough to use it (None if missing)."""
+    try:
+        from scipy import sparse
+    except ImportError:
+        return None
+    return sparse
+
+
+# game_mat switches to CSR when it has at least this many cells and at most
+# this fraction of them are non-zero (members play a handful of titles each)
+SPARSE_MIN_CELLS = 1_000_000
+SPARSE_MAX_DENSITY = 0.05
+
+
+def _codes(values, index: dict) -> np.ndarray:
+    return np.fromiter(map(index.__getitem__, values), dtype=np.intp, count=len(values))
+
+
+def _use_sparse(shape: tuple[int, int], nnz: int) -> bool:
+    cells = shape[0] * shape[1]
+    return (cells >= SPARSE_MIN_CELLS and nnz <= cells * SPARSE_MAX_DENSITY
+            and _scipy_sparse() is not None)
+
+
+def _is_sparse(mat) -> bool:
+    # game_mat is either an ndarray or a CSR matrix built by _build_user_vectors
+    return not isinstance(mat, np.ndarray)
+
+
+def _dense_row(mat, i: int) -> np.ndarray:
+    return mat[i].toarray().ravel() if _is_sparse(mat) else mat[i]
+
+
+def _dense_column(mat, j: int) -> np.ndarray:
+    return mat[:, [j]].toarray().ravel() if _is_sparse(mat) else mat[:, j]
+
+
+def _played(mat, i: int) -> np.ndarray:
+    """Column indices (ascending) where row i is positive."""
+    if _is_sparse(mat):
+        lo, hi = mat.indptr[i], mat.indptr[i + 1]
+        return mat.indices[lo:hi][mat.data[lo:hi] > 0]
+    return np.flatnonzero(mat[i] > 0)
+
+
+def _row_norms(mat) -> np.ndarray:
+    if _is_sparse(mat):
+        return np.sqrt(np.asarray(mat.multiply(mat).sum(axis=1)).ravel())
+    return np.linalg.norm(mat, axis=1)
+
+
+def _sorted_codes(index: dict) -> tuple[list, np.ndarray]:
+    """Sorted keys of a first-seen {key: code} index, plus code -> sorted position."""
+    keys = sorted(index)
+    rank = np.empty(len(keys), dtype=np.intp)
+    rank[_codes(keys, index)] = np.arange(len(keys))
+    return keys, rank
+
+
+def _build_user_vectors(days: int, conn: sqlite3.Connection | None = None):
+    """User x game playtime and user x hour session-count matrices for the window.
+
+    One grouped query per matrix, streamed from the cursor: each row is
+    reduced to (user code, column code, value) in compact arrays, then
+    scattered into the matrices with np.add.at. Users and games are sorted.
+    game_mat is a scipy CSR matrix instead when the window is large and
+    sparse (see _use_sparse); the helpers below accept either.
+    """
+    since = cutoff_epoch(days)
+    user_idx: dict[str, int] = {}
+    game_idx: dict[str, int] = {}
+    rows, cols, values = array('q'), array('q'), array('d')
+    h_rows, h_cols, h_counts = array('q'), array('q'), array('d')
+    # Both scans in one read transaction: a user whose first session commits
+    # in between would otherwise be in the hour scan but not in user_idx
+    with queries.read_snapshot(conn) as snap:
+        for uid, game, seconds in queries.iter_user_game_seconds(since, snap):
+            rows.append(user_idx.setdefault(uid, len(user_idx)))
+            cols.append(game_idx.setdefault(game, len(game_idx)))
+            values.append(seconds or 0)
+        for uid, hour, count in queries.iter_user_hour_sessions(since, snap):
+            h_rows.append(user_idx[uid])
+            h_cols.append(hour)
+            h_counts.append(count)
+    if not values:
+        return [], [], np.zeros((0, 0), dtype=np.float64), np.zeros((0, 24), dtype=np.float64)
+
+    user_ids, user_rank = _sorted_codes(user_idx)
+    all_games, game_rank = _sorted_codes(game_idx)
+    rows = user_rank[np.frombuffer(rows, dtype=np.int64)]
+    cols = game_rank[np.frombuffer(cols, dtype=np.int64)]
+    values = np.frombuffer(values, dtype=np.float64)
+    shape = (len(user_ids), len(all_games))
+    if _use_sparse(shape, len(values)):
+        game_mat = _scipy_sparse().csr_matrix((values, (rows, cols)), shape=shape)
+        game_mat.sum_duplicates()
+    else:
+        game_mat = np.zeros(shape, dtype=np.float64)
+        np.add.at(game_mat, (rows, cols), values)
+
+    hour_mat = np.zeros((len(user_ids), 24), dtype=np.float64)
+    if h_counts:
+        np.add.at(hour_mat,
+                  (user_rank[np.frombuffer(h_rows, dtype=np.int64)],
+                   np.frombuffer(h_cols, dtype=np.int64)),
+                  np.frombuffer(h_counts, dtype=np.float64))
+
+    return user_ids, all_games, game_mat, hour_mat
+
+
+def _game_embedding_matrix(all_games):
+    """Embedding rows aligned to all_games, plus a mask of titles that have one.
+
+    Rows come from the shared EmbeddingStore, which maps the matrix on first use.
+    """
+    return get_embedding_store().game_matrix(all_games)
+
+
+def _build_user_embeddings(game_mat, game_embs, has_emb):
+    """Playtime-weighted average of game embeddings for every user (user preference vectors).
+
+    Weights are each user's playtime over titles that have an embedding,
+    normalized per row, so the whole batch is one (n x m) @ (m x d) product.
+    Users with no embedded titles get a zero vector.
+    """
+    if _is_sparse(game_mat):
+        weights = game_mat @ _scipy_sparse().diags(has_emb.astype(np.float64))
+        totals = np.asarray(weights.sum(axis=1)).ravel()
+    else:
+        weights = np.where(has_emb, game_mat, 0.0)
+        totals = weights.sum(axis=1)
+    totals[totals == 0] = 1.0
+    return np.asarray(weights @ game_embs) / totals[:, None]
+
+
+def build_match_context(days: int, version: int) -> MatchContext:
+    """Build the shared matrices for a `days` window (runs in an executor thread)."""
+    user_ids, all_games, game_mat, hour_mat = _build_user_vectors(days)
+    game_embs, has_emb = _game_embedding_matrix(all_games)
+    user_embs = _build_user_embeddings(game_mat, game_embs, has_emb)
+    # Row norms depend only on the matrices, so every request reuses them
+    norms = tuple(_row_norms(mat) for mat in (game_mat, hour_mat, user_embs))
+    freeze(game_mat, hour_mat, game_embs, has_emb, user_embs, *norms)
+    return MatchContext(
+        user_ids, all_games, game_mat, hour_mat, game_embs, has_emb, user_embs, norms,
+        {u: i for i, u in enumerate(user_ids)}, version, time.monotonic())
+
+
+def _l2_normalize_rows(mat) -> np.ndarray:
+    """Row-wise unit vectors; all-zero rows stay zero (cosine 0)."""
+    mat = np.asarray(mat, dtype=np.float64)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _similarity_vectors(me: int, game_mat, hour_mat, user_embs, norms=None):
+    """Cosine similarity of every user to `me` as (title, hour, taste) vectors of length n.
+
+    Each is one matrix-vector product with `me`'s row, divided by the row
+    norms, so no normalized copy of the matrix (dense or CSR) is built.
+    `norms` are the precomputed row norms (MatchContext.norms); computed
+    here when omitted.
+    """
+    if norms is None:
+        norms = tuple(_row_norms(mat) for mat in (game_mat, hour_mat, user_embs))
+    sims = []
+    for mat, norm in zip((game_mat, hour_mat, user_embs), norms):
+        dots = np.asarray(mat @ _dense_row(mat, me), dtype=np.float64)
+        denom = norm * norm[me]
+        sims.append(np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0))
+    return sims
+
+
+def _top_k(values: np.ndarray, candidates: np.ndarray, k: int | None) -> np.ndarray:
+    """Candidate indices with the k largest values, best first.
+
+    Ties are ordered by ascending index, which is what a stable descending
+    sort over the users list produced.
+    """
+    vals = values[candidates]
+    if k is not None and k < len(candidates):
+        kth = vals[np.argpartition(vals, len(vals) - k)[len(vals) - k]]
+        above = np.flatnonzero(vals > kth)
+        ties = np.flatnonzero(vals == kth)[:k - len(above)]
+        keep = np.concatenate([above, ties])
+        candidates, vals = candidates[keep], vals[keep]
+    return candidates[np.lexsort((candidates, -vals))]
+
+
+def _score_players(me: int, user_ids, all_games, game_mat, hour_mat, user_embs,
+                   k: int | None = None, exclude: np.ndarray | None = None, norms=None):
+    """Same scoring as !similar: title 30% + hour 20% + taste 50%.
+
+    All similarities come from matrix-vector products; only the top `k`
+    (optionally skipping users flagged in `exclude`) get common-game lists.
+    """
+    sg, sh, sc = _similarity_vectors(me, game_mat, hour_mat, user_embs, norms)
+    score = sg * 0.3 + sh * 0.2 + sc * 0.5
+
+    candidates = np.ones(len(user_ids), dtype=bool)
+    candidates[me] = False
+    if exclude is not None:
+        candidates &= ~exclude
+
+    me_played = _dense_row(game_mat, me) > 0
+    results = []
+    for i in _top_k(score, np.flatnonzero(candidates), k):
+        common = [all_games[j] for j in _played(game_mat, i) if me_played[j]]
+        results.append((user_ids[i], float(score[i]), float(sg[i]), float(sh[i]), float(sc[i]), common))
+    return results
+
+
+# Rows of game_mat per log1p block in the CF product (bounds the temporary to block x games)
+_CF_BLOCK_ROWS = 128
+
+
+def _recommend_scores(me: int, score, game_mat, user_embs, game_embs, has_emb,
+                      k: int | None = None):
+    """Hybrid scores for the titles `me` has not played: CF 50% + content 50%.
+
+    CF is the positive part of `score` (similarity to `me`) times log1p
+    playtime, as one weighted product over users (in row blocks); CB is
+    the cosine of each title embedding with `me`'s preference vector, as one
+    matrix-vector product. Returns [(game index, total, cf, cb)] best first
+    (top `k`), plus the best total; titles with no CF signal are dropped.
+    """
+    unplayed = np.flatnonzero(_dense_row(game_mat, me) == 0)
+    if len(unplayed) == 0:
+        return [], 0.0
+
+    weights = np.where(score > 0, score, 0.0)
+    weights[me] = 0.0
+    # log1p playtime so heavy users do not dominate CF
+    if _is_sparse(game_mat):
+        # log1p keeps zeros, so it only touches the stored entries
+        cf = game_mat.log1p().T @ weights
+    else:
+        # Contiguous row blocks are views, so only one block's log1p is
+        # materialized at a time
+        cf = np.zeros(game_mat.shape[1], dtype=np.float64)
+        for start in range(0, game_mat.shape[0], _CF_BLOCK_ROWS):
+            w = weights[start:start + _CF_BLOCK_ROWS]
+            if w.any():
+                cf += w @ np.log1p(game_mat[start:start + _CF_BLOCK_ROWS])
+    cf = cf[unplayed]
+
+    keep = cf > 0
+    unplayed, cf = unplayed[keep], cf[keep]
+    if len(unplayed) == 0:
+        return [], 0.0
+    cf /= cf.max()
+
+    cb = np.zeros(len(unplayed), dtype=np.float64)
+    embedded = has_emb[unplayed]
+    if embedded.any():
+        me_vec = _l2_normalize_rows(user_embs[me:me + 1])[0]
+        cb[embedded] = _l2_normalize_rows(game_embs[unplayed[embedded]]) @ me_vec
+
+    total = cf * 0.5 + np.maximum(cb, 0.0) * 0.5
+    ranked = _top_k(total, np.arange(len(unplayed)), k)
+    recs = [(int(unplayed[r]), float(total[r]), float(cf[r]), float(cb[r])) for r in ranked]
+    return recs, float(total[ranked[0]])
+
+
+def _players_of(j: int, by_similarity: np.ndarray, game_mat) -> np.ndarray:
+    """Users (from `by_similarity`, most similar first) who played game `j`."""
+    return by_similarity[_dense_column(game_mat, j)[by_similarity] > 0]
+
+
+def _user_mask(user_ids, members) -> np.ndarray:
+    """Boolean mask over user_ids marking the ids in `members`."""
+    members = set(members)
+    return np.fromiter((u in members for u in user_ids), dtype=bool, count=len(user_ids))
+
+
+def score_similar(match: MatchContext, me: int, k: int, known_seconds: int | None = None):
+    """Voice totals + top-k scoring for similar / discover.
+
+    Returns (results, voice_seconds); display entries are built on the
+    event loop. With `known_seconds`, users with at least that much
+    cumulative VC time with `me` are excluded (/discover).
+    """
+    user_ids = match.user_ids
+    voice_seconds = queries.voice_co_seconds(user_ids[me])
+
+    exclude = None
+    if known_seconds is not None:
+        exclude = _user_mask(user_ids, (
+            uid for uid, secs in voice_seconds.items() if secs >= known_seconds))
+
+    results = _score_players(
+        me, user_ids, match.all_games, match.game_mat, match.hour_mat,
+        match.user_embs, k=k, exclude=exclude, norms=match.norms)
+    return results, voice_seconds
+
+
+def recommend_fields(match: MatchContext, me: int, top_k: int):
+    """Score unplayed titles and list who plays them.
+
+    Returns [(title, pct, cf, cb, player ids most similar first)], or None
+    when `me` has played every recorded title. Names are resolved on the
+    event loop.
+    """
+    user_ids, all_games, game_mat = match.user_ids, match.all_games, match.game_mat
+    if not (_dense_row(game_mat, me) == 0).any():
+        return None
+
+    sg, sh, sc = _similarity_vectors(
+        me, game_mat, match.hour_mat, match.user_embs, match.norms)
+    score = sg * 0.3 + sh * 0.2 + sc * 0.5
+    final_rec, max_total = _recommend_scores(
+        me, score, game_mat, match.user_embs, match.game_embs, match.has_emb,
+        k=max(1, top_k))
+
+    others = np.flatnonzero(np.arange(len(user_ids)) != me)
+    by_similarity = others[np.lexsort((others, -score[others]))]
+
+    fields = []
+    for j, total, cf, cb in final_rec:
+        pct = int(total / max_total * 100) if max_total > 0 else 0
+        players = [user_ids[i] for i in _players_of(j, by_similarity, game_mat)]
+        fields.append((all_games[j], pct, cf, cb, players))
+    return fields
@@ -0,0 +1,157 @@
+"""Member cache: which guild members discord.py keeps, and fetching the active ones.
+
+BOT_MEMBER_CACHE selects the policy:
+
+- `all` (default): every member of every guild, chunked before on_ready.
+  Member objects dominate RSS on large guilds and on_ready waits for
+  every chunk.
+- `active`: no startup chunking. discord.py keeps members in voice, new
+  joiners and small guilds' members (sent in GUILD_CREATE); everyone else
+  is fetched by id through the gateway (at most 100 per request, per
+  guild) only when they matter: a raw presence update whose games differ
+  from what the presence dispatcher has cached for them, or, before the
+  ResyncEngine walks the cache on on_ready, members the cogs still have
+  open sessions / voice stays for. Fetched members are fed to the
+  dispatcher and stay cached, so their later updates arrive as normal
+  on_presence_update events.
+
+BOT_CHUNK_GUILDS=1 / 0 overrides startup chunking in either mode.
+Everything that scans members (the resync walk, !status) iterates
+`guild.members`, i.e. only what the policy cached.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Iterable
+
+import discord
+
+from cogs.presence import get_presence, snapshot_key
+from cogs.ui_constants import LOG_OK
+
+# Seconds to collect raw presences into one member request per guild
+FETCH_DELAY = 1.0
+# Discord's limit of user ids per Request Guild Members
+FETCH_BATCH = 100
+
+
+def cache_mode() -> str:
+    mode = os.environ.get('BOT_MEMBER_CACHE', 'all').strip().lower()
+    return mode if mode in ('all', 'active') else 'all'
+
+
+def _chunk_guilds(default: bool) -> bool:
+    value = os.environ.get('BOT_CHUNK_GUILDS')
+    if value is None or value.strip() == '':
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def client_options(intents: discord.Intents) -> dict:
+    """Keyword arguments for commands.Bot implementing the BOT_MEMBER_CACHE policy."""
+    if cache_mode() == 'all':
+        return {'member_cache_flags': discord.MemberCacheFlags.from_intents(intents),
+                'chunk_guilds_at_startup': _chunk_guilds(intents.members)}
+    flags = discord.MemberCacheFlags.none()
+    flags.voice = intents.voice_states
+    flags.joined = intents.members
+    return {'member_cache_flags': flags,
+            'chunk_guilds_at_startup': _chunk_guilds(False),
+            'enable_raw_presences': True}
+
+
+class MemberCache:
+    """Fetches uncached members on demand when BOT_MEMBER_CACHE=active."""
+
+    def __init__(self):
+        self.lazy = cache_mode() == 'active'
+        self._bot = None
+        self._pending: dict[int, set[int]] = {}  # guild_id -> user ids waiting for a request
+        self._flushing: dict[int, asyncio.Task] = {}
+        self.requests = 0
+        self.fetched = 0
+        self.raw_received = 0
+
+    def attach(self, bot):
+        if self._bot is None and self.lazy:
+            bot.add_listener(self.on_raw_presence_update, 'on_raw_presence_update')
+            self._bot = bot
+
+    def detach(self):
+        if self._bot is not None:
+            self._bot.remove_listener(self.on_raw_presence_update, 'on_raw_presence_update')
+            self._bot = None
+        for task in self._flushing.values():
+            task.cancel()
+        self._flushing.clear()
+        self._pending.clear()
+
+    async def on_raw_presence_update(self, payload: discord.RawPresenceUpdateEvent):
+        """Queue a fetch for an uncached member whose games changed (cached ones get on_presence_update)."""
+        self.raw_received += 1
+        guild = payload.guild
+        if guild is None or guild.get_member(payload.user_id) is not None:
+            return
+        if snapshot_key(payload) == get_presence().cached_key(payload.user_id):
+            return
+        self._pending.setdefault(guild.id, set()).add(payload.user_id)
+        if guild.id not in self._flushing:
+            self._flushing[guild.id] = asyncio.create_task(self._flush(guild))
+
+    async def _flush(self, guild: discord.Guild):
+        try:
+            await asyncio.sleep(FETCH_DELAY)
+            while self._pending.get(guild.id):
+                ids = self._pending.pop(guild.id)
+                members = await self.fetch(guild, ids)
+                # 取得した時点のプレゼンスとの差分を、ライブイベントと同じハンドラへ流す
+                dispatcher = get_presence()
+                now = datetime.now()
+                for member in members:
+                    change = dispatcher.diff(member, now)
+                    if change is not None:
+                        dispatcher.dispatch(change)
+        finally:
+            self._flushing.pop(guild.id, None)
+
+    async def fetch(self, guild: discord.Guild, user_ids: Iterable[int]) -> list[discord.Member]:
+        """Request `user_ids` with presences from `guild` and keep them cached."""
+        ids = sorted(set(user_ids))
+        members = []
+        for i in range(0, len(ids), FETCH_BATCH):
+            self.requests += 1
+            try:
+                members += await guild.query_members(
+                    user_ids=ids[i:i + FETCH_BATCH], presences=True, cache=True)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f"MemberCache: {guild.id} のメンバー取得に失敗 ({len(ids[i:i + FETCH_BATCH])}人): {e}")
+        self.fetched += len(members)
+        return members
+
+    async def prefetch(self, bot, user_ids: Iterable[int]) -> int:
+        """Fetch the uncached members among `user_ids` from every guild (before a resync walk)."""
+        user_ids = set(user_ids)
+        fetched = 0
+        for guild in bot.guilds:
+            missing = [uid for uid in user_ids if guild.get_member(uid) is None]
+            if missing:
+                fetched += len(await self.fetch(guild, missing))
+        if fetched:
+            print(f"{LOG_OK} MemberCache: 追跡中のメンバー {fetched}人を取得")
+        return fetched
+
+    def stats(self) -> dict:
+        return {'mode': cache_mode(), 'requests': self.requests, 'fetched': self.fetched,
+                'raw_received': self.raw_received,
+                'cached': sum(len(g.members) for g in self._bot.guilds) if self._bot else None}
+
+
+_cache: MemberCache | None = None
+
+
+def get_member_cache() -> MemberCache:
+    """Return the process-wide MemberCache used by ResyncEngine."""
+    global _cache
+    if _cache is None:
+        _cache = MemberCache()
+    return _cache
@@ -0,0 +1,223 @@
+"""Presence: one presence transition per member, shared by the collection cogs.
+
+discord.py dispatches on_presence_update once per guild the member shares
+with the bot, so a member in N of our guilds produces N identical events.
+Most of the rest are status flips, Spotify tracks or rich-presence
+details inside the same game. The dispatcher is the only
+on_presence_update listener: it reduces each event to a snapshot key (the
+set of playing (name, party id) pairs), compares it with the key cached
+for that member, and short-circuits on a match before any cog logic runs.
+Only a changed key builds a PresenceChange for the subscribed handlers
+(HistoryCog for game sessions, TrackerCog for parties).
+
+The cached key comes from the last processed event, or from `before` for
+a member not seen yet. A member's entry is dropped once they leave the
+last guild the bot can see them in (on_member_remove / on_guild_remove).
+"""
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+import discord
+
+# Seconds per window for the received / processed rates
+RATE_WINDOW = 60.0
+
+
+class Playing(NamedTuple):
+    name: str
+    details: str | None
+    party_id: str | None
+    party_size: tuple | None
+
+
+class PresenceChange(NamedTuple):
+    user_id: int
+    user_name: str
+    before: tuple[Playing, ...]
+    after: tuple[Playing, ...]
+    at: datetime
+
+    @property
+    def started(self) -> list[Playing]:
+        names = {p.name for p in self.before}
+        return [p for p in self.after if p.name not in names]
+
+    @property
+    def stopped(self) -> list[Playing]:
+        names = {p.name for p in self.after}
+        return [p for p in self.before if p.name not in names]
+
+    @property
+    def parties_joined(self) -> list[Playing]:
+        ids = {p.party_id for p in self.before}
+        return [p for p in self.after if p.party_id and p.party_id not in ids]
+
+    @property
+    def parties_left(self) -> list[Playing]:
+        ids = {p.party_id for p in self.after}
+        return [p for p in self.before if p.party_id and p.party_id not in ids]
+
+
+def playing(member: discord.Member) -> tuple[Playing, ...]:
+    """The member's playing activities as plain values."""
+    out = []
+    for act in member.activities:
+        if act.type != discord.ActivityType.playing:
+            continue
+        party = getattr(act, 'party', None) or {}
+        size = party.get('size')
+        out.append(Playing(act.name, getattr(act, 'details', None),
+                           party.get('id'), tuple(size) if size else None))
+    return tuple(out)
+
+
+def snapshot_key(member: discord.Member) -> frozenset:
+    """(name, party_id) of each playing activity: all that the collection cogs react to.
+
+    Status, Spotify and details/state changes leave this unchanged.
+    """
+    return frozenset(
+        (act.name, (getattr(act, 'party', None) or {}).get('id'))
+        for act in member.activities if act.type == discord.ActivityType.playing)
+
+
+class PresenceDispatcher:
+    """Fan-in of per-guild presence events, fan-out of per-member transitions."""
+
+    def __init__(self):
+        # user_id -> (snapshot_key, playing activities) as of the last processed event
+        self._last: dict[int, tuple[frozenset, tuple[Playing, ...]]] = {}
+        self._handlers: list[Callable[[PresenceChange], None]] = []
+        self._bot = None
+        self.received = 0
+        self.processed = 0
+        self._window_start = time.monotonic()
+        self._window_counts = (0, 0)
+        self.rates = (0.0, 0.0)  # (received/s, processed/s) over the last full window
+
+    def subscribe(self, bot, handler: Callable[[PresenceChange], None]):
+        """Register `handler(change)`; the first subscriber attaches the bot listeners."""
+        if self._bot is None:
+            bot.add_listener(self.on_presence_update, 'on_presence_update')
+            bot.add_listener(self.on_member_remove, 'on_member_remove')
+            bot.add_listener(self.on_guild_remove, 'on_guild_remove')
+            self._bot = bot
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def unsubscribe(self, handler):
+        if handler in self._handlers:
+            self._handlers.remove(handler)
+        if not self._handlers and self._bot is not None:
+            self._bot.remove_listener(self.on_presence_update, 'on_presence_update')
+            self._bot.remove_listener(self.on_member_remove, 'on_member_remove')
+            self._bot.remove_listener(self.on_guild_remove, 'on_guild_remove')
+            self._bot = None
+
+    async def on_presence_update(self, before: discord.Member, after: discord.Member):
+        change = self.feed(before, after)
+        if change is not None:
+            self.dispatch(change)
+
+    async def on_member_remove(self, member: discord.Member):
+        self._forget([member.id])
+
+    async def on_guild_remove(self, guild: discord.Guild):
+        self._forget([m.id for m in guild.members])
+
+    def _forget(self, user_ids):
+        """Drop the cached state of members no longer in any guild the bot has cached."""
+        # 他のギルドに残っているメンバーは重複イベントを捨てるために保持する
+        guilds = self._bot.guilds if self._bot is not None else ()
+        for uid in user_ids:
+            if uid in self._last and not any(g.get_member(uid) for g in guilds):
+                del self._last[uid]
+
+    def dispatch(self, change: PresenceChange):
+        for handler in list(self._handlers):
+            try:
+                handler(change)
+            except Exception as e:
+                # One cog failing must not stop the others from seeing the change
+                print(f"Presence handler {handler.__qualname__} failed: {e}")
+
+    def feed(self, before: discord.Member, after: discord.Member) -> PresenceChange | None:
+        """PresenceChange for the first event of a transition, None for duplicates."""
+        self.received += 1
+        self._tick()
+        key = snapshot_key(after)
+        last = self._last.get(after.id)
+        if last is None:
+            last = (snapshot_key(before), None)
+        if key == last[0]:
+            # ステータス・Spotify・details の変化や、他ギルドからの同じ通知
+            return None
+
+        self.processed += 1
+        prev_playing = last[1] if last[1] is not None else playing(before)
+        now_playing = playing(after)
+        # 遊んでいない状態も保持する（他ギルドからの同じ終了イベントを捨てるため）
+        self._last[after.id] = (key, now_playing)
+        return PresenceChange(after.id, after.name, prev_playing, now_playing, datetime.now())
+
+    def seed(self, member: discord.Member):
+        """Cache `member`'s current state without dispatching (first gateway sync).
+
+        Members already updated by a live event keep the newer state.
+        """
+        self._last.setdefault(member.id, (snapshot_key(member), playing(member)))
+
+    def cached_key(self, user_id: int) -> frozenset:
+        """Snapshot key last processed for `user_id` (empty if never seen)."""
+        last = self._last.get(user_id)
+        return last[0] if last is not None else frozenset()
+
+    def playing_now(self) -> dict[int, tuple[Playing, ...]]:
+        """{user_id: playing activities} for every cached member currently playing."""
+        return {uid: acts for uid, (_, acts) in self._last.items() if acts}
+
+    def diff(self, member: discord.Member, at: datetime) -> PresenceChange | None:
+        """Change from the cached state to `member`'s current one, for resync after a reconnect.
+
+        A member with no cached state counts as not playing. The cache is
+        updated; the caller dispatches the change.
+        """
+        key = snapshot_key(member)
+        last = self._last.get(member.id, (frozenset(), ()))
+        if key == last[0]:
+            return None
+        now_playing = playing(member)
+        self._last[member.id] = (key, now_playing)
+        return PresenceChange(member.id, member.name, last[1], now_playing, at)
+
+    def _tick(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= RATE_WINDOW:
+            received, processed = self._window_counts
+            self.rates = ((self.received - received) / elapsed,
+                          (self.processed - processed) / elapsed)
+            self._window_start = now
+            self._window_counts = (self.received, self.processed)
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'short_circuited': self.received - self.processed,
+            'received_per_s': self.rates[0],
+            'processed_per_s': self.rates[1],
+            'members': len(self._last),
+        }
+
+
+_dispatcher: PresenceDispatcher | None = None
+
+
+def get_presence() -> PresenceDispatcher:
+    """Return the process-wide PresenceDispatcher shared by HistoryCog and TrackerCog."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = PresenceDispatcher()
+    return _dispatcher
@@ -1,26 +1,27 @@
 """ProfileCog: ゲームプロフィール表示"""
 import discord
 from discord.ext import commands
-import sqlite3
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # GUIなし環境向け
-import matplotlib.pyplot as plt
 import io
 
+from cogs import queries
+from cogs.executor import run_blocking
+from cogs.profile_render import render_hours_chart
+from cogs.render import get_renderer
 from cogs.ui_constants import ICON_BULLET, ICON_FIELD
 
-DB_PATH = 'data/game_history.db'
-
 
 class ProfileCog(commands.Cog, name='Profile'):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.renderer = get_renderer()
+
+    async def cog_load(self):
+        self.renderer.start()
 
     async def build_profile_message(self, user_id: int, display_name: str) -> tuple[discord.Embed | None, discord.File | None]:
         """プロフィール embed と時間帯グラフ File を生成する（記録なしの場合は (None, None)）"""
-        profile = self._get_profile(user_id)
+        profile = await run_blocking('!profile (DB)', self._get_profile, user_id)
         if not profile:
             return None, None
 
@@ -35,24 +36,10 @@ class ProfileCog(commands.Cog, name='Profile'):
         embed.add_field(name=f"{ICON_FIELD}お気に入りゲーム", value=favs, inline=False)
 
         if profile['hours']:
-            fig, ax = plt.subplots(figsize=(10, 4))
-            hours  = [int(h[0]) for h in profile['hours']]
-            counts = [h[1] for h in profile['hours']]
-            ax.bar(hours, counts, color='#6464e8', alpha=0.8)
-            ax.set_title('Distribution of Playing Time')
-            ax.set_xlabel('Hour of Day')
-            ax.set_ylabel('Session Count')
-            ax.set_xticks(range(0, 24, 2))
-            ax.set_xlim(-0.5, 23.5)
-            ax.grid(True, alpha=0.3)
-            fig.tight_layout()
-
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png', dpi=150)
-            buf.seek(0)
-            plt.close(fig)
-
-            file = discord.File(buf, filename='profile.png')
+            hours  = [h.hour for h in profile['hours']]
+            counts = [h.session_count for h in profile['hours']]
+            chart = await self.renderer.render('!profile', render_hours_chart, hours, counts)
+            file = discord.File(io.BytesIO(chart), filename='profile.png')
             embed.set_image(url='attachment://profile.png')
             return embed, file
 
@@ -77,24 +64,11 @@ class ProfileCog(commands.Cog, name='Profile'):
             await ctx.send(embed=embed)
 
     def _get_profile(self, user_id: int):
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        favs = pd.read_sql_query('''
-            SELECT game_name, SUM(duration) as total
-            FROM game_sessions WHERE user_id=?
-            GROUP BY game_name ORDER BY total DESC LIMIT 5
-        ''', conn, params=(str(user_id),))
-        hours = pd.read_sql_query('''
-            SELECT strftime('%H', start_time) as hour, COUNT(*) as count
-            FROM game_sessions WHERE user_id=?
-            GROUP BY hour ORDER BY count DESC
-        ''', conn, params=(str(user_id),))
-        conn.close()
-        if favs.empty:
+        uid = str(user_id)
+        favorites = queries.favorite_games(uid)
+        if not favorites:
             return None
-        return {
-            'favorites': favs[['game_name', 'total']].values.tolist(),
-            'hours': hours[['hour', 'count']].values.tolist(),
-        }
+        return {'favorites': favorites, 'hours': queries.hour_counts(uid)}
 
     @commands.command(name='dummy_profile')
     async def dummy_profile(self, ctx):
@@ -111,23 +85,10 @@ class ProfileCog(commands.Cog, name='Profile'):
         )
         embed.add_field(name=f"{ICON_FIELD}お気に入りゲーム", value=favs, inline=False)
 
-        fig, ax = plt.subplots(figsize=(10, 4))
-        hours  = [18, 20, 22, 0, 2, 14, 16]
-        counts = [2, 15, 25, 18, 5, 4, 8]
-        ax.bar(hours, counts, color='#6464e8', alpha=0.8)
-        ax.set_title('Distribution of Playing Time')
-        ax.set_xlabel('Hour of Day')
-        ax.set_ylabel('Session Count')
-        ax.set_xticks(range(0, 24, 2))
-        ax.set_xlim(-0.5, 23.5)
-        ax.grid(True, alpha=0.3)
-        fig.tight_layout()
-
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=150)
-        buf.seek(0)
-        plt.close(fig)
-
-        file = discord.File(buf, filename='profile.png')
+        chart = await self.renderer.render(
+            '!dummy_profile', render_hours_chart,
+            [18, 20, 22, 0, 2, 14, 16], [2, 15, 25, 18, 5, 4, 8])
+
+        file = discord.File(io.BytesIO(chart), filename='profile.png')
         embed.set_image(url='attachment://profile.png')
         await ctx.send(file=file, embed=embed)
@@ -0,0 +1,88 @@
+"""ProfileRender: プロフィール用の時間帯グラフ描画
+
+discord に依存しないため、描画用のプロセスプール（cogs.render）のワーカーからも
+読み込める。カレンダーと同じ PIL の描画ヘルパー・フォント・配色で 24 本の棒グラフを
+描くので、matplotlib は読み込まない。PIL も描画時に読み込む。
+"""
+import io
+
+from cogs.calendar_render import THEME, draw_rounded_rect, load_fonts
+
+CHART = {
+    'width': 1500, 'height': 600,
+    'left': 110, 'right': 40, 'top': 90, 'bottom': 95,
+    'bar_ratio': 0.7, 'bar_radius': 6, 'max_ticks': 6,
+}
+BAR_COLOR = (100, 100, 232)
+
+
+def _tick_step(max_count: int, max_ticks: int) -> int:
+    """Smallest 1/2/5 x 10^n step that needs at most `max_ticks` gridlines."""
+    scale = 1
+    while True:
+        for m in (1, 2, 5):
+            step = m * scale
+            if max_count / step <= max_ticks:
+                return step
+        scale *= 10
+
+
+def _centered(draw, xy, text, fill, font):
+    x, y = xy
+    w = draw.textlength(text, font=font)
+    draw.text((x - w / 2, y), text, fill, font=font)
+
+
+def render_hours_chart(hours: list[int], counts: list[int]) -> bytes:
+    """時間帯別セッション数の棒グラフを PNG で返す"""
+    from PIL import Image, ImageDraw
+    C, T = CHART, THEME
+    per_hour = [0] * 24
+    for h, n in zip(hours, counts):
+        per_hour[int(h) % 24] += int(n)
+
+    img = Image.new('RGB', (C['width'], C['height']), T['bg'])
+    draw = ImageDraw.Draw(img)
+    title_f, normal_f, small_f, tiny_f = load_fonts()
+
+    x0, x1 = C['left'], C['width'] - C['right']
+    y0, y1 = C['top'], C['height'] - C['bottom']
+    draw_rounded_rect(draw, [x0, y0, x1, y1], radius=8, fill=T['panel'])
+    _centered(draw, (C['width'] / 2, 20), 'Distribution of Playing Time', T['text'], normal_f)
+
+    # y 軸: 目盛り線とラベル
+    step = _tick_step(max(max(per_hour), 1), C['max_ticks'])
+    top = max(step, -(-max(per_hour) // step) * step)
+    plot_h = y1 - y0 - 10
+    for tick in range(0, top + 1, step):
+        y = y1 - plot_h * tick / top
+        draw.line([(x0, y), (x1, y)], fill=T['grid'], width=2 if tick == 0 else 1)
+        label = str(tick)
+        draw.text((x0 - 12 - draw.textlength(label, font=tiny_f), y - 12), label,
+                  T['subtext'], font=tiny_f)
+
+    # 棒と x 軸ラベル（2 時間ごと）
+    slot_w = (x1 - x0) / 24
+    bar_w = slot_w * C['bar_ratio']
+    for hour, n in enumerate(per_hour):
+        cx = x0 + slot_w * (hour + 0.5)
+        if n:
+            bar_top = y1 - plot_h * n / top
+            draw_rounded_rect(draw, [int(cx - bar_w / 2), int(bar_top), int(cx + bar_w / 2), y1],
+                              radius=C['bar_radius'], fill=BAR_COLOR)
+            # 角丸の下半分を四角で埋めて、棒の根元を軸に揃える
+            draw.rectangle([int(cx - bar_w / 2), max(int(bar_top), y1 - C['bar_radius']),
+                            int(cx + bar_w / 2), y1], fill=BAR_COLOR)
+        if hour % 2 == 0:
+            _centered(draw, (cx, y1 + 10), f"{hour:02d}", T['subtext'], tiny_f)
+
+    _centered(draw, (C['width'] / 2, C['height'] - 45), 'Hour of Day', T['subtext'], small_f)
+    label_w = int(draw.textlength('Sessions', font=small_f))
+    label = Image.new('RGB', (label_w + 4, 34), T['bg'])
+    ImageDraw.Draw(label).text((2, 0), 'Sessions', T['subtext'], font=small_f)
+    rotated = label.rotate(90, expand=True)
+    img.paste(rotated, (12, int((y0 + y1 - rotated.height) / 2)))
+
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
@@ -0,0 +1,251 @@
+"""Queries: named read-only SQL for the command handlers.
+
+Every cog that reads game_sessions, its rollups or voice_pair_totals goes
+through here instead of opening its own connection per command. Each
+worker thread keeps one connection (sqlite3 connections belong to the
+thread that opened them), and the statements are module constants, so
+sqlite3's per-connection statement cache prepares each one once per
+thread. Small results come back as lists of NamedTuples; the scans behind
+the match matrices are generators of plain tuples that step the cursor
+instead of materializing the whole result.
+
+Functions take an optional `conn` (benchmarks, migrations); by default
+they use the calling thread's connection to DB_PATH. Writes stay on
+cogs.storage.
+"""
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from cogs.schema import local_hour_sql
+
+DB_PATH = 'data/game_history.db'
+
+_local = threading.local()
+
+
+def connection() -> sqlite3.Connection:
+    """The calling thread's read connection (opened on first use, kept for the thread's lifetime)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA query_only=ON')
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def read_snapshot(conn: sqlite3.Connection | None = None) -> Iterator[sqlite3.Connection]:
+    """One read transaction: every statement inside sees the same committed state.
+
+    For callers that combine several scans (the match matrices); a write
+    committed between two autocommit reads would otherwise show up in only
+    one of them. Joins the caller's transaction if one is already open.
+    """
+    conn = conn or connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    finally:
+        # read-only, so COMMIT just releases the snapshot
+        conn.execute('COMMIT')
+
+
+# ── row types ─────────────────────────────────────
+class UserGameTotal(NamedTuple):
+    user_id: str
+    game_name: str
+    session_count: int
+    total_seconds: int
+
+
+class PopularGame(NamedTuple):
+    game_name: str
+    player_count: int
+    session_count: int
+    total_seconds: int
+
+
+class MyGame(NamedTuple):
+    game_name: str
+    session_count: int
+    total_seconds: int
+    avg_seconds: float
+
+
+class FavoriteGame(NamedTuple):
+    game_name: str
+    total_seconds: int
+
+
+class HourCount(NamedTuple):
+    hour: int
+    session_count: int
+
+
+class CalendarSession(NamedTuple):
+    game_name: str
+    start_time: str
+    end_time: str | None
+    duration: int
+
+
+# ── statements ────────────────────────────────────
+# The rollups hold closed sessions only; open ones (end_time IS NULL) are added
+# back as one session each, with the duration recorded so far (0 until they close).
+# The server-wide reads fold the rollup to (user, game) first, so the union only
+# carries one row per pair plus the open sessions.
+_TOTALS_WITH_OPEN = '''(
+        SELECT user_id, game_name, SUM(session_count) AS session_count,
+               SUM(total_seconds) AS total_seconds
+        FROM daily_user_game_stats WHERE day >= ?1
+        GROUP BY user_id, game_name
+        UNION ALL
+        SELECT user_id, game_name, 1, COALESCE(duration, 0)
+        FROM game_sessions WHERE end_time IS NULL AND date(start_time) >= ?1
+    )'''
+_DAILY_WITH_OPEN = '''(
+        SELECT day, user_id, game_name, session_count, total_seconds
+        FROM daily_user_game_stats
+        UNION ALL
+        SELECT date(start_time), user_id, game_name, 1, COALESCE(duration, 0)
+        FROM game_sessions WHERE end_time IS NULL
+    )'''
+_HOURS_WITH_OPEN = '''(
+        SELECT user_id, hour, session_count FROM user_hour_stats
+        UNION ALL
+        SELECT user_id, CAST(strftime('%H', start_time) AS INTEGER), 1
+        FROM game_sessions WHERE end_time IS NULL
+    )'''
+HISTORY_TOTALS = f'''
+    SELECT user_id, game_name, SUM(session_count), SUM(total_seconds) AS total
+    FROM {_TOTALS_WITH_OPEN}
+    GROUP BY user_id, game_name ORDER BY total DESC
+'''
+POPULAR_GAMES = f'''
+    SELECT game_name, COUNT(DISTINCT user_id) AS players,
+           SUM(session_count), SUM(total_seconds) AS total
+    FROM {_TOTALS_WITH_OPEN}
+    GROUP BY game_name ORDER BY players DESC, total DESC LIMIT ?2
+'''
+MY_GAMES = f'''
+    SELECT game_name, SUM(session_count), SUM(total_seconds) AS total,
+           CAST(SUM(total_seconds) AS REAL) / SUM(session_count)
+    FROM {_DAILY_WITH_OPEN}
+    WHERE user_id=? AND day >= ?
+    GROUP BY game_name ORDER BY total DESC
+'''
+FAVORITE_GAMES = f'''
+    SELECT game_name, SUM(total_seconds) AS total
+    FROM {_DAILY_WITH_OPEN} WHERE user_id=?
+    GROUP BY game_name ORDER BY total DESC LIMIT ?
+'''
+HOUR_COUNTS = f'''
+    SELECT hour, SUM(session_count) AS sessions
+    FROM {_HOURS_WITH_OPEN} WHERE user_id=?
+    GROUP BY hour ORDER BY sessions DESC, hour
+'''
+LATEST_USER_NAME = '''
+    SELECT user_name FROM game_sessions
+    WHERE user_id=? ORDER BY start_epoch DESC LIMIT 1
+'''
+WEEK_SESSIONS = '''
+    SELECT game_name, start_time, end_time, duration
+    FROM game_sessions
+    WHERE user_id=?
+      AND start_epoch<=?
+      AND (end_time IS NULL OR end_epoch>=?)
+    ORDER BY start_epoch
+'''
+USER_GAME_SECONDS = '''
+    SELECT user_id, game_name, SUM(duration) FROM game_sessions
+    WHERE start_epoch > ?
+    GROUP BY user_id, game_name
+'''
+# {hour} is local_hour_sql(), fixed for the process, so the statement cache still hits
+USER_HOUR_SESSIONS = '''
+    SELECT user_id, {hour} AS h, COUNT(*)
+    FROM game_sessions
+    WHERE start_epoch > ?
+    GROUP BY user_id, h
+'''
+# Both halves are range reads: the primary key for user_lo, idx_voice_pair_totals_hi for user_hi
+VOICE_CO_SECONDS = '''
+    SELECT user_hi, total_seconds FROM voice_pair_totals WHERE user_lo = ?
+    UNION ALL
+    SELECT user_lo, total_seconds FROM voice_pair_totals WHERE user_hi = ?
+'''
+
+
+# ── command queries ───────────────────────────────
+def history_totals(since_day: str, conn: sqlite3.Connection | None = None) -> list[UserGameTotal]:
+    """(user, game) totals since `since_day` (daily rollup + open sessions), longest first (!history)."""
+    conn = conn or connection()
+    return [UserGameTotal._make(r) for r in conn.execute(HISTORY_TOTALS, (since_day,))]
+
+
+def popular_games(since_day: str, limit: int = 10,
+                  conn: sqlite3.Connection | None = None) -> list[PopularGame]:
+    """Games by distinct players, then total time (!top)."""
+    conn = conn or connection()
+    return [PopularGame._make(r) for r in conn.execute(POPULAR_GAMES, (since_day, limit))]
+
+
+def my_games(user_id: str, since_day: str, conn: sqlite3.Connection | None = None) -> list[MyGame]:
+    """One user's per-game totals and average session length (!mygames)."""
+    conn = conn or connection()
+    return [MyGame._make(r) for r in conn.execute(MY_GAMES, (user_id, since_day))]
+
+
+def favorite_games(user_id: str, limit: int = 5,
+                   conn: sqlite3.Connection | None = None) -> list[FavoriteGame]:
+    """One user's most-played games over all time (!profile)."""
+    conn = conn or connection()
+    return [FavoriteGame._make(r) for r in conn.execute(FAVORITE_GAMES, (user_id, limit))]
+
+
+def hour_counts(user_id: str, conn: sqlite3.Connection | None = None) -> list[HourCount]:
+    """Sessions started per local hour for one user (!profile chart)."""
+    conn = conn or connection()
+    return [HourCount._make(r) for r in conn.execute(HOUR_COUNTS, (user_id,))]
+
+
+def latest_user_name(user_id: str, conn: sqlite3.Connection | None = None) -> str | None:
+    """Most recently recorded user_name for a user, or None."""
+    conn = conn or connection()
+    row = conn.execute(LATEST_USER_NAME, (user_id,)).fetchone()
+    return row[0] if row and row[0] else None
+
+
+def week_sessions(user_id: str, start_epoch: int, end_epoch: int,
+                  conn: sqlite3.Connection | None = None) -> list[CalendarSession]:
+    """Sessions overlapping [start_epoch, end_epoch], including open ones (!calendar)."""
+    conn = conn or connection()
+    return [CalendarSession._make(r)
+            for r in conn.execute(WEEK_SESSIONS, (user_id, end_epoch, start_epoch))]
+
+
+def voice_co_seconds(user_id: str, conn: sqlite3.Connection | None = None) -> dict[str, int]:
+    """{other_user_id: cumulative voice seconds} for one user."""
+    conn = conn or connection()
+    return {other_id: total for other_id, total in conn.execute(VOICE_CO_SECONDS, (user_id, user_id))}
+
+
+# ── matrix scans (streamed) ───────────────────────
+def iter_user_game_seconds(since_epoch: int,
+                           conn: sqlite3.Connection | None = None) -> Iterator[tuple[str, str, int]]:
+    """(user_id, game_name, seconds) per pair for sessions started after `since_epoch`."""
+    conn = conn or connection()
+    yield from conn.execute(USER_GAME_SECONDS, (since_epoch,))
+
+
+def iter_user_hour_sessions(since_epoch: int,
+                            conn: sqlite3.Connection | None = None) -> Iterator[tuple[str, int, int]]:
+    """(user_id, local hour, session count) for sessions started after `since_epoch`."""
+    conn = conn or connection()
+    yield from conn.execute(USER_HOUR_SESSIONS.format(hour=local_hour_sql()), (since_epoch,))
@@ -1,129 +1,68 @@
 """RecommenderCog: cosine-similarity matching and game recommendation."""
+import asyncio
 import discord
 from discord import app_commands
 from discord.ext import commands
 import json
-import sqlite3
-import numpy as np
+from functools import lru_cache, partial
 import os
-import pickle
 
+from cogs import queries
+from cogs.embedding_store import get_embedding_store
+from cogs.executor import log_task_errors, run_blocking
+from cogs.match_cache import get_match_cache
+from cogs.member_cache import get_member_cache
 from cogs.ui_constants import ICON_FIELD, LOG_OK
 
-DB_PATH = 'data/game_history.db'
-
 # Cumulative VC time (seconds) at/above which a pair is treated as already known.
 KNOWN_VC_SECONDS = 100 * 60
 
-# Fallback avatar for dummy_* (Discord default embed avatar)
+# !similar / /discover score this many times `limit` when users the bot cannot
+# see are dropped (BOT_MEMBER_CACHE=all), so the list still fills up
+SIMILAR_HEADROOM = 4
+
+# Avatar for members outside the member cache and for dummy_* (Discord default embed avatar)
 _DEFAULT_AVATAR_URL = 'https://cdn.discordapp.com/embed/avatars/0.png'
 
 # Multiplayer title set (optional; host path may be absent inside Docker)
-_MULTIPLAYER_TITLES: set[str] = set()
-for _mp_path in (
+_MULTIPLAYER_PATHS = (
     'data/filtered_games_data_final.json',
     '/home/okayama/matching-bot/GameEmbeddingData/LOD-multiplay-game/filtered_games_data_final.json',
-):
-    if not os.path.exists(_mp_path):
-        continue
-    try:
-        with open(_mp_path, 'r', encoding='utf-8') as _f:
-            _games = json.load(_f)
-        for _g in _games:
-            cats = _g.get('categories') or []
-            if any('マルチプレイヤー' in c or 'Multi-player' in c or 'Multiplayer' in c
-                   for c in cats):
-                _MULTIPLAYER_TITLES.add(_g['title'])
-        print(f"{LOG_OK} Loaded {len(_MULTIPLAYER_TITLES)} multiplayer titles from {_mp_path}")
-        break
-    except Exception as e:
-        print(f"Failed to load multiplayer titles from {_mp_path}: {e}")
-
-# Embedding load
-GAME_EMBEDDINGS = {}
-if os.path.exists('data/game_embeddings.pkl'):
-    try:
-        with open('data/game_embeddings.pkl', 'rb') as f:
-            GAME_EMBEDDINGS = pickle.load(f)
-        if GAME_EMBEDDINGS:
-            emb_matrix = np.array(list(GAME_EMBEDDINGS.values()))
-            mean_vec = np.mean(emb_matrix, axis=0)
-            for gname, vec in GAME_EMBEDDINGS.items():
-                centered = vec - mean_vec
-                norm = np.linalg.norm(centered)
-                GAME_EMBEDDINGS[gname] = centered / norm if norm > 0 else centered
-        print(f"Loaded {len(GAME_EMBEDDINGS)} game embeddings (Applied Mean Centering).")
-    except Exception as e:
-        print(f"Failed to load game embeddings: {e}")
-
-
-def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    na, nb = np.linalg.norm(a), np.linalg.norm(b)
-    if na == 0 or nb == 0:
-        return 0.0
-    return float(np.dot(a, b) / (na * nb))
-
-
-def _build_user_vectors(cursor, days: int):
-    cursor.execute(
-        "SELECT DISTINCT game_name FROM game_sessions WHERE datetime(start_time) > datetime('now', ?)",
-        (f'-{days} days',))
-    all_games = sorted([r[0] for r in cursor.fetchall()])
-    game_idx = {g: i for i, g in enumerate(all_games)}
-
-    cursor.execute(
-        "SELECT DISTINCT user_id FROM game_sessions WHERE datetime(start_time) > datetime('now', ?)",
-        (f'-{days} days',))
-    user_ids = [r[0] for r in cursor.fetchall()]
-
-    n, m = len(user_ids), len(all_games)
-    game_mat = np.zeros((n, m), dtype=np.float64)
-    hour_mat = np.zeros((n, 24), dtype=np.float64)
-
-    for ui, uid in enumerate(user_ids):
-        cursor.execute('''
-            SELECT game_name, SUM(duration) FROM game_sessions
-            WHERE user_id=? AND datetime(start_time) > datetime('now', ?)
-            GROUP BY game_name
-        ''', (uid, f'-{days} days'))
-        for gname, total in cursor.fetchall():
-            if gname in game_idx:
-                game_mat[ui, game_idx[gname]] = total
-
-        cursor.execute('''
-            SELECT CAST(strftime('%H', start_time) AS INTEGER) as h, COUNT(*)
-            FROM game_sessions
-            WHERE user_id=? AND datetime(start_time) > datetime('now', ?)
-            GROUP BY h
-        ''', (uid, f'-{days} days'))
-        for hour, cnt in cursor.fetchall():
-            hour_mat[ui, hour] = cnt
-
-    return user_ids, all_games, game_mat, hour_mat
-
-
-def _build_user_embedding(user_game_vec, all_games):
-    """Weighted average of game embeddings by playtime (user preference vector)."""
-    if not GAME_EMBEDDINGS:
-        return np.zeros(384)
-
-    vecs = []
-    weights = []
-    for j, gname in enumerate(all_games):
-        w = user_game_vec[j]
-        if w > 0 and gname in GAME_EMBEDDINGS:
-            vecs.append(GAME_EMBEDDINGS[gname])
-            weights.append(w)
-
-    if not vecs:
-        return np.zeros(384)
-
-    vecs = np.array(vecs)
-    weights = np.array(weights)
-
-    weights = weights / weights.sum()
-    user_emb = np.average(vecs, axis=0, weights=weights)
-    return user_emb
+)
+
+
+@lru_cache(maxsize=None)
+def _multiplayer_titles() -> frozenset[str]:
+    """Titles tagged multiplayer, loaded on first use (or by the on_ready warm-up)."""
+    for path in _MULTIPLAYER_PATHS:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                games = json.load(f)
+            titles = frozenset(
+                g['title'] for g in games
+                if any('マルチプレイヤー' in c or 'Multi-player' in c or 'Multiplayer' in c
+                       for c in g.get('categories') or []))
+            print(f"{LOG_OK} Loaded {len(titles)} multiplayer titles from {path}")
+            return titles
+        except Exception as e:
+            print(f"Failed to load multiplayer titles from {path}: {e}")
+    return frozenset()
+
+
+@lru_cache(maxsize=None)
+def _matching():
+    """cogs.matching (numpy / scipy), imported by the warm-up or the first command that scores."""
+    from cogs import matching
+    return matching
+
+
+def _warm_up():
+    """Import the scoring module, load the multiplayer titles and map the embeddings ahead of the first command."""
+    _matching()
+    _multiplayer_titles()
+    get_embedding_store().index  # first access maps the matrix
 
 
 def _progress_bar(pct: int, length: int = 10) -> str:
@@ -161,57 +100,21 @@ def _invite_games(common: list[str]) -> list[str]:
     """Prefer multiplayer titles among common games; fall back to all common."""
     if not common:
         return []
-    if not _MULTIPLAYER_TITLES:
+    titles = _multiplayer_titles()
+    if not titles:
         return list(common)
-    mp = [g for g in common if g in _MULTIPLAYER_TITLES]
+    mp = [g for g in common if g in titles]
     return mp if mp else list(common)
 
 
-def _get_voice_co_seconds(cursor, user_id: str) -> dict[str, int]:
-    """Return {other_user_id: cumulative_voice_seconds} for one user.
-
-    Read-only SELECT against voice_co_sessions (no schema / write changes).
-    """
-    cursor.execute('''
-        SELECT user_id_b AS other_id, SUM(COALESCE(duration, 0)) AS total
-        FROM voice_co_sessions
-        WHERE user_id_a = ?
-        GROUP BY user_id_b
-        UNION ALL
-        SELECT user_id_a AS other_id, SUM(COALESCE(duration, 0)) AS total
-        FROM voice_co_sessions
-        WHERE user_id_b = ?
-        GROUP BY user_id_a
-    ''', (user_id, user_id))
-    totals: dict[str, int] = {}
-    for other_id, total in cursor.fetchall():
-        totals[other_id] = totals.get(other_id, 0) + int(total or 0)
-    return totals
-
-
-def _score_players(me: int, user_ids, all_games, game_mat, hour_mat, user_embs):
-    """Same scoring as !similar: title 30% + hour 20% + taste 50%."""
-    results = []
-    me_uid = user_ids[me]
-    for i, uid in enumerate(user_ids):
-        if uid == me_uid:
-            continue
-        sg = _cosine_similarity(game_mat[me], game_mat[i])
-        sh = _cosine_similarity(hour_mat[me], hour_mat[i])
-        sc = _cosine_similarity(user_embs[me], user_embs[i])
-        score = sg * 0.3 + sh * 0.2 + sc * 0.5
-        common = [
-            all_games[j] for j in range(len(all_games))
-            if game_mat[me, j] > 0 and game_mat[i, j] > 0
-        ]
-        results.append((uid, score, sg, sh, sc, common))
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results
+def _recorded_names(user_ids) -> dict[str, str | None]:
+    """Latest recorded user_name of each id (runs on the worker pool)."""
+    return {uid: queries.latest_user_name(uid) for uid in user_ids}
 
 
 def build_similar_entries(
     results,
-    bot,
+    users: dict[str, tuple[str, str]],
     limit: int = 5,
     voice_seconds: dict[str, int] | None = None,
     *,
@@ -220,24 +123,27 @@ def build_similar_entries(
 ) -> list[dict]:
     """Build display entries from scored results (shared by similar / discover).
 
+    `users` maps each result's user id to (display name, avatar url), as
+    returned by RecommenderCog._resolve_users; results missing from it are
+    skipped.
     Each entry: user_id, display_name, pct, sg, sh, sc, common, avatar_url,
                 optional badge / invite
     """
     voice_seconds = voice_seconds or {}
     entries = []
     for uid, score, sg, sh, sc, common in results:
-        user = bot.get_user(int(uid))
-        if not user:
+        if uid not in users:
             continue
+        display_name, avatar_url = users[uid]
         entry = {
             'user_id': int(uid),
-            'display_name': user.display_name,
+            'display_name': display_name,
             'pct': int(score * 100),
             'sg': int(sg * 100),
             'sh': int(sh * 100),
             'sc': int(sc * 100),
             'common': _format_games(common),
-            'avatar_url': user.display_avatar.url,
+            'avatar_url': avatar_url,
         }
         secs = voice_seconds.get(str(uid), 0)
         if include_voice_badge and secs > 0:
@@ -443,11 +349,16 @@ class RecommenderCog(commands.Cog, name='Recommender'):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.match_cache = get_match_cache()
         self._app_commands_synced = False
+        self._warm_up_task: asyncio.Task | None = None
 
     @commands.Cog.listener()
     async def on_ready(self):
-        """Sync slash commands once (e.g. /discover) without editing main.py."""
+        """Start the data warm-up and sync slash commands once (e.g. /discover) without editing main.py."""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(run_blocking('recommender warm-up', _warm_up))
+            self._warm_up_task.add_done_callback(log_task_errors('Recommender warm-up'))
         if self._app_commands_synced:
             return
         try:
@@ -457,49 +368,63 @@ class RecommenderCog(commands.Cog, name='Recommender'):
         except Exception as e:
             print(f"App command sync failed: {e}")
 
-    def _load_match_context(self, user_id: str, days: int):
-        """Load vectors + voice totals for similar / discover.
+    async def _load_match_context(self, user_id: str, days: int):
+        """Shared matrices for similar / discover / recommend (from the match cache).
 
-        Returns (user_ids, all_games, game_mat, hour_mat, user_embs, me, voice_seconds)
-        or None if the requester has no play history.
+        Returns (MatchContext, me) or None if the requester has no play history.
         """
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        cur = conn.cursor()
-        user_ids, all_games, game_mat, hour_mat = _build_user_vectors(cur, days)
-        voice_seconds = _get_voice_co_seconds(cur, user_id)
-        conn.close()
-
-        if user_id not in user_ids:
-            return None
-
-        me = user_ids.index(user_id)
-        user_embs = [
-            _build_user_embedding(game_mat[i], all_games)
-            for i in range(len(user_ids))
-        ]
-        return user_ids, all_games, game_mat, hour_mat, user_embs, me, voice_seconds
+        ctx = await self.match_cache.get(days, partial(_matching().build_match_context, days))
+        me = ctx.user_index.get(user_id)
+        return None if me is None else (ctx, me)
+
+    async def _resolve_users(self, label: str, guild: discord.Guild | None,
+                             user_ids) -> dict[str, tuple[str, str]]:
+        """{user_id: (display name, avatar url)} for the given ids (event loop).
+
+        Guild member first, then the bot's user cache. Ids in neither are
+        left out (users who left every guild), except with
+        BOT_MEMBER_CACHE=active, where most members are in neither: there
+        the latest recorded user_name with the default avatar stands in,
+        and only those ids are read from the DB, on the worker pool.
+        """
+        users, missing = {}, []
+        for uid in user_ids:
+            user = (guild.get_member(int(uid)) if guild else None) or self.bot.get_user(int(uid))
+            if user:
+                users[uid] = (user.display_name, user.display_avatar.url)
+            else:
+                missing.append(uid)
+        if missing and get_member_cache().lazy:
+            recorded = await run_blocking(f'{label} (names)', _recorded_names, missing)
+            for uid in missing:
+                users[uid] = (recorded[uid] or uid, _DEFAULT_AVATAR_URL)
+        return users
+
+    async def _similar_entries(self, label: str, guild: discord.Guild | None, match, me: int, *,
+                               limit: int = 5, skip_known: bool = False, **entry_options):
+        """Score the top candidates on the worker pool, then build display entries on the event loop."""
+        k = limit if get_member_cache().lazy else limit * SIMILAR_HEADROOM
+        results, voice_seconds = await run_blocking(
+            label, _matching().score_similar, match, me, k,
+            KNOWN_VC_SECONDS if skip_known else None)
+        users = await self._resolve_users(label, guild, [r[0] for r in results])
+        return build_similar_entries(
+            results, users, limit=limit, voice_seconds=voice_seconds, **entry_options)
 
     @commands.command(name='similar')
     async def find_similar_players(self, ctx, days: int = 30):
         """Show server members with similar play style (cosine similarity)."""
         try:
-            ctx_data = self._load_match_context(str(ctx.author.id), days)
-            if ctx_data is None:
+            loaded = await self._load_match_context(str(ctx.author.id), days)
+            if loaded is None:
                 await ctx.send(embed=discord.Embed(
                     title="プレイ記録なし",
                     description=f"過去{days}日間のプレイ記録が見つかりませんでした。",
                     color=discord.Color.orange()))
                 return
 
-            user_ids, all_games, game_mat, hour_mat, user_embs, me, voice_seconds = (
-                ctx_data)
-            results = _score_players(
-                me, user_ids, all_games, game_mat, hour_mat, user_embs)
-            entries = build_similar_entries(
-                results, self.bot,
-                voice_seconds=voice_seconds,
-                include_voice_badge=True,
-            )
+            entries = await self._similar_entries(
+                '!similar', ctx.guild, *loaded, include_voice_badge=True)
 
             if not entries:
                 await ctx.send("類似したプレイヤーが見つかりませんでした。")
@@ -529,28 +454,18 @@ class RecommenderCog(commands.Cog, name='Recommender'):
         """Recommend similar players excluding known voice partners."""
         await interaction.response.defer()
         try:
-            ctx_data = self._load_match_context(str(interaction.user.id), days)
-            if ctx_data is None:
+            loaded = await self._load_match_context(str(interaction.user.id), days)
+            if loaded is None:
                 await interaction.followup.send(embed=discord.Embed(
                     title="プレイ記録なし",
                     description=f"過去{days}日間のプレイ記録が見つかりませんでした。",
                     color=discord.Color.orange()))
                 return
 
-            user_ids, all_games, game_mat, hour_mat, user_embs, me, voice_seconds = (
-                ctx_data)
-            results = _score_players(
-                me, user_ids, all_games, game_mat, hour_mat, user_embs)
             # Exclude pairs with cumulative VC time >= threshold (known contacts)
-            results = [
-                r for r in results
-                if voice_seconds.get(str(r[0]), 0) < KNOWN_VC_SECONDS
-            ]
-            entries = build_similar_entries(
-                results, self.bot,
-                voice_seconds=voice_seconds,
-                include_invite_games=True,
-            )
+            entries = await self._similar_entries(
+                '/discover', interaction.guild, *loaded,
+                skip_known=True, include_invite_games=True)
 
             if not entries:
                 await interaction.followup.send(
@@ -582,74 +497,34 @@ class RecommenderCog(commands.Cog, name='Recommender'):
             print(f"Error in /discover: {e}")
             await interaction.followup.send(f"エラーが発生しました: {e}")
 
+    @staticmethod
+    def _player_names(player_ids, users: dict[str, tuple[str, str]]) -> str:
+        """First three players (most similar first) plus how many more."""
+        names = ', '.join(users[uid][0] for uid in player_ids[:3])
+        if len(player_ids) > 3:
+            names += f' 他{len(player_ids)-3}人'
+        return names
+
     @commands.command(name='recommend')
     async def recommend_games(self, ctx, days: int = 30, top_k: int = 5):
         """Recommend games via hybrid collaborative + content filtering."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            user_ids, all_games, game_mat, hour_mat = _build_user_vectors(
-                conn.cursor(), days)
-            conn.close()
-
-            if str(ctx.author.id) not in user_ids:
+            loaded = await self._load_match_context(str(ctx.author.id), days)
+            if loaded is None:
                 await ctx.send(embed=discord.Embed(
                     title="プレイ記録なし",
                     description=f"過去{days}日間のプレイ記録が見つかりませんでした。",
                     color=discord.Color.orange()))
                 return
 
-            me = user_ids.index(str(ctx.author.id))
-            unplayed = [j for j, v in enumerate(game_mat[me]) if v == 0]
-            if not unplayed:
+            fields = await run_blocking('!recommend', _matching().recommend_fields, *loaded, top_k)
+            if fields is None:
                 await ctx.send("このサーバーで記録されているゲームはすべてプレイ済みです！")
                 return
-
-            user_embs = [
-                _build_user_embedding(game_mat[i], all_games)
-                for i in range(len(user_ids))
-            ]
-
-            sim_scores = {}
-            for i, uid in enumerate(user_ids):
-                if uid == str(ctx.author.id):
-                    continue
-                sg = _cosine_similarity(game_mat[me], game_mat[i])
-                sh = _cosine_similarity(hour_mat[me], hour_mat[i])
-                sc = _cosine_similarity(user_embs[me], user_embs[i])
-                sim_scores[i] = sg * 0.3 + sh * 0.2 + sc * 0.5
-
-            rec_cf = {}
-            for j in unplayed:
-                # log1p playtime so heavy users do not dominate CF
-                s = sum(
-                    sim * np.log1p(game_mat[i, j])
-                    for i, sim in sim_scores.items() if sim > 0
-                )
-                if s > 0:
-                    rec_cf[j] = s
-
-            if not rec_cf:
+            if not fields:
                 await ctx.send("推薦できるゲームが見つかりませんでした。")
                 return
 
-            max_cf = max(rec_cf.values()) if rec_cf else 1
-
-            final_rec = []
-            for j, cf_raw in rec_cf.items():
-                cf_score = cf_raw / max_cf
-
-                game_name = all_games[j]
-                cb_score = 0.0
-                if game_name in GAME_EMBEDDINGS:
-                    cb_score = _cosine_similarity(
-                        user_embs[me], GAME_EMBEDDINGS[game_name])
-
-                total_score = cf_score * 0.5 + max(0, cb_score) * 0.5
-                final_rec.append((j, total_score, cf_score, cb_score))
-
-            final_rec.sort(key=lambda x: x[1], reverse=True)
-            max_total = final_rec[0][1] if final_rec else 1
-
             embed = discord.Embed(
                 title="おすすめのゲーム",
                 description=(
@@ -658,22 +533,18 @@ class RecommenderCog(commands.Cog, name='Recommender'):
                 ),
                 color=discord.Color.green())
 
-            for j, total, cf, cb in final_rec[:top_k]:
-                pct = int(total / max_total * 100) if max_total > 0 else 0
-
-                players = [
-                    (self.bot.get_user(int(user_ids[i])), sim_scores[i])
-                    for i in sim_scores if game_mat[i, j] > 0
-                ]
-                players = [p for p in players if p[0]]
-                players.sort(key=lambda x: x[1], reverse=True)
-
-                names = ', '.join(p[0].display_name for p in players[:3])
-                if len(players) > 3:
-                    names += f' 他{len(players)-3}人'
-
+            # Only the three shown need a name when nobody is dropped (lazy cache);
+            # otherwise every player is resolved so 他N人 counts visible users only
+            lazy = get_member_cache().lazy
+            users = await self._resolve_users(
+                '!recommend', ctx.guild,
+                {uid for *_, ids in fields for uid in (ids[:3] if lazy else ids)})
+            for title, pct, cf, cb, player_ids in fields:
+                if not lazy:
+                    player_ids = [uid for uid in player_ids if uid in users]
+                names = self._player_names(player_ids, users)
                 embed.add_field(
-                    name=f"{ICON_FIELD}{all_games[j]}",
+                    name=f"{ICON_FIELD}{title}",
                     value=(
                         f"{_progress_bar(pct)} **{pct}%**\n"
                         f"流行度(CF): {int(cf*100)}% / ジャンル(CB): {int(max(0, cb)*100)}%\n"
@@ -688,6 +559,18 @@ class RecommenderCog(commands.Cog, name='Recommender'):
             print(f"Error in !recommend: {e}")
             await ctx.send(f"エラーが発生しました: {e}")
 
+    @commands.command(name='cachestats')
+    async def cache_stats(self, ctx):
+        """マッチング用キャッシュの状態を確認"""
+        st = self.match_cache.stats()
+        lines = ["マッチングキャッシュ:\n```",
+                 f"エントリ: {st['entries']} (構築中 {st['building']})",
+                 f"バージョン: {st['version']}",
+                 f"ヒット: {st['hits']} / 合流: {st['coalesced']} / ミス: {st['misses']}",
+                 f"ヒット率: {st['hit_rate']:.0%}",
+                 "```"]
+        await ctx.send('\n'.join(lines))
+
     @commands.command(name='dummy_similar')
     async def dummy_similar(self, ctx):
         """[Dummy] similar UI via Components V2 (no DB / no profile Select)."""
@@ -0,0 +1,119 @@
+"""Renderer: process pool for CPU-bound image rendering.
+
+PIL drawing and PNG encoding hold the GIL, so moving them to
+threads still lets one render stall the event loop and makes concurrent
+renders share one core. Jobs here are module-level functions from the
+discord-free render modules (cogs.calendar_render, cogs.profile_render)
+that take plain tuples and return PNG bytes, so they can run in worker
+processes.
+
+Workers are started with 'spawn' (no forked copy of the bot or its
+sockets) and warmed up at startup: PIL and the fonts are loaded and both
+renderers exercised once, so the first !calendar / !profile does not pay for it.
+At most `max_pending` jobs are handed to the pool at once; later ones wait.
+With BOT_RENDER_WORKERS=0, or when the pool cannot start or breaks, jobs
+render in-process on the shared thread pool instead.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cogs.executor import run_blocking
+from cogs.ui_constants import LOG_OK, LOG_PERF, LOG_STOP
+
+
+def _worker_count() -> int:
+    try:
+        return max(0, int(os.environ['BOT_RENDER_WORKERS']))
+    except (KeyError, ValueError):
+        return min(4, os.cpu_count() or 1)
+
+
+def _warm_worker():
+    """Pool initializer: import and exercise the renderers once per worker process."""
+    from datetime import datetime
+    from cogs import calendar_render, profile_render
+    calendar_render.load_fonts()
+    profile_render.render_hours_chart([0], [1])
+    now = datetime.now()
+    calendar_render.render_png([], now, now)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class Renderer:
+    """Process pool + pending-job bound, with an in-process fallback."""
+
+    def __init__(self, workers: int | None = None, max_pending: int | None = None):
+        self.workers = _worker_count() if workers is None else workers
+        self.max_pending = max_pending or max(1, self.workers * 2)
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self.fallbacks = 0
+
+    def start(self):
+        """Start and warm the workers (idempotent; call from cog_load)."""
+        if self._pool is not None or self.workers == 0:
+            return
+        try:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_worker)
+            # Workers are spawned on demand; one job per worker brings them all up now
+            for _ in range(self.workers):
+                self._pool.submit(_ping)
+        except Exception as e:
+            print(f"Renderer: process pool unavailable, rendering in-process: {e}")
+            self._pool = None
+            return
+        print(f"{LOG_OK} Renderer: {self.workers} render worker(s) starting")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            print(f"{LOG_STOP} Renderer: render workers stopped")
+
+    async def render(self, label: str, fn, *args) -> bytes:
+        """Run `fn(*args)` in a render worker and return its PNG bytes."""
+        if self._pool is None:
+            self.fallbacks += 1
+            return await run_blocking(label, fn, *args)
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        queued_at = time.perf_counter()
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+            except BrokenProcessPool as e:
+                print(f"Renderer: worker died ({e}), rendering in-process from now on")
+                self.shutdown()
+                self.fallbacks += 1
+                return await run_blocking(label, fn, *args)
+        print(f"{LOG_PERF} {label}: {(time.perf_counter() - started) * 1000:.0f}ms "
+              f"(queued {(started - queued_at) * 1000:.0f}ms, render pool)")
+        return result
+
+
+_renderer: Renderer | None = None
+
+
+def get_renderer() -> Renderer:
+    """Return the process-wide Renderer shared by CalendarCog and ProfileCog."""
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+    return _renderer
+
+
+def shutdown_renderer():
+    if _renderer is not None:
+        _renderer.shutdown()
@@ -0,0 +1,217 @@
+"""RenderCache: PNG cache for !calendar / !d_calendar.
+
+Two kinds of entries:
+
+- Past weeks are content-addressed: the key is a hash of
+  (user_id, week_start, session rows, renderer version / font / layout),
+  so an entry can never be stale and is kept both in memory and on disk
+  under data/render_cache/ (it survives restarts). A week that still contains an
+  open session is drawn up to "now" and is not cached.
+- The current week is keyed by (user_id, week_start, per-user version).
+  HistoryCog bumps a user's version once a session start / end for that
+  user is committed (and every version after the startup reconciliation),
+  so a hit can skip the DB query too. These entries are memory-only, as the
+  versions restart from zero with the process.
+
+Both tiers evict least-recently-used entries once their byte budget is
+exceeded. Methods are thread-safe; disk access should run off the event
+loop (see CalendarCog).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from cogs import calendar_render
+
+CACHE_DIR = 'data/render_cache'
+# Byte budgets per tier (a calendar PNG is roughly 50–150 KB)
+MEMORY_BYTES = 32 * 1024 * 1024
+DISK_BYTES = 256 * 1024 * 1024
+
+# Anything that changes the picture without changing the rows goes into the hash:
+# the drawing code (RENDER_VERSION), the font found on this host, layout and colours
+_RENDER_SALT = repr((calendar_render.RENDER_VERSION,
+                     calendar_render.font_path(),
+                     sorted(calendar_render.LAYOUT.items()),
+                     sorted(calendar_render.THEME.items()))).encode()
+
+
+def is_cacheable(sessions) -> bool:
+    """False while a session is still open (it is drawn up to the current time)."""
+    return all(row[2] is not None for row in sessions)
+
+
+class RenderCache:
+    """Memory LRU over a size-bounded disk tier, plus per-user versions for the current week."""
+
+    def __init__(self, directory: str = CACHE_DIR,
+                 memory_bytes: int = MEMORY_BYTES, disk_bytes: int = DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_used = 0
+        self._disk: OrderedDict[str, int] | None = None  # file name -> size, scanned on first use
+        self._disk_used = 0
+        self._versions: dict[str, int] = {}
+        self._generation = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ── keys ──────────────────────────────────────────
+    def bump(self, user_id):
+        """Invalidate the user's current-week entries (called after their session writes commit)."""
+        uid = str(user_id)
+        with self._lock:
+            self._versions[uid] = self._versions.get(uid, 0) + 1
+
+    def bump_all(self):
+        """Invalidate every current-week entry (after bulk changes such as the startup reconciliation)."""
+        with self._lock:
+            self._generation += 1
+
+    def current_key(self, user_id, week_start: datetime) -> str:
+        """Key for the week that is still being recorded; take it *before* querying the rows."""
+        uid = str(user_id)
+        with self._lock:
+            version = (self._generation, self._versions.get(uid, 0))
+        return f"{uid}:{week_start:%Y%m%d}:{version[0]}.{version[1]}"
+
+    @staticmethod
+    def content_key(user_id, week_start: datetime, sessions) -> str:
+        """Content address of a finished week's image."""
+        h = hashlib.sha256(_RENDER_SALT)
+        h.update(f"{user_id}|{week_start.isoformat()}|".encode())
+        h.update(repr(list(sessions)).encode())
+        return h.hexdigest()
+
+    # ── lookup / store ────────────────────────────────
+    def get(self, key: str, disk: bool = False) -> bytes | None:
+        """Memory first; with `disk=True` also the disk tier (blocking I/O)."""
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return png
+        if disk:
+            png = self._read_disk(key)
+            if png is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, png)
+                return png
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, png: bytes, disk: bool = False):
+        """Store `png` in memory and, with `disk=True`, on disk (blocking I/O)."""
+        with self._lock:
+            self._remember(key, png)
+        if disk:
+            self._write_disk(key, png)
+
+    def _remember(self, key: str, png: bytes):
+        if len(png) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= len(old)
+        self._memory[key] = png
+        self._memory_used += len(png)
+        while self._memory_used > self.memory_bytes:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_used -= len(dropped)
+            self.evictions += 1
+
+    # ── disk tier ─────────────────────────────────────
+    def _scan_disk(self):
+        """Index existing files oldest-first by mtime (caller holds the lock)."""
+        if self._disk is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.png'):
+                st = entry.stat()
+                files.append((st.st_mtime, entry.name, st.st_size))
+        files.sort()
+        self._disk = OrderedDict((name, size) for _, name, size in files)
+        self._disk_used = sum(size for _, _, size in files)
+
+    def _read_disk(self, key: str) -> bytes | None:
+        name = f"{key}.png"
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            self._scan_disk()
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            os.utime(path)  # keep the LRU order across restarts
+        except OSError:
+            with self._lock:
+                self._disk_used -= self._disk.pop(name, 0)
+            return None
+        return png
+
+    def _write_disk(self, key: str, png: bytes):
+        name = f"{key}.png"
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            self._scan_disk()
+            if name in self._disk:
+                return
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"RenderCache: failed to write {name}: {e}")
+            return
+        with self._lock:
+            self._disk[name] = len(png)
+            self._disk_used += len(png)
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                old, size = self._disk.popitem(last=False)
+                self._disk_used -= size
+                self.evictions += 1
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_used,
+                'disk_entries': len(self._disk or ()),
+                'disk_bytes': self._disk_used,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_cache: RenderCache | None = None
+
+
+def get_render_cache() -> RenderCache:
+    """Return the process-wide RenderCache shared by CalendarCog and HistoryCog."""
+    global _cache
+    if _cache is None:
+        _cache = RenderCache()
+    return _cache
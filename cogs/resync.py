@@ -0,0 +1,271 @@
+"""Resync: one walk of the gateway state per on_ready, shared by the collection cogs.
+
+on_ready fires on the first connect and again whenever a session cannot
+be resumed. The first time, the engine walks every guild once (in chunks
+that yield to the event loop), hands the result to each cog's `initial`
+handler as a GatewaySnapshot for its DB reconciliation, and seeds the
+presence dispatcher with the state it saw.
+
+After that, the dispatcher's cached per-member playing state and the
+engine's own per-member voice channel are the last-sync snapshot; live
+events keep both current. A later on_ready only compares members against
+it and sends the differences through the same handlers live events use
+(PresenceChange via the dispatcher, VoiceChange to `voice` handlers; the
+engine is also the only on_voice_state_update listener), so
+an unchanged member costs one key comparison and writes nothing. Members
+no longer in the cache are left to their next update. Each run logs one
+summary line; `stats()` keeps the last one for !presencestats.
+
+With BOT_MEMBER_CACHE=active (cogs.member_cache) the cache only holds
+voice and fetched members, and discord.py empties it when a session is
+not resumed. Before each walk the engine therefore fetches the members it
+would otherwise miss: those the dispatcher has as playing, those in its
+voice map and, on the first on_ready, those returned by each cog's
+`users` coroutine (open DB rows).
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, NamedTuple
+
+import discord
+
+from cogs.member_cache import get_member_cache
+from cogs.presence import Playing, get_presence
+from cogs.ui_constants import LOG_OK
+
+# Members compared per event-loop turn
+CHUNK = 1000
+
+
+class VoiceChange(NamedTuple):
+    user_id: int
+    user_name: str
+    game_name: str | None
+    before: tuple[str, str] | None  # (channel_id, channel_name)
+    after: tuple[str, str] | None
+    at: datetime
+
+
+class GatewaySnapshot(NamedTuple):
+    """Current state for an `initial` handler, taken when the handler is called.
+
+    `playing` and `voice` come from the live caches (seeded by the walk,
+    updated by events since), so a handler that queues its DB work before
+    its first await sees exactly the state later events will build on.
+    """
+    names: dict[int, str]
+    playing: dict[int, tuple[Playing, ...]]
+    voice: dict[int, tuple[str, str]]  # user_id -> (channel_id, channel_name)
+    at: datetime
+
+
+def _game_name(member: discord.Member) -> str | None:
+    for act in member.activities:
+        if act.type == discord.ActivityType.playing:
+            return act.name
+    return None
+
+
+def _voice_now(bot, user_id: int) -> tuple[str, str] | None:
+    """(channel_id, channel_name) of the voice channel the user is in, in any guild."""
+    for guild in bot.guilds:
+        member = guild.get_member(user_id)
+        if member is not None and member.voice and member.voice.channel:
+            return (str(member.voice.channel.id), member.voice.channel.name)
+    return None
+
+
+class ResyncEngine:
+    """Initial gateway scan on the first on_ready, delta-only resync on the later ones."""
+
+    def __init__(self):
+        self._initial: list[Callable[[GatewaySnapshot], Awaitable[None]]] = []
+        self._voice_handlers: list[Callable[[VoiceChange], None]] = []
+        self._users: list[Callable[[], Awaitable[set[int]]]] = []
+        self._voice: dict[int, tuple[str, str]] = {}
+        self._touched: set[int] | None = None  # VC を出入りしたメンバー（初回の走査中のみ）
+        self._bot = None
+        self._lock = asyncio.Lock()
+        self.synced = False
+        self.runs = 0
+        self.last: dict = {}
+
+    def subscribe(self, bot, *, initial=None, voice=None, users=None):
+        """Register an `initial(snapshot)` coroutine, a `voice(change)` handler and/or a `users()` coroutine.
+
+        Voice handlers get every channel join / leave / move, live or found by a resync.
+        `users()` returns the ids the cog has open state for (fetched before the first walk
+        when the member cache is lazy).
+        """
+        if self._bot is None:
+            bot.add_listener(self.on_ready, 'on_ready')
+            bot.add_listener(self.on_voice_state_update, 'on_voice_state_update')
+            get_member_cache().attach(bot)
+            self._bot = bot
+        if initial and initial not in self._initial:
+            self._initial.append(initial)
+        if voice and voice not in self._voice_handlers:
+            self._voice_handlers.append(voice)
+        if users and users not in self._users:
+            self._users.append(users)
+
+    def unsubscribe(self, *, initial=None, voice=None, users=None):
+        if initial in self._initial:
+            self._initial.remove(initial)
+        if voice in self._voice_handlers:
+            self._voice_handlers.remove(voice)
+        if users in self._users:
+            self._users.remove(users)
+        if not self._initial and not self._voice_handlers and self._bot is not None:
+            self._bot.remove_listener(self.on_ready, 'on_ready')
+            self._bot.remove_listener(self.on_voice_state_update, 'on_voice_state_update')
+            get_member_cache().detach()
+            self._bot = None
+
+    # ── live state ─────────────────────────────────────
+    async def on_voice_state_update(self, member: discord.Member,
+                                    before: discord.VoiceState, after: discord.VoiceState):
+        if before.channel == after.channel:
+            return
+        prev = (str(before.channel.id), before.channel.name) if before.channel else None
+        channel = (str(after.channel.id), after.channel.name) if after.channel else None
+        if channel:
+            self._voice[member.id] = channel
+        else:
+            self._voice.pop(member.id, None)
+        if self._touched is not None:
+            self._touched.add(member.id)
+        self._dispatch_voice(VoiceChange(
+            member.id, member.name, _game_name(member), prev, channel, datetime.now()))
+
+    # ── on_ready ───────────────────────────────────────
+    async def on_ready(self):
+        async with self._lock:
+            t0 = time.perf_counter()
+            await self._fetch_tracked(self._bot)
+            if self.synced:
+                counts = await self._resync(self._bot)
+                kind = '差分再同期'
+            else:
+                counts = await self._initial_sync(self._bot)
+                self.synced = True
+                kind = '初回同期'
+            self.runs += 1
+            self.last = {'kind': kind, 'seconds': time.perf_counter() - t0, **counts}
+        print(f"{LOG_OK} Resync: {kind} {counts['members']}人 "
+              f"({self.last['seconds'] * 1000:.0f}ms) "
+              f"ゲーム +{counts['games_started']}/-{counts['games_stopped']} "
+              f"パーティ +{counts['parties_joined']}/-{counts['parties_left']} "
+              f"VC +{counts['voice_joined']}/-{counts['voice_left']}")
+
+    async def _fetch_tracked(self, bot):
+        """Lazy member cache: fetch the members this sync must compare but may not be cached."""
+        cache = get_member_cache()
+        if not cache.lazy:
+            return
+        user_ids = set(get_presence().playing_now()) | set(self._voice)
+        if not self.synced:
+            for users in list(self._users):
+                try:
+                    user_ids |= await users()
+                except Exception as e:
+                    print(f"Resync users {users.__qualname__} failed: {e}")
+        await cache.prefetch(bot, user_ids)
+
+    async def _walk(self, bot):
+        """Yield (member, (channel_id, channel_name) or None) once per cached member, CHUNK per loop turn."""
+        in_voice = {m.id for guild in bot.guilds for vc in guild.voice_channels for m in vc.members}
+        seen = set()
+        for guild in bot.guilds:
+            for member in guild.members:
+                if member.id in seen:
+                    continue
+                seen.add(member.id)
+                # VC の状態は走査の合間に変わりうるので、関係するメンバーだけ読んだ時点の値を使う
+                channel = None
+                if member.id in in_voice or member.id in self._voice:
+                    channel = _voice_now(bot, member.id)
+                yield member, channel
+                if len(seen) % CHUNK == 0:
+                    await asyncio.sleep(0)
+
+    async def _initial_sync(self, bot) -> dict:
+        now = datetime.now()
+        dispatcher = get_presence()
+        names, voice = {}, {}
+        self._touched = set()
+        async for member, channel in self._walk(bot):
+            names[member.id] = member.name
+            dispatcher.seed(member)
+            if channel:
+                voice[member.id] = channel
+        # 走査中に VC を出入りしたメンバーはライブイベントの状態が新しい
+        touched, self._touched = self._touched, None
+        for uid, channel in voice.items():
+            if uid not in touched:
+                self._voice.setdefault(uid, channel)
+
+        for handler in list(self._initial):
+            await handler(GatewaySnapshot(names, dispatcher.playing_now(), dict(self._voice), now))
+        playing_now = dispatcher.playing_now()
+        return {
+            'members': len(names),
+            'games_started': sum(len(acts) for acts in playing_now.values()),
+            'games_stopped': 0,
+            'parties_joined': sum(1 for acts in playing_now.values() for p in acts if p.party_id),
+            'parties_left': 0,
+            'voice_joined': len(self._voice),
+            'voice_left': 0,
+        }
+
+    async def _resync(self, bot) -> dict:
+        now = datetime.now()
+        dispatcher = get_presence()
+        counts = dict.fromkeys(('members', 'games_started', 'games_stopped', 'parties_joined',
+                                'parties_left', 'voice_joined', 'voice_left'), 0)
+        # 差分はメンバーを読んだその場で反映するので、走査の合間に届くライブイベントと食い違わない
+        async for member, channel in self._walk(bot):
+            counts['members'] += 1
+            change = dispatcher.diff(member, now)
+            if change is not None:
+                counts['games_started'] += len(change.started)
+                counts['games_stopped'] += len(change.stopped)
+                counts['parties_joined'] += len(change.parties_joined)
+                counts['parties_left'] += len(change.parties_left)
+                dispatcher.dispatch(change)
+
+            before = self._voice.get(member.id)
+            if before == channel:
+                continue
+            if channel:
+                self._voice[member.id] = channel
+                counts['voice_joined'] += 1
+            else:
+                del self._voice[member.id]
+            if before:
+                counts['voice_left'] += 1
+            self._dispatch_voice(VoiceChange(
+                member.id, member.name, _game_name(member), before, channel, now))
+        return counts
+
+    def _dispatch_voice(self, change: VoiceChange):
+        for handler in list(self._voice_handlers):
+            try:
+                handler(change)
+            except Exception as e:
+                print(f"Resync voice handler {handler.__qualname__} failed: {e}")
+
+    def stats(self) -> dict:
+        return {'runs': self.runs, **self.last}
+
+
+_engine: ResyncEngine | None = None
+
+
+def get_resync() -> ResyncEngine:
+    """Return the process-wide ResyncEngine shared by HistoryCog and TrackerCog."""
+    global _engine
+    if _engine is None:
+        _engine = ResyncEngine()
+    return _engine
@@ -0,0 +1,290 @@
+"""Schema: versioned migrations and time helpers for data/game_history.db.
+
+Each cog still creates its own base tables in `_init_db` and then calls
+`apply_migrations`. Migrations run strictly in version order; one whose
+tables do not exist yet (e.g. game_sessions before HistoryCog has started)
+stops the run and is retried by the next cog's `_init_db`.
+"""
+import sqlite3
+import time
+from datetime import datetime
+
+from cogs.ui_constants import LOG_OK
+
+
+def to_epoch(dt: datetime | None) -> int | None:
+    """Unix epoch seconds for a naive local datetime (as stored in *_time columns)."""
+    return int(dt.timestamp()) if dt is not None else None
+
+
+def cutoff_epoch(days: int) -> int:
+    """Epoch seconds `days` days before now, for `start_epoch > ?` range filters."""
+    return int(time.time()) - days * 86400
+
+
+def local_hour_sql(epoch_col: str = 'start_epoch', iso_col: str = 'start_time') -> str:
+    """SQL expression for the local hour (0-23) a session started in.
+
+    Without DST the local offset is constant, so the hour comes straight from
+    the epoch column (readable from a covering index). Zones with DST fall
+    back to reading HH out of the ISO string.
+    """
+    if not time.daylight:
+        return f"(({epoch_col} + {-time.timezone}) / 3600) % 24"
+    return f"CAST(substr({iso_col}, 12, 2) AS INTEGER)"
+
+
+# ISO strings are naive local time; 'utc' converts them the same way datetime.timestamp() does.
+_EPOCH_OF = "CAST(strftime('%s', {col}, 'utc') AS INTEGER)"
+
+
+def _m001_game_sessions_epoch(conn: sqlite3.Connection):
+    """Integer epoch columns + composite indexes so time-range filters are sargable."""
+    cols = {r[1] for r in conn.execute('PRAGMA table_info(game_sessions)')}
+    if 'start_epoch' not in cols:
+        conn.execute('ALTER TABLE game_sessions ADD COLUMN start_epoch INTEGER')
+    if 'end_epoch' not in cols:
+        conn.execute('ALTER TABLE game_sessions ADD COLUMN end_epoch INTEGER')
+    conn.execute(f'''
+        UPDATE game_sessions
+        SET start_epoch = {_EPOCH_OF.format(col='start_time')},
+            end_epoch   = {_EPOCH_OF.format(col='end_time')}
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_user_start '
+                 'ON game_sessions(user_id, start_epoch)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_start_game '
+                 'ON game_sessions(start_epoch, game_name)')
+    # The cogs write the epoch columns themselves; these only cover other
+    # writers (seed scripts, manual inserts) that fill the ISO strings alone.
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_game_sessions_epoch_insert
+        AFTER INSERT ON game_sessions
+        WHEN NEW.start_epoch IS NULL OR (NEW.end_time IS NOT NULL AND NEW.end_epoch IS NULL)
+        BEGIN
+            UPDATE game_sessions
+            SET start_epoch = COALESCE(NEW.start_epoch, {_EPOCH_OF.format(col='NEW.start_time')}),
+                end_epoch   = COALESCE(NEW.end_epoch,   {_EPOCH_OF.format(col='NEW.end_time')})
+            WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_game_sessions_epoch_close
+        AFTER UPDATE OF end_time ON game_sessions
+        WHEN NEW.end_time IS NOT NULL AND NEW.end_epoch IS NULL
+        BEGIN
+            UPDATE game_sessions
+            SET end_epoch = {_EPOCH_OF.format(col='NEW.end_time')}
+            WHERE id = NEW.id;
+        END
+    ''')
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> int:
+    """Recompute daily_user_game_stats / user_hour_stats from closed game_sessions rows.
+
+    Returns the number of daily rows written. Open sessions (end_time IS NULL)
+    are added by HistoryCog when they close.
+    """
+    conn.execute('DELETE FROM daily_user_game_stats')
+    conn.execute('DELETE FROM user_hour_stats')
+    cur = conn.execute('''
+        INSERT INTO daily_user_game_stats (day, user_id, game_name, session_count, total_seconds)
+        SELECT date(start_time), user_id, game_name, COUNT(*), SUM(COALESCE(duration, 0))
+        FROM game_sessions
+        WHERE end_time IS NOT NULL
+        GROUP BY date(start_time), user_id, game_name
+    ''')
+    conn.execute('''
+        INSERT INTO user_hour_stats (user_id, hour, session_count)
+        SELECT user_id, CAST(strftime('%H', start_time) AS INTEGER), COUNT(*)
+        FROM game_sessions
+        WHERE end_time IS NOT NULL
+        GROUP BY user_id, CAST(strftime('%H', start_time) AS INTEGER)
+    ''')
+    return cur.rowcount
+
+
+def _m002_session_rollups(conn: sqlite3.Connection):
+    """Per-day and per-hour rollups so stats commands scale with days × games, not sessions."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS daily_user_game_stats (
+        day TEXT NOT NULL, user_id TEXT NOT NULL, game_name TEXT NOT NULL,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        total_seconds INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id, game_name)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_daily_stats_user_day '
+                 'ON daily_user_game_stats(user_id, day)')
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_hour_stats (
+        user_id TEXT NOT NULL, hour INTEGER NOT NULL,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, hour)
+    )''')
+    rebuild_rollups(conn)
+
+
+def _m003_covering_user_index(conn: sqlite3.Connection):
+    """Extend (user_id, start_epoch) with game_name and duration so window scans skip the table."""
+    conn.execute('DROP INDEX IF EXISTS idx_game_sessions_user_start')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_user_start '
+                 'ON game_sessions(user_id, start_epoch, game_name, duration)')
+
+
+def _m004_voice_intervals(conn: sqlite3.Connection):
+    """Per-member voice_intervals; pair rows move to voice_co_overlaps behind a voice_co_sessions view."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS voice_intervals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL, channel_id TEXT NOT NULL, channel_name TEXT,
+        game_name TEXT,
+        join_time TEXT NOT NULL, leave_time TEXT NOT NULL,
+        join_epoch INTEGER NOT NULL, leave_epoch INTEGER NOT NULL
+    )''')
+    # Overlap sweeps look up the channel's intervals that ended after a point in time
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_voice_intervals_channel_leave '
+                 'ON voice_intervals(channel_id, leave_epoch)')
+    # Highest voice_intervals.id already folded into voice_co_overlaps
+    conn.execute('''CREATE TABLE IF NOT EXISTS voice_overlap_watermark (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_interval_id INTEGER NOT NULL
+    )''')
+    conn.execute('INSERT OR IGNORE INTO voice_overlap_watermark (id, last_interval_id) VALUES (1, 0)')
+
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name='voice_co_sessions'").fetchone()
+    if kind and kind[0] == 'table':
+        conn.execute('ALTER TABLE voice_co_sessions RENAME TO voice_co_overlaps')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_voice_co_overlaps_a '
+                 'ON voice_co_overlaps(user_id_a, user_id_b, duration)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_voice_co_overlaps_b '
+                 'ON voice_co_overlaps(user_id_b, user_id_a, duration)')
+    # Existing readers and writers (seed scripts, old_debug) keep using voice_co_sessions
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS voice_co_sessions AS
+        SELECT id, user_id_a, user_id_b, channel_id, channel_name,
+               game_name_a, game_name_b, start_time, end_time, duration
+        FROM voice_co_overlaps
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_voice_co_sessions_insert
+        INSTEAD OF INSERT ON voice_co_sessions
+        BEGIN
+            INSERT INTO voice_co_overlaps
+            (user_id_a, user_id_b, channel_id, channel_name,
+             game_name_a, game_name_b, start_time, end_time, duration)
+            VALUES (NEW.user_id_a, NEW.user_id_b, NEW.channel_id, NEW.channel_name,
+                    NEW.game_name_a, NEW.game_name_b, NEW.start_time, NEW.end_time, NEW.duration);
+        END
+    ''')
+
+
+# Shared by the voice_co_sessions INSTEAD OF trigger and cogs.voice_overlap
+UPSERT_VOICE_PAIR_TOTAL = '''
+    INSERT INTO voice_pair_totals (user_lo, user_hi, total_seconds, last_seen)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_lo, user_hi) DO UPDATE SET
+        total_seconds = total_seconds + excluded.total_seconds,
+        last_seen = max(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''))
+'''
+
+
+def rebuild_voice_pair_totals(conn: sqlite3.Connection) -> int:
+    """Recompute voice_pair_totals from voice_co_overlaps. Returns the number of pairs."""
+    conn.execute('DELETE FROM voice_pair_totals')
+    cur = conn.execute('''
+        INSERT INTO voice_pair_totals (user_lo, user_hi, total_seconds, last_seen)
+        SELECT min(user_id_a, user_id_b), max(user_id_a, user_id_b),
+               SUM(COALESCE(duration, 0)), MAX(end_time)
+        FROM voice_co_overlaps
+        GROUP BY min(user_id_a, user_id_b), max(user_id_a, user_id_b)
+    ''')
+    return cur.rowcount
+
+
+def _m005_voice_pair_totals(conn: sqlite3.Connection):
+    """Cumulative voice seconds per pair, so /discover and !similar read one user's pairs by key."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS voice_pair_totals (
+        user_lo TEXT NOT NULL, user_hi TEXT NOT NULL,
+        total_seconds INTEGER NOT NULL DEFAULT 0,
+        last_seen TEXT,
+        PRIMARY KEY (user_lo, user_hi)
+    ) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_voice_pair_totals_hi '
+                 'ON voice_pair_totals(user_hi, user_lo, total_seconds)')
+    # Rows inserted through the compatibility view count toward the totals too
+    conn.execute('DROP TRIGGER IF EXISTS trg_voice_co_sessions_insert')
+    conn.execute('''
+        CREATE TRIGGER trg_voice_co_sessions_insert
+        INSTEAD OF INSERT ON voice_co_sessions
+        BEGIN
+            INSERT INTO voice_co_overlaps
+            (user_id_a, user_id_b, channel_id, channel_name,
+             game_name_a, game_name_b, start_time, end_time, duration)
+            VALUES (NEW.user_id_a, NEW.user_id_b, NEW.channel_id, NEW.channel_name,
+                    NEW.game_name_a, NEW.game_name_b, NEW.start_time, NEW.end_time, NEW.duration);
+            INSERT INTO voice_pair_totals (user_lo, user_hi, total_seconds, last_seen)
+            VALUES (min(NEW.user_id_a, NEW.user_id_b), max(NEW.user_id_a, NEW.user_id_b),
+                    COALESCE(NEW.duration, 0), NEW.end_time)
+            ON CONFLICT(user_lo, user_hi) DO UPDATE SET
+                total_seconds = total_seconds + excluded.total_seconds,
+                last_seen = max(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, ''));
+        END
+    ''')
+    rebuild_voice_pair_totals(conn)
+
+
+def _m006_open_party_index(conn: sqlite3.Connection):
+    """Partial index on open party rows for PartyLeft / startup closes by (party_id, user_id)."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_party_sessions_open '
+                 'ON party_sessions(party_id, user_id) WHERE left_at IS NULL')
+
+
+def _m007_open_session_index(conn: sqlite3.Connection):
+    """Partial index on open game_sessions rows: GameEnded's newest-open lookup and the stats reads."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_open '
+                 'ON game_sessions(user_id, game_name) WHERE end_time IS NULL')
+
+
+# (version, description, required tables, function)
+MIGRATIONS = [
+    (1, 'game_sessions epoch columns and time-range indexes',
+     ('game_sessions',), _m001_game_sessions_epoch),
+    (2, 'daily_user_game_stats / user_hour_stats rollups',
+     ('game_sessions',), _m002_session_rollups),
+    (3, 'covering (user_id, start_epoch, game_name, duration) index',
+     ('game_sessions',), _m003_covering_user_index),
+    (4, 'voice_intervals + voice_co_overlaps behind a voice_co_sessions view',
+     ('voice_co_sessions',), _m004_voice_intervals),
+    (5, 'voice_pair_totals keyed by (user_lo, user_hi)',
+     ('voice_co_overlaps',), _m005_voice_pair_totals),
+    (6, 'partial (party_id, user_id) index on open party_sessions',
+     ('party_sessions',), _m006_open_party_index),
+    (7, 'partial (user_id, game_name) index on open game_sessions',
+     ('game_sessions',), _m007_open_session_index),
+]
+
+
+def apply_migrations(conn: sqlite3.Connection):
+    """Apply every pending migration whose tables exist, in version order."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )''')
+    conn.commit()
+    applied = {r[0] for r in conn.execute('SELECT version FROM schema_migrations')}
+    for version, name, requires, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        tables = {r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        if not all(t in tables for t in requires):
+            break
+        try:
+            conn.execute('BEGIN')
+            migrate(conn)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, datetime.now().isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"{LOG_OK} Schema: migration {version} applied ({name})")
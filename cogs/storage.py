@@ -0,0 +1,313 @@
+"""Storage: shared write-behind SQLite writer used by the collection cogs.
+
+Listeners hand typed event records (cogs.events) to `submit` without
+touching the database. A pump task on the event loop groups them into
+batches (by size or elapsed time) and hands each batch to a dedicated
+writer thread, which owns the only long-lived write connection, calls
+`record.apply(conn)` for each and commits the whole batch in a single
+transaction.
+
+The queue is bounded: once `max_pending` records are waiting, `submit`
+drops new ones (and counts them) rather than letting a stalled disk grow
+memory without limit; `put` waits for room instead, for writes that must
+not be lost (shutdown). Depth, drops and commit lag are kept for
+`!queuestats`.
+"""
+import asyncio
+import queue
+import sqlite3
+import threading
+
+from cogs.ui_constants import LOG_OK, LOG_STOP
+
+DB_PATH = 'data/game_history.db'
+
+# A batch is committed once it holds this many items, or this many seconds
+# after its first item arrived, whichever comes first.
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+# Event records allowed to wait in the queue before `submit` starts dropping
+MAX_PENDING = 10_000
+
+
+class _Call:
+    """A function run on the writer thread with the connection, in queue order."""
+    __slots__ = ('fn', 'future')
+
+    def __init__(self, fn, future: asyncio.Future):
+        self.fn = fn
+        self.future = future
+
+
+# Queued by _stop: the pump hands off everything ahead of it, then exits
+_STOP = object()
+
+
+class _Notify:
+    """A callback run on the event loop once the batch holding it has committed."""
+    __slots__ = ('callback',)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+
+def _resolve(future: asyncio.Future, result=None, error: BaseException | None = None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class Storage:
+    """Single write connection + writer thread shared by every cog.
+
+    `submit(record)` is fire-and-forget and safe to call from any listener;
+    `notify(cb)` runs `cb` once everything submitted before it is committed.
+    `run(fn)` executes `fn(conn)` on the writer thread after every
+    previously queued write and returns its result. `open` / `close` are
+    reference counted so each cog can pair them in cog_load / cog_unload;
+    the last `close` drains the queue and stops the thread, and `shutdown`
+    does the same regardless of the count. Queueing anything while no
+    writer thread is running raises RuntimeError, since nothing would ever
+    write it (or resolve `run`'s future).
+    """
+
+    def __init__(self, db_path: str = DB_PATH, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Unbounded on purpose: the bound applies to event records only, so
+        # `run` / `notify` items are never refused (see submit)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pump: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._users = 0
+        self._pending = 0
+        self._room = asyncio.Event()
+        self._room.set()
+        # Metrics
+        self.submitted = 0
+        self.committed = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._dropping = False
+
+    # ── lifecycle ─────────────────────────────────────
+    async def open(self):
+        self._users += 1
+        if self._pump is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(
+            target=self._writer_main, name='storage-writer', daemon=True)
+        self._thread.start()
+        self._pump = asyncio.create_task(self._pump_main())
+        print(f"{LOG_OK} Storage: writer thread started ({self.db_path})")
+
+    async def close(self):
+        self._users = max(0, self._users - 1)
+        if self._pump is None:
+            return
+        await self.flush()
+        if self._users > 0:
+            return
+        await self._stop()
+
+    async def shutdown(self):
+        """Drain and stop regardless of open / close pairing (process exit)."""
+        self._users = 0
+        if self._pump is None:
+            return
+        await self.flush()
+        await self._stop()
+
+    async def _stop(self):
+        loop = asyncio.get_running_loop()
+        pump, self._pump = self._pump, None
+        # cancel ではなく番兵で止める（flush の後に submit されたものも書き込まれる）
+        self._queue.put_nowait((loop.time(), _STOP))
+        await pump
+        # ポンプの終了を待つ間に積まれたものは、スレッドを止める前に最後のバッチとして渡す
+        rest = []
+        while not self._queue.empty():
+            queued, item = self._queue.get_nowait()
+            rest.append((queued, item))
+        if rest:
+            self._jobs.put(([item for _, item in rest], rest[0][0], loop.create_future()))
+        # ここから先の submit / run は RuntimeError（書き込むスレッドがもう無い）
+        thread, self._thread = self._thread, None
+        self._jobs.put(None)
+        await loop.run_in_executor(None, thread.join)
+        print(f"{LOG_STOP} Storage: writer thread stopped "
+              f"({self.committed} committed, {self.dropped} dropped)")
+
+    # ── producer API ──────────────────────────────────
+    def _enqueue(self, item, event: bool):
+        if self._thread is None:
+            raise RuntimeError(f"Storage is not open ({self.db_path})")
+        if event:
+            self._pending += 1
+            self.submitted += 1
+            self.peak_depth = max(self.peak_depth, self._pending)
+        self._queue.put_nowait((asyncio.get_running_loop().time(), item))
+
+    def submit(self, record) -> bool:
+        """Queue an event record (anything with `apply(conn)`); False if it was dropped."""
+        if self._thread is None:
+            raise RuntimeError(f"Storage is not open ({self.db_path})")
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            if not self._dropping:
+                self._dropping = True
+                print(f"Storage: queue full ({self._pending} pending), dropping events")
+            return False
+        if self._dropping:
+            self._dropping = False
+            print(f"Storage: queue accepting again ({self.dropped} dropped so far)")
+        self._enqueue(record, event=True)
+        return True
+
+    async def put(self, record):
+        """Queue an event record, waiting for room instead of dropping it."""
+        while self._pending >= self.max_pending:
+            self._room.clear()
+            await self._room.wait()
+        self._enqueue(record, event=True)
+
+    def depth(self) -> int:
+        """Event records submitted but not yet committed."""
+        return self._pending
+
+    def stats(self) -> dict:
+        return {
+            'depth': self._pending,
+            'peak_depth': self.peak_depth,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'committed': self.committed,
+            'dropped': self.dropped,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+        }
+
+    def run(self, fn) -> asyncio.Future:
+        """Queue `fn(conn)` behind pending writes; await the returned future for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Call(fn, future), event=False)
+        return future
+
+    def notify(self, callback):
+        """Call `callback()` on the event loop after everything queued so far is committed.
+
+        Unlike `run`, this does not make the pump commit early.
+        """
+        self._enqueue(_Notify(callback), event=False)
+
+    async def flush(self):
+        """Wait until everything queued so far has been committed."""
+        if self._pump is None:
+            return
+        await self.run(lambda conn: None)
+
+    # ── pump (event loop side) ────────────────────────
+    async def _pump_main(self):
+        loop = asyncio.get_running_loop()
+        q = self._queue
+        stopping = False
+        while not stopping:
+            first_queued, item = await q.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            # A queued call is waiting on us, so commit as soon as one shows up
+            while len(batch) < self.batch_size and not isinstance(batch[-1], _Call):
+                try:
+                    item = q.get_nowait()[1]
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = (await asyncio.wait_for(q.get(), timeout))[1]
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    # Commit what came before the sentinel, then exit
+                    stopping = True
+                    break
+                batch.append(item)
+            done = loop.create_future()
+            self._jobs.put((batch, first_queued, done))
+            await done
+
+    def _batch_written(self, events: int, first_queued: float):
+        """Metrics for one written batch (event loop; scheduled before its futures resolve)."""
+        self._pending -= events
+        self.committed += events
+        self.last_lag = self._loop.time() - first_queued
+        self.max_lag = max(self.max_lag, self.last_lag)
+        if self._pending < self.max_pending:
+            self._room.set()
+
+    # ── writer thread ─────────────────────────────────
+    def _writer_main(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            batch, first_queued, done = job
+            self._apply(conn, batch, first_queued)
+            self._loop.call_soon_threadsafe(_resolve, done)
+        conn.close()
+
+    def _apply(self, conn: sqlite3.Connection, batch: list, first_queued: float):
+        outcomes, notifies, events = [], [], 0
+        for item in batch:
+            try:
+                if isinstance(item, _Call):
+                    outcomes.append((item, item.fn(conn), None))
+                elif isinstance(item, _Notify):
+                    notifies.append(item.callback)
+                else:
+                    events += 1
+                    item.apply(conn)
+            except Exception as e:
+                # One bad record must not drop the rest of the batch
+                print(f"Storage write failed: {e}")
+                if isinstance(item, _Call):
+                    outcomes.append((item, None, e))
+        try:
+            conn.commit()
+        except Exception as e:
+            print(f"Storage commit failed ({len(batch)} items): {e}")
+            conn.rollback()
+            outcomes = [(call, None, e) for call, _, _ in outcomes]
+        # Records leave the queue depth once their batch is written (or rolled back)
+        self._loop.call_soon_threadsafe(self._batch_written, events, first_queued)
+        for call, result, error in outcomes:
+            self._loop.call_soon_threadsafe(_resolve, call.future, result, error)
+        for callback in notifies:
+            self._loop.call_soon_threadsafe(callback)
+
+
+_storage: Storage | None = None
+
+
+def get_storage() -> Storage:
+    """Return the process-wide Storage shared by TrackerCog and HistoryCog."""
+    global _storage
+    if _storage is None:
+        _storage = Storage()
+    return _storage
@@ -1,15 +1,29 @@
 """TrackerCog: VC共同参加・パーティプレイ・メンション収集"""
+import asyncio
 import discord
 from discord.ext import commands
 from datetime import datetime
-from typing import Optional
+from functools import partial
 import sqlite3
 
+from cogs import voice_overlap
+from cogs.events import (
+    CLOSE_PARTY_SESSION, INSERT_PARTY_SESSION,
+    MentionLogged, PartiesClosed, PartyJoined, PartyLeft, VoiceInterval,
+)
+from cogs.executor import log_task_errors
+from cogs.member_cache import get_member_cache
+from cogs.presence import PresenceChange, get_presence
+from cogs.resync import GatewaySnapshot, VoiceChange, get_resync
+from cogs.schema import apply_migrations
+from cogs.storage import get_storage
 from cogs.ui_constants import (
     LOG_GAME, LOG_MENTION, LOG_OK, LOG_SAVE, LOG_STOP, LOG_VC,
 )
 
 DB_PATH = 'data/game_history.db'
+# VC退出後、この秒数ぶんの退出をまとめてから共同参加を集計する
+OVERLAP_DELAY = 30
 
 
 class TrackerCog(commands.Cog, name='Tracker'):
@@ -17,8 +31,9 @@ class TrackerCog(commands.Cog, name='Tracker'):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self._vc_sessions: dict = {}  # {(id_a, id_b, channel_id): {'start_time': dt, 'channel_name': str}}
-        self._tracked_parties = set() # 複数ギルド重複発火防止用
+        self._voice_joins: dict = {}  # {member_id: (channel_id, channel_name, join_time)}
+        self._overlap_task: asyncio.Task | None = None
+        self.storage = get_storage()
         self._init_db()
 
     # ── DB初期化 ───────────────────────────────────────
@@ -44,217 +59,154 @@ class TrackerCog(commands.Cog, name='Tracker'):
             channel_id TEXT NOT NULL, timestamp TEXT NOT NULL
         )''')
         conn.commit()
+        apply_migrations(conn)
         conn.close()
         print(f"{LOG_OK} TrackerCog: DBテーブル初期化完了")
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        now = datetime.now()
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        
-        for guild in self.bot.guilds:
-            # 1. 既存のVCセッションをスキャン
-            for vc in guild.voice_channels:
-                members = vc.members
-                for i, m1 in enumerate(members):
-                    for m2 in members[i+1:]:
-                        key = tuple(sorted([str(m1.id), str(m2.id)])) + (str(vc.id),)
-                        if key not in self._vc_sessions:
-                            self._vc_sessions[key] = {
-                                'start_time': now,
-                                'channel_name': vc.name
-                            }
-                            print(f"{LOG_VC} [初期スキャン] VC共同参加を検出: {m1.name}↔{m2.name} in #{vc.name}")
-            
-            # 2. 既存のパーティセッションをスキャン
-            for member in guild.members:
-                for act in member.activities:
-                    if act.type == discord.ActivityType.playing:
-                        info = self._get_party_info(act)
-                        if info and info['party_id']:
-                            pid = info['party_id']
-                            size = info['size']
-                            # 既に登録されているか確認
-                            cur = conn.cursor()
-                            cur.execute("SELECT 1 FROM party_sessions WHERE party_id=? AND user_id=? AND left_at IS NULL", (pid, str(member.id)))
-                            if not cur.fetchone():
-                                conn.execute('''
-                                    INSERT INTO party_sessions
-                                    (party_id, user_id, game_name, party_size_current, party_size_max, joined_at)
-                                    VALUES (?, ?, ?, ?, ?, ?)
-                                ''', (pid, str(member.id), act.name,
-                                      size[0] if size else None,
-                                      size[1] if size else None,
-                                      now.isoformat()))
-                                print(f"{LOG_GAME} [初期スキャン] パーティ参加を検出: {member.name} → {act.name}")
-        
-        conn.commit()
-        conn.close()
-        print(f"{LOG_OK} TrackerCog: 初期スキャン完了")
+    async def cog_load(self):
+        await self.storage.open()
+        get_presence().subscribe(self.bot, self._on_presence_change)
+        get_resync().subscribe(self.bot, initial=self._initial_sync, voice=self._on_voice_change,
+                                users=self._open_users)
+
+    async def _open_users(self) -> set[int]:
+        """Users with an open party_sessions row (fetched first when the member cache is lazy)."""
+        rows = await self.storage.run(lambda conn: conn.execute(
+            'SELECT DISTINCT user_id FROM party_sessions WHERE left_at IS NULL').fetchall())
+        return {int(uid) for (uid,) in rows}
+
+    async def _initial_sync(self, snapshot: GatewaySnapshot):
+        """Register current VC members and reconcile parties with the first gateway snapshot (ResyncEngine)."""
+        now = snapshot.at
+
+        # 1. 既存のVC参加
+        for uid, (channel_id, channel_name) in snapshot.voice.items():
+            self._voice_joins.setdefault(uid, (channel_id, channel_name, now))
+
+        # 2. 既存のパーティセッション（DB照合は書き込みスレッドで行う）
+        party_candidates = {}  # {(party_id, user_id): (game_name, size)}
+        for uid, acts in snapshot.playing.items():
+            for act in acts:
+                if act.party_id:
+                    party_candidates[(act.party_id, str(uid))] = (act.name, act.party_size)
+
+        await self.storage.run(partial(self._restore_parties, party_candidates, now))
+        # 前回終了時に集計しきれなかった区間があれば反映する
+        await self._materialize_overlaps()
+        print(f"{LOG_OK} TrackerCog: 初期スキャン完了（VC {len(snapshot.voice)}人）")
+
+    def _restore_parties(self, candidates: dict, now: datetime, conn: sqlite3.Connection):
+        """Reconcile party_sessions with the parties seen at startup (writer thread).
+
+        One read of the open rows, a set diff in memory, then executemany for
+        the inserts and closes; the whole run commits as one batch.
+        """
+        open_rows = set(conn.execute(
+            'SELECT party_id, user_id FROM party_sessions WHERE left_at IS NULL'))
+
+        joins = [PartyJoined(pid, user_id, game_name,
+                             size[0] if size else None,
+                             size[1] if size else None,
+                             now)
+                 for (pid, user_id), (game_name, size) in candidates.items()
+                 if (pid, user_id) not in open_rows]
+        # 前回の異常終了などで開いたまま残り、今は参加していないパーティ
+        closes = [PartyLeft(pid, user_id, now) for pid, user_id in open_rows - candidates.keys()]
+
+        conn.executemany(INSERT_PARTY_SESSION, [j.row() for j in joins])
+        conn.executemany(CLOSE_PARTY_SESSION, [c.row() for c in closes])
+        print(f"{LOG_GAME} [初期スキャン] パーティ照合: 継続 {len(open_rows) - len(closes)}件 / "
+              f"新規 {len(joins)}件 / 終了 {len(closes)}件")
 
     async def cog_unload(self):
+        get_presence().unsubscribe(self._on_presence_change)
+        get_resync().unsubscribe(initial=self._initial_sync, voice=self._on_voice_change,
+                                  users=self._open_users)
         now = datetime.now()
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        
-        # 残っているVCセッションを全て強制保存
-        for key, session in self._vc_sessions.items():
-            id_a, id_b, channel_id = key
-            duration = int((now - session['start_time']).total_seconds())
-            
-            conn.execute('''
-                INSERT INTO voice_co_sessions
-                (user_id_a, user_id_b, channel_id, channel_name, start_time, end_time, duration)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (id_a, id_b, channel_id, session['channel_name'],
-                  session['start_time'].isoformat(), now.isoformat(), duration))
-        
-        # パーティセッションの left_at を一括で閉じる
-        conn.execute('''
-            UPDATE party_sessions SET left_at=?
-            WHERE left_at IS NULL
-        ''', (now.isoformat(),))
-        
-        conn.commit()
-        conn.close()
-        print(f"{LOG_STOP} TrackerCog: 終了時データ保存完了")
 
-    # ── ヘルパー ───────────────────────────────────────
-    def _get_game_name(self, member: discord.Member) -> Optional[str]:
-        for act in member.activities:
-            if act.type == discord.ActivityType.playing:
-                return act.name
-        return None
+        if self._overlap_task:
+            self._overlap_task.cancel()
 
-    def _get_party_info(self, activity) -> Optional[dict]:
-        if not hasattr(activity, 'party') or not activity.party:
-            return None
-        p = activity.party
-        return {'party_id': p.get('id'), 'size': p.get('size', [None, None])}
+        # 残っているVC参加を全て強制保存（キューが満杯でも捨てずに待つ）
+        for member_id, (channel_id, channel_name, join_time) in self._voice_joins.items():
+            await self.storage.put(VoiceInterval(
+                str(member_id), channel_id, channel_name, None, join_time, now))
+        self._voice_joins.clear()
+        await self._materialize_overlaps()
+
+        # パーティセッションの left_at を一括で閉じる
+        await self.storage.put(PartiesClosed(now))
+
+        # キューに残った書き込みをすべてコミットしてから終了
+        await self.storage.close()
+        print(f"{LOG_STOP} TrackerCog: 終了時データ保存完了")
 
     # ── イベント: VC ───────────────────────────────────
-    @commands.Cog.listener()
-    async def on_voice_state_update(
-        self, member: discord.Member,
-        before: discord.VoiceState, after: discord.VoiceState
-    ):
-        now = datetime.now()
+    def _on_voice_change(self, change: VoiceChange):
+        """Close / open voice intervals; called by the resync engine for live and resynced moves."""
+        # 退出（移動の場合は先に元のチャンネルの滞在を閉じる）
+        if change.before:
+            joined = self._voice_joins.pop(change.user_id, None)
+            if joined and joined[0] == change.before[0]:
+                channel_id, channel_name, join_time = joined
+                self.storage.submit(VoiceInterval(
+                    str(change.user_id), channel_id, channel_name,
+                    change.game_name, join_time, change.at))
+                self._schedule_overlaps()
+                duration = int((change.at - join_time).total_seconds())
+                print(f"{LOG_SAVE} VC滞在記録: {change.user_name} in #{channel_name} ({duration}秒)")
 
         # 参加
-        if after.channel and after.channel != before.channel:
-            for other in after.channel.members:
-                if other.id == member.id:
-                    continue
-                key = tuple(sorted([str(member.id), str(other.id)])) + (str(after.channel.id),)
-                if key not in self._vc_sessions:
-                    self._vc_sessions[key] = {
-                        'start_time': now,
-                        'channel_name': after.channel.name,
-                    }
-            print(f"{LOG_VC} VCに参加: {member.name} → #{after.channel.name}")
-
-        # 退出
-        if before.channel and before.channel != after.channel:
-            game_a = self._get_game_name(member)
-            for other in before.channel.members:
-                if other.id == member.id:
-                    continue
-                key = tuple(sorted([str(member.id), str(other.id)])) + (str(before.channel.id),)
-                session = self._vc_sessions.pop(key, None)
-                if not session:
-                    continue
-                duration = int((now - session['start_time']).total_seconds())
-                id_a, id_b = sorted([str(member.id), str(other.id)])
-                game_b = self._get_game_name(other)
-                conn = sqlite3.connect(DB_PATH, timeout=10)
-                conn.execute('''
-                    INSERT INTO voice_co_sessions
-                    (user_id_a, user_id_b, channel_id, channel_name,
-                     game_name_a, game_name_b, start_time, end_time, duration)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    id_a, id_b, str(before.channel.id), session['channel_name'],
-                    game_a if id_a == str(member.id) else game_b,
-                    game_b if id_a == str(member.id) else game_a,
-                    session['start_time'].isoformat(), now.isoformat(), duration
-                ))
-                conn.commit()
-                conn.close()
-                print(f"{LOG_SAVE} VC共同セッション記録: {id_a}↔{id_b} ({duration}秒)")
+        if change.after:
+            self._voice_joins[change.user_id] = (change.after[0], change.after[1], change.at)
+            print(f"{LOG_VC} VCに参加: {change.user_name} → #{change.after[1]}")
+
+    def _schedule_overlaps(self):
+        """Fold new voice intervals into voice_co_overlaps after OVERLAP_DELAY (debounced)."""
+        if self._overlap_task is None:
+            self._overlap_task = asyncio.create_task(self._materialize_overlaps(OVERLAP_DELAY))
+            self._overlap_task.add_done_callback(log_task_errors('TrackerCog: VC共同参加の集計'))
+
+    async def _materialize_overlaps(self, delay: float = 0):
+        if delay:
+            await asyncio.sleep(delay)
+            # 集計の実行中に届いた退出は次の集計に回す
+            self._overlap_task = None
+        added = await self.storage.run(voice_overlap.materialize)
+        if added:
+            print(f"{LOG_SAVE} VC共同参加を集計: {added}件")
 
     # ── イベント: プレゼンス（Party ID） ──────────────
-    @commands.Cog.listener()
-    async def on_presence_update(self, before: discord.Member, after: discord.Member):
-        now = datetime.now()
-        before_parties, after_parties = {}, {}
-
-        for act in before.activities:
-            if act.type == discord.ActivityType.playing:
-                info = self._get_party_info(act)
-                if info and info['party_id']:
-                    before_parties[info['party_id']] = act
-
-        for act in after.activities:
-            if act.type == discord.ActivityType.playing:
-                info = self._get_party_info(act)
-                if info and info['party_id']:
-                    after_parties[info['party_id']] = act
-
-        for pid, act in after_parties.items():
-            if pid not in before_parties:
-                # 複数サーバー共通のユーザーの場合、重複してイベントが発火するためスキップ
-                if (pid, str(after.id)) in self._tracked_parties:
-                    continue
-                self._tracked_parties.add((pid, str(after.id)))
-
-                info = self._get_party_info(act)
-                size = info['size'] if info else [None, None]
-                conn = sqlite3.connect(DB_PATH, timeout=10)
-                conn.execute('''
-                    INSERT INTO party_sessions
-                    (party_id, user_id, game_name, party_size_current, party_size_max, joined_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (pid, str(after.id), act.name,
-                      size[0] if size else None,
-                      size[1] if size else None,
-                      now.isoformat()))
-                conn.commit()
-                conn.close()
-                print(f"{LOG_GAME} パーティ参加: {after.name} → {act.name} (party={pid})")
-
-        for pid in before_parties:
-            if pid not in after_parties:
-                self._tracked_parties.discard((pid, str(after.id)))
-                conn = sqlite3.connect(DB_PATH, timeout=10)
-                conn.execute('''
-                    UPDATE party_sessions SET left_at=?
-                    WHERE party_id=? AND user_id=? AND left_at IS NULL
-                ''', (now.isoformat(), pid, str(after.id)))
-                conn.commit()
-                conn.close()
+    def _on_presence_change(self, change: PresenceChange):
+        """Record party joins/leaves; called once per member transition by the presence dispatcher."""
+        for act in change.parties_joined:
+            size = act.party_size or (None, None)
+            self.storage.submit(PartyJoined(
+                act.party_id, str(change.user_id), act.name, size[0], size[1], change.at))
+            print(f"{LOG_GAME} パーティ参加: {change.user_name} → {act.name} (party={act.party_id})")
+
+        for act in change.parties_left:
+            self.storage.submit(PartyLeft(act.party_id, str(change.user_id), change.at))
 
     # ── イベント: メンション ───────────────────────────
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author.bot or not message.mentions:
             return
-        now = datetime.now().isoformat()
-        conn = sqlite3.connect(DB_PATH, timeout=10)
+        now = datetime.now()
         for mentioned in message.mentions:
             if mentioned.bot or mentioned.id == message.author.id:
                 continue
-            conn.execute('''
-                INSERT INTO mention_logs (from_user_id, to_user_id, channel_id, timestamp)
-                VALUES (?, ?, ?, ?)
-            ''', (str(message.author.id), str(mentioned.id), str(message.channel.id), now))
+            self.storage.submit(MentionLogged(
+                str(message.author.id), str(mentioned.id), str(message.channel.id), now))
             print(f"{LOG_MENTION} メンション記録: {message.author.name} → {mentioned.name}")
-        conn.commit()
-        conn.close()
 
     # ── デバッグコマンド ───────────────────────────────
     @commands.command(name='status')
     async def check_status(self, ctx):
-        """全メンバーのステータスをチェック"""
-        lines = ["サーバーメンバーのステータス:\n```"]
+        """キャッシュ中のメンバーのステータスをチェック（BOT_MEMBER_CACHE=active ではVC・プレイ中の人のみ）"""
+        lines = [f"サーバーメンバーのステータス（キャッシュ中 {len(ctx.guild.members)}人"
+                 f" / 全 {ctx.guild.member_count}人）:\n```"]
         for member in ctx.guild.members:
             lines.append(f"{member.name}: {member.status}")
             if member.activity:
@@ -262,6 +214,38 @@ class TrackerCog(commands.Cog, name='Tracker'):
         lines.append("```")
         await ctx.send('\n'.join(lines))
 
+    @commands.command(name='queuestats')
+    async def queue_stats(self, ctx):
+        """書き込みキューの状態を確認"""
+        st = self.storage.stats()
+        lines = ["書き込みキュー:\n```",
+                 f"待機中: {st['depth']} / 上限 {st['max_pending']} (最大 {st['peak_depth']})",
+                 f"受付: {st['submitted']} / 書き込み済み: {st['committed']} / 破棄: {st['dropped']}",
+                 f"コミット遅延: 直近 {st['last_lag'] * 1000:.0f}ms / 最大 {st['max_lag'] * 1000:.0f}ms",
+                 "```"]
+        await ctx.send('\n'.join(lines))
+
+    @commands.command(name='presencestats')
+    async def presence_stats(self, ctx):
+        """プレゼンス更新の受信数と処理数を確認"""
+        st = get_presence().stats()
+        lines = ["プレゼンス更新:\n```",
+                 f"受信: {st['received']} / 処理: {st['processed']} (スキップ {st['short_circuited']})",
+                 f"毎秒: 受信 {st['received_per_s']:.1f} / 処理 {st['processed_per_s']:.1f}",
+                 f"追跡中のメンバー: {st['members']}人"]
+        rs = get_resync().stats()
+        if rs['runs']:
+            lines.append(f"直近の{rs['kind']}: {rs['members']}人 / {rs['seconds'] * 1000:.0f}ms "
+                         f"(ゲーム +{rs['games_started']}/-{rs['games_stopped']}, "
+                         f"パーティ +{rs['parties_joined']}/-{rs['parties_left']}, "
+                         f"VC +{rs['voice_joined']}/-{rs['voice_left']}) / 計{rs['runs']}回")
+        mc = get_member_cache().stats()
+        if mc['mode'] == 'active':
+            lines.append(f"メンバーキャッシュ: {mc['cached']}人 (取得 {mc['fetched']}人 / "
+                         f"リクエスト {mc['requests']}回 / 未キャッシュのプレゼンス {mc['raw_received']}件)")
+        lines.append("```")
+        await ctx.send('\n'.join(lines))
+
     @commands.command(name='whoami')
     async def whoami(self, ctx):
         """自分の現在の状態を確認"""
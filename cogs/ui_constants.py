@@ -17,3 +17,4 @@ LOG_SAVE = "[SAVE]"      # 旧: 💾
 LOG_CLEAN = "[CLEAN]"    # 旧: 🧹
 LOG_STOP = "[STOP]"      # 旧: 🛑
 LOG_MENTION = "[MENTION]"  # 旧: 📢
+LOG_PERF = "[PERF]"      # コマンド処理時間
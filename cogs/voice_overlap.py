@@ -0,0 +1,120 @@
+"""Voice overlap: pairwise voice co-presence derived from per-member intervals.
+
+TrackerCog records one voice_intervals row per member stay (channel, join,
+leave). `materialize` folds intervals added since the last run into
+voice_co_overlaps (one row per pair and shared stay, the shape the old
+voice_co_sessions table had) with a sweep line per channel, so a busy
+channel costs O(n log n + overlapping pairs) per run instead of a pair
+entry per member in memory and a row per remaining member on every leave.
+
+Each pair is emitted exactly once: by whichever of its two intervals has
+the higher id, when that interval is past the watermark. Intervals are
+only inserted once closed, so nothing is revisited.
+"""
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+from typing import Iterable, Iterator, NamedTuple
+
+from cogs.schema import UPSERT_VOICE_PAIR_TOTAL
+
+
+class Interval(NamedTuple):
+    id: int
+    user_id: str
+    channel_id: str
+    channel_name: str | None
+    game_name: str | None
+    join_epoch: int
+    leave_epoch: int
+
+
+_NEW_INTERVALS = '''
+    SELECT id, user_id, channel_id, channel_name, game_name, join_epoch, leave_epoch
+    FROM voice_intervals WHERE id > ?
+    ORDER BY channel_id, id
+'''
+# Everything in the channel that can overlap [lo, hi), up to the newest interval of this run
+_CHANNEL_WINDOW = '''
+    SELECT id, user_id, channel_id, channel_name, game_name, join_epoch, leave_epoch
+    FROM voice_intervals
+    WHERE channel_id = ? AND leave_epoch > ? AND join_epoch < ? AND id <= ?
+'''
+_INSERT_OVERLAP = '''
+    INSERT INTO voice_co_overlaps
+    (user_id_a, user_id_b, channel_id, channel_name,
+     game_name_a, game_name_b, start_time, end_time, duration)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def sweep_overlaps(intervals: Iterable[Interval],
+                   after_id: int) -> Iterator[tuple[Interval, Interval, int, int]]:
+    """(i, j, start, end) for each overlapping pair of different users in one channel.
+
+    Only pairs where at least one interval has id > `after_id` are yielded.
+    Intervals that merely touch (one leaves as the other joins) do not overlap.
+    """
+    points = []
+    for iv in intervals:
+        if iv.leave_epoch > iv.join_epoch:
+            points.append((iv.join_epoch, 1, iv))
+            points.append((iv.leave_epoch, 0, iv))
+    # Leaves sort before joins at the same second
+    points.sort(key=lambda p: (p[0], p[1], p[2].id))
+
+    active: dict[int, Interval] = {}
+    for t, is_join, iv in points:
+        if not is_join:
+            del active[iv.id]
+            continue
+        for other in active.values():
+            if other.user_id == iv.user_id or max(iv.id, other.id) <= after_id:
+                continue
+            end = min(iv.leave_epoch, other.leave_epoch)
+            if end > t:
+                yield iv, other, t, end
+        active[iv.id] = iv
+
+
+def _overlap_row(i: Interval, j: Interval, start: int, end: int) -> tuple:
+    if j.user_id < i.user_id:
+        i, j = j, i
+    return (i.user_id, j.user_id, i.channel_id, i.channel_name or j.channel_name,
+            i.game_name, j.game_name,
+            datetime.fromtimestamp(start).isoformat(), datetime.fromtimestamp(end).isoformat(),
+            end - start)
+
+
+def materialize(conn: sqlite3.Connection) -> int:
+    """Add voice_co_overlaps rows for intervals past the watermark (writer thread).
+
+    Also folds them into voice_pair_totals, one upsert per pair. Returns the
+    number of pair rows written.
+    """
+    after_id = conn.execute('SELECT last_interval_id FROM voice_overlap_watermark').fetchone()[0]
+    new = [Interval._make(r) for r in conn.execute(_NEW_INTERVALS, (after_id,))]
+    if not new:
+        return 0
+    newest = max(iv.id for iv in new)
+
+    written = 0
+    totals: dict[tuple[str, str], list] = {}
+    for channel_id, group in groupby(new, key=lambda iv: iv.channel_id):
+        group = list(group)
+        lo = min(iv.join_epoch for iv in group)
+        hi = max(iv.leave_epoch for iv in group)
+        window = [Interval._make(r) for r in conn.execute(
+            _CHANNEL_WINDOW, (channel_id, lo, hi, newest))]
+        rows = [_overlap_row(*pair) for pair in sweep_overlaps(window, after_id)]
+        conn.executemany(_INSERT_OVERLAP, rows)
+        written += len(rows)
+        for row in rows:
+            total = totals.setdefault((row[0], row[1]), [0, row[7]])
+            total[0] += row[8]
+            total[1] = max(total[1], row[7])
+
+    conn.executemany(UPSERT_VOICE_PAIR_TOTAL,
+                     [(lo, hi, secs, last) for (lo, hi), (secs, last) in totals.items()])
+    conn.execute('UPDATE voice_overlap_watermark SET last_interval_id=?', (newest,))
+    return written
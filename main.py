@@ -1,8 +1,11 @@
 import os
+import sys
 import asyncio
+import importlib
+import signal
+import subprocess
+import time
 from dotenv import load_dotenv
-import discord
-from discord.ext import commands
 import builtins
 from datetime import datetime
 
@@ -35,25 +38,81 @@ def load_token() -> str:
         "開発環境: .env に DISCORD_TOKEN を設定してください。"
     )
 
-# 各機能モジュールをCogとしてインポート
-from cogs.tracker_cog   import TrackerCog    # VC・Party・メンション収集
-from cogs.history_cog   import HistoryCog    # ゲームセッション記録・!history etc
-from cogs.recommender_cog import RecommenderCog  # !similar / !recommend
-from cogs.calendar_cog  import CalendarCog   # !calendar
-from cogs.profile_cog   import ProfileCog    # !profile
+# 各機能モジュール（Cog）。描画ワーカーは spawn でこのファイルを再読み込みするため、
+# Cog（discord / NumPy など）は main() の中で読み込む
+COGS = (
+    ('cogs.tracker_cog',     'TrackerCog'),      # VC・Party・メンション収集
+    ('cogs.history_cog',     'HistoryCog'),      # ゲームセッション記録・!history etc
+    ('cogs.recommender_cog', 'RecommenderCog'),  # !similar / !recommend
+    ('cogs.calendar_cog',    'CalendarCog'),     # !calendar
+    ('cogs.profile_cog',     'ProfileCog'),      # !profile
+)
+from cogs.executor      import shutdown_executor
+from cogs.render        import shutdown_renderer
+from cogs.storage       import get_storage
+
+
+def load_cogs() -> list:
+    """Cog クラスを COGS の順に読み込んで返す"""
+    return [getattr(importlib.import_module(module), name) for module, name in COGS]
+
+
+def profile_startup(top: int = 15):
+    """python main.py --profile-startup: Cog 読み込みの時間をモジュール別に表示する
+
+    -X importtime を付けた子プロセスで COGS のモジュールだけを読み込み、その出力を集計する。
+    """
+    imports = '; '.join(f'import {module}' for module, _ in COGS)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         f'import time; t = time.perf_counter(); {imports}; print(time.perf_counter() - t)'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        print(proc.stderr)
+        return
+
+    cog_modules = {module for module, _ in COGS}
+    per_cog, per_package = {}, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        if module in cog_modules and module not in per_cog:
+            per_cog[module] = int(cumulative_us) / 1000
+        package = 'cogs' if module.startswith('cogs') else module.split('.')[0]
+        per_package[package] = per_package.get(package, 0) + int(self_us) / 1000
+
+    total = float(proc.stdout.split()[-1]) * 1000
+    print(f"Cog 読み込み合計: {total:.0f}ms")
+    print("Cog 別（累積。先に読んだ Cog が共有ライブラリの分を含む）:")
+    for module, _ in COGS:
+        print(f"  {module:<24} {per_cog.get(module, 0):>8.1f}ms")
+    print(f"パッケージ別（自身の import 時間の合計, 上位 {top}）:")
+    for package, ms in sorted(per_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {package:<24} {ms:>8.1f}ms")
 
 async def main():
     TOKEN = load_token()
 
+    # discord も描画ワーカーには不要なので、ここで読み込む
+    import discord
+    from discord.ext import commands
+
+    from cogs.member_cache import cache_mode, client_options
+
     intents = discord.Intents.all()
-    bot = commands.Bot(command_prefix='!', intents=intents)
+    # 大規模サーバーではメンバーのキャッシュが RSS の大半を占めるため、BOT_MEMBER_CACHE で方針を選ぶ
+    options = client_options(intents)
+    bot = commands.Bot(command_prefix='!', intents=intents, **options)
+    print(f"メンバーキャッシュ: {cache_mode()}"
+          f"（起動時チャンク: {'あり' if options['chunk_guilds_at_startup'] else 'なし'}）")
 
     # 全機能を1つのBotにCogとして追加
-    await bot.add_cog(TrackerCog(bot))
-    await bot.add_cog(HistoryCog(bot))
-    await bot.add_cog(RecommenderCog(bot))
-    await bot.add_cog(CalendarCog(bot))
-    await bot.add_cog(ProfileCog(bot))
+    started = time.perf_counter()
+    for cog in load_cogs():
+        await bot.add_cog(cog(bot))
+    print(f"Cog 読み込み完了 ({(time.perf_counter() - started) * 1000:.0f}ms)")
 
     @bot.event
     async def on_ready():
@@ -64,9 +123,27 @@ async def main():
         print('\n📡 収集中: VC共同参加 / パーティプレイ / メンション')
         print('💬 コマンド: !calendar / !similar / !recommend / !mygames / !profile')
 
-    await bot.start(TOKEN)
+    # docker service update は SIGTERM を送るため、bot.close() 経由で各Cogの
+    # cog_unload（書き込みキューのフラッシュ）を実行してから終了する
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:  # Windows
+        pass
+
+    try:
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        # Cog の終了処理が失敗しても、書き込みキューは必ず空にしてから終了する
+        await get_storage().shutdown()
+        shutdown_renderer()
+        shutdown_executor()
 
 if __name__ == "__main__":
+    if '--profile-startup' in sys.argv[1:]:
+        profile_startup()
+        sys.exit()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,35 @@
+"""
+VC通話時間のペア集計（voice_pair_totals）の一括再構築スクリプト
+voice_co_overlaps（旧 voice_co_sessions）の全行からペアごとの累計秒数と最終日時を集計し直す。
+Bot の停止中に実行する（通常はマイグレーション時に自動で作られるため、手動で行を編集した場合などに使う）。
+使い方: python3 scripts/backfill_voice_pair_totals.py [DBパス]
+"""
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.schema import apply_migrations, rebuild_voice_pair_totals  # noqa: E402
+from cogs.storage import DB_PATH  # noqa: E402
+
+
+def backfill(db_path: str = DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        apply_migrations(conn)
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='voice_pair_totals'").fetchone():
+            raise SystemExit(f"{db_path} にVCのテーブルがありません（Bot を一度起動してください）")
+        t0 = time.perf_counter()
+        with conn:
+            pairs = rebuild_voice_pair_totals(conn)
+        total = conn.execute('SELECT COALESCE(SUM(total_seconds), 0) FROM voice_pair_totals').fetchone()[0]
+    finally:
+        conn.close()
+    print(f"✅ voice_pair_totals: {pairs}ペア / 合計{total / 3600:.1f}h "
+          f"({(time.perf_counter() - t0) * 1000:.0f}ms)")
+
+
+if __name__ == '__main__':
+    backfill(*sys.argv[1:2])
@@ -0,0 +1,49 @@
+"""
+ベンチマーク: カレンダー画像1枚の描画時間（フォント・背景グリッドのキャッシュ有無）
+キャッシュなし（毎回フォント読み込み + グリッド描画 = 従来の動作）と、
+キャッシュあり（背景テンプレートを貼り付けて動的部分のみ描画）を比較する。
+使い方: python3 scripts/bench_calendar_render.py [回数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs import calendar_render  # noqa: E402
+from scripts.bench_render import make_week  # noqa: E402
+
+ROUNDS = 30
+
+
+def timed(rounds: int, args, cold: bool):
+    draw_s, png_s = 0.0, 0.0
+    for _ in range(rounds):
+        if cold:
+            calendar_render.load_fonts.cache_clear()
+            calendar_render._BACKGROUNDS.clear()
+        t0 = time.perf_counter()
+        img = calendar_render.generate_image(*args)
+        t1 = time.perf_counter()
+        img.save(os.devnull, 'PNG')
+        draw_s += t1 - t0
+        png_s += time.perf_counter() - t1
+    return draw_s / rounds, png_s / rounds
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    args = make_week()
+    cold = timed(rounds, args, cold=True)
+    calendar_render.generate_image(*args)
+    warm = timed(rounds, args, cold=False)
+
+    print(f"{len(args[0])} sessions, mean of {rounds} renders")
+    print(f"{'':<22} {'draw':>8} {'PNG':>8} {'total':>8}")
+    for label, (draw_s, png_s) in (('no cache (before)', cold), ('cached fonts + grid', warm)):
+        print(f"{label:<22} {draw_s*1000:>6.1f}ms {png_s*1000:>6.1f}ms "
+              f"{(draw_s + png_s)*1000:>6.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+ベンチマーク: ゲーム埋め込みの読み込み（起動時間とメモリ）
+旧実装（import 時に pickle を読み込んで中心化）と EmbeddingStore（.npy のメモリマップ、
+初回利用時に読み込み）を、それぞれ別プロセスで計測する。
+合成データ（タイトル数 x 次元）を一時ディレクトリに生成して使う。
+使い方: python3 scripts/bench_embedding_startup.py [タイトル数] [次元]
+"""
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scripts.convert_embeddings import convert  # noqa: E402
+
+N_TITLES = 50_000
+DIM = 384
+LOOKUPS = 2_000
+
+_PRELUDE = '''
+import json, os, sys, time
+t0 = time.perf_counter()
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+'''
+
+# Same steps the recommender used to run at import time
+_LEGACY = _PRELUDE + '''
+import pickle
+import numpy as np
+with open('data/game_embeddings.pkl', 'rb') as f:
+    raw = pickle.load(f)
+names = list(raw)
+mat = np.asarray([raw[g] for g in names], dtype=np.float64)
+mat -= mat.mean(axis=0)
+norms = np.linalg.norm(mat, axis=1, keepdims=True)
+norms[norms == 0] = 1.0
+matrix = np.ascontiguousarray(mat / norms, dtype=np.float32)
+index = {g: i for i, g in enumerate(names)}
+del raw, mat, norms
+startup, rss_start = time.perf_counter() - t0, rss_mb()
+games = json.loads(sys.argv[1])
+t1 = time.perf_counter()
+rows = np.array([index[g] for g in games])
+embs = matrix[rows]
+print(json.dumps([startup, rss_start, time.perf_counter() - t1, rss_mb()]))
+'''
+
+_STORE = _PRELUDE + '''
+from cogs.embedding_store import EmbeddingStore
+store = EmbeddingStore()
+startup, rss_start = time.perf_counter() - t0, rss_mb()
+games = json.loads(sys.argv[1])
+t1 = time.perf_counter()
+embs, has_emb = store.game_matrix(games)
+print(json.dumps([startup, rss_start, time.perf_counter() - t1, rss_mb()]))
+'''
+
+
+def make_data(data_dir: str, n_titles: int, dim: int):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n_titles, dim)).astype(np.float32) + 0.5
+    raw = {f'Game {i:06d}': vectors[i] for i in range(n_titles)}
+    with open(os.path.join(data_dir, 'game_embeddings.pkl'), 'wb') as f:
+        pickle.dump(raw, f)
+
+
+def run(code: str, cwd: str, games: list[str]):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, '-c', code, json.dumps(games)],
+                         cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    n_titles = int(sys.argv[1]) if len(sys.argv) > 1 else N_TITLES
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else DIM
+    games = [f'Game {i:06d}' for i in np.random.default_rng(1).choice(
+        n_titles, size=min(LOOKUPS, n_titles), replace=False)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, 'data')
+        os.makedirs(data_dir)
+        make_data(data_dir, n_titles, dim)
+        results = [('legacy pkl at import', run(_LEGACY, tmp, games)),
+                   ('store, pkl fallback', run(_STORE, tmp, games))]
+        convert(os.path.join(data_dir, 'game_embeddings.pkl'),
+                os.path.join(data_dir, 'game_embeddings.npy'))
+        results.append(('store, mmap .npy', run(_STORE, tmp, games)))
+
+    print(f"{n_titles} titles x {dim} dims, first lookup of {len(games)} titles")
+    print(f"{'':<22} {'startup':>9} {'RSS':>9} {'1st use':>9} {'RSS after':>10}")
+    for label, (startup, rss_start, first_use, rss_after) in results:
+        print(f"{label:<22} {startup*1000:>7.0f}ms {rss_start:>7.0f}MB "
+              f"{first_use*1000:>7.0f}ms {rss_after:>8.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+ベンチマーク: 書き込みキュー（Storage.submit）のイベント投入コストと背圧
+メンション記録をバースト投入し、リスナー側の 1 件あたりの処理時間、
+キューの最大深さ・破棄数・コミット遅延、終了時に全件が書き込まれたかを確認する。
+使い方: python3 scripts/bench_event_queue.py [イベント数] [キュー上限]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.events import MentionLogged  # noqa: E402
+from cogs.storage import Storage  # noqa: E402
+
+EVENTS = 100_000
+MAX_PENDING = 10_000
+BURST = 2_000
+
+
+async def run(path: str, n: int, max_pending: int):
+    storage = Storage(db_path=path, max_pending=max_pending)
+    await storage.open()
+    now = datetime.now()
+    spent = 0.0
+    for start in range(0, n, BURST):
+        t0 = time.perf_counter()
+        for i in range(start, min(n, start + BURST)):
+            storage.submit(MentionLogged(str(i % 500), str(i % 97), '1', now))
+        spent += time.perf_counter() - t0
+        # 次のゲートウェイイベントまでの間だけループを譲る
+        await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    await storage.shutdown()
+    drain = time.perf_counter() - t0
+    return storage.stats(), spent, drain
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    max_pending = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_PENDING
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        conn.execute('''CREATE TABLE mention_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id TEXT NOT NULL, to_user_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL, timestamp TEXT NOT NULL
+        )''')
+        conn.commit()
+        st, spent, drain = asyncio.run(run(path, n, max_pending))
+        rows = conn.execute('SELECT COUNT(*) FROM mention_logs').fetchone()[0]
+        conn.close()
+
+    print(f"{n} events in bursts of {BURST}, queue limit {max_pending}")
+    print(f"submit cost        {spent / n * 1e6:.2f}us / event")
+    print(f"peak depth         {st['peak_depth']}")
+    print(f"dropped            {st['dropped']}")
+    print(f"max commit lag     {st['max_lag'] * 1000:.0f}ms")
+    print(f"shutdown drain     {drain * 1000:.0f}ms")
+    print(f"rows written       {rows} (expected {n - st['dropped']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+ベンチマーク: メンバーキャッシュの方針（BOT_MEMBER_CACHE=all vs active）
+discord.py の ConnectionState に合成した大規模ギルドのゲートウェイイベント（READY, GUILD_CREATE,
+GUILD_MEMBERS_CHUNK）を流し、on_ready までの時間・チャンク数・キャッシュされたメンバー数・RSS 増分を比べる。
+active では on_ready の後に cogs.member_cache が追跡中のメンバー（開いたままのセッション）を取得する分も含める。
+ネットワークは使わない。チャンク1つあたりの往復時間は引数で与える（既定 0 = CPU 時間のみ）。
+各方式を別プロセスで実行する。
+使い方: python3 scripts/bench_member_cache.py [メンバー数] [チャンク1つあたりの遅延秒]
+"""
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MEMBERS = 100_000
+PLAYING = 0.03
+IN_VOICE = 0.005
+GUILD_ID = 1 << 40
+BOT_ID = 1
+GAMES = ['Apex Legends', 'VALORANT', 'Minecraft', 'Overwatch 2', 'Fortnite']
+
+
+def _rss_mb() -> float:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _member(uid: int) -> dict:
+    return {'user': {'id': str(uid), 'username': f"user{uid}", 'global_name': f"User {uid}",
+                     'discriminator': '0', 'avatar': None, 'bot': False},
+            'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False,
+            'nick': None, 'flags': 0}
+
+
+def _presence(uid: int, game: str) -> dict:
+    return {'user': {'id': str(uid)}, 'guild_id': str(GUILD_ID), 'status': 'online',
+            'client_status': {'desktop': 'online'},
+            'activities': [{'type': 0, 'name': game, 'created_at': 0}]}
+
+
+class SyntheticGuild:
+    def __init__(self, n_members: int, seed: int = 1):
+        rng = random.Random(seed)
+        ids = range(BOT_ID + 1, BOT_ID + 1 + n_members)
+        self.ids = list(ids)
+        self.playing = {uid: rng.choice(GAMES) for uid in rng.sample(self.ids, int(n_members * PLAYING))}
+        self.voice = rng.sample(self.ids, int(n_members * IN_VOICE))
+        self.channel_id = GUILD_ID + 1
+
+    def guild_create(self) -> dict:
+        """Large guild: Discord only sends members in voice (and the bot) with GUILD_CREATE."""
+        return {
+            'id': str(GUILD_ID), 'name': 'synthetic', 'large': True, 'member_count': len(self.ids) + 1,
+            'unavailable': False, 'owner_id': str(BOT_ID), 'features': [], 'emojis': [], 'stickers': [],
+            'roles': [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                       'color': 0, 'hoist': False, 'managed': False, 'mentionable': False, 'flags': 0}],
+            'channels': [{'id': str(self.channel_id), 'type': 2, 'name': 'vc', 'position': 0,
+                          'permission_overwrites': [], 'bitrate': 64000, 'user_limit': 0}],
+            'voice_states': [{'user_id': str(uid), 'channel_id': str(self.channel_id),
+                              'session_id': 's', 'deaf': False, 'mute': False, 'self_deaf': False,
+                              'self_mute': False, 'self_video': False, 'suppress': False,
+                              'request_to_speak_timestamp': None} for uid in self.voice],
+            'members': [_member(BOT_ID)] + [_member(uid) for uid in self.voice],
+            'presences': [_presence(uid, game) for uid, game in self.playing.items()],
+            'threads': [], 'stage_instances': [], 'guild_scheduled_events': [], 'soundboard_sounds': [],
+        }
+
+
+class FakeGateway:
+    """Answers Request Guild Members with GUILD_MEMBERS_CHUNK events, 1000 members each."""
+
+    open = False  # Client.close() では閉じる接続がない
+
+    def __init__(self, state, guild: SyntheticGuild, latency: float):
+        self.state = state
+        self.guild = guild
+        self.known = set(guild.ids)
+        self.latency = latency
+        self.chunks = 0
+        self.requests = 0
+
+    async def request_chunks(self, guild_id, query=None, *, limit, user_ids=None, presences=False, nonce=None):
+        self.requests += 1
+        ids = self.guild.ids if user_ids is None else [uid for uid in user_ids if uid in self.known]
+        asyncio.get_running_loop().create_task(self._send(guild_id, ids, presences, nonce))
+
+    async def _send(self, guild_id, ids, presences, nonce):
+        count = max(1, (len(ids) + 999) // 1000)
+        for index in range(count):
+            await asyncio.sleep(self.latency)
+            part = ids[index * 1000:(index + 1) * 1000]
+            data = {'guild_id': str(guild_id), 'members': [_member(uid) for uid in part],
+                    'chunk_index': index, 'chunk_count': count, 'nonce': nonce}
+            if presences:
+                data['presences'] = [_presence(uid, self.guild.playing[uid])
+                                     for uid in part if uid in self.guild.playing]
+            self.chunks += 1
+            self.state.parse_guild_members_chunk(data)
+
+
+async def child_async(mode: str, n_members: int, latency: float):
+    os.environ['BOT_MEMBER_CACHE'] = mode
+    import discord
+    from cogs.member_cache import client_options, get_member_cache
+
+    guild = SyntheticGuild(n_members)
+    gc.collect()
+    rss0 = _rss_mb()
+
+    intents = discord.Intents.all()
+    client = discord.Client(intents=intents, guild_ready_timeout=0.01, **client_options(intents))
+    ready = asyncio.Event()
+
+    @client.event
+    async def on_ready():
+        ready.set()
+
+    async with client:
+        state = client._connection
+        client.ws = gateway = FakeGateway(state, guild, latency)
+        t0 = time.perf_counter()
+        state.parse_ready({'user': {'id': str(BOT_ID), 'username': 'bot', 'discriminator': '0',
+                                    'avatar': None, 'bot': True},
+                           'guilds': [{'id': str(GUILD_ID), 'unavailable': True}],
+                           'session_id': 'bench', 'application': {'id': str(BOT_ID), 'flags': 0}})
+        state.parse_guild_create(guild.guild_create())
+        await ready.wait()
+        t_ready = time.perf_counter() - t0
+        # active: ResyncEngine が最初の走査の前に、開いたままのセッションのメンバーを取得する
+        fetched = await get_member_cache().prefetch(client, guild.playing) if mode == 'active' else 0
+        t_tracked = time.perf_counter() - t0
+
+        g = client.get_guild(GUILD_ID)
+        playing_seen = sum(1 for m in g.members
+                           if any(a.type == discord.ActivityType.playing for a in m.activities))
+        gc.collect()
+        print(json.dumps({'ready': t_ready, 'tracked': t_tracked, 'chunks': gateway.chunks,
+                          'requests': gateway.requests, 'cached': len(g.members), 'fetched': fetched,
+                          'playing_seen': playing_seen, 'rss': _rss_mb() - rss0}))
+
+
+def main():
+    n_members = int(sys.argv[1]) if len(sys.argv) > 1 else MEMBERS
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    guild = SyntheticGuild(n_members)
+    print(f"{n_members} members, {len(guild.playing)} playing, {len(guild.voice)} in voice, "
+          f"{latency * 1000:.0f}ms per chunk, one fresh process per mode")
+    print(f"{'':<8} {'on_ready':>9} {'+tracked':>9} {'chunks':>7} {'requests':>9} {'cached':>8} "
+          f"{'playing':>8} {'+RSS':>8}")
+    for mode in ('all', 'active'):
+        proc = subprocess.run([sys.executable, __file__, '--child', mode, str(n_members), str(latency)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{mode:<8} failed: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{mode:<8} {r['ready'] * 1000:>7.0f}ms {r['tracked'] * 1000:>7.0f}ms {r['chunks']:>7} "
+              f"{r['requests']:>9} {r['cached']:>8} {r['playing_seen']:>8} {r['rss']:>6.1f}MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        asyncio.run(child_async(sys.argv[2], int(sys.argv[3]), float(sys.argv[4])))
+    else:
+        main()
@@ -0,0 +1,110 @@
+"""
+ベンチマーク: 起動時のパーティ照合（候補ごとの SELECT + 1 件ずつ INSERT vs 一括読み込み + executemany）
+過去のパーティ行と前回の異常終了で開いたままの行が残る DB に対して、
+キャッシュ済みメンバーのうちパーティ参加中の候補を照合する時間を比較する。
+使い方: python3 scripts/bench_party_reconcile.py [候補数] [過去の行数]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.events import PartyJoined  # noqa: E402
+from cogs.schema import _m006_open_party_index  # noqa: E402
+from cogs.tracker_cog import TrackerCog  # noqa: E402
+
+CANDIDATES = 2_000
+HISTORY = 50_000
+# 前回から開いたまま残っている行のうち、今もパーティにいる割合
+STILL_IN_PARTY = 0.5
+
+
+def make_db(path: str, n_candidates: int, n_history: int, seed: int = 1):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE party_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        party_id TEXT NOT NULL, user_id TEXT NOT NULL, game_name TEXT NOT NULL,
+        party_size_current INTEGER, party_size_max INTEGER,
+        joined_at TEXT NOT NULL, left_at TEXT
+    )''')
+    past = datetime.now() - timedelta(days=30)
+    conn.executemany(
+        'INSERT INTO party_sessions (party_id, user_id, game_name, party_size_current, '
+        'party_size_max, joined_at, left_at) VALUES (?, ?, ?, 2, 4, ?, ?)',
+        ((f"old{i}", str(rng.randrange(20_000)), 'Game', past.isoformat(),
+          (past + timedelta(hours=1)).isoformat()) for i in range(n_history)))
+    candidates = {(f"party{i // 3}", str(i)): ('Game', (2, 4))
+                  for i in range(n_candidates)}
+    # 異常終了で開いたまま残った行: 半分は今もパーティ中、残りは既に抜けている
+    stale = [(pid, uid) for pid, uid in candidates if rng.random() < STILL_IN_PARTY]
+    stale += [(f"gone{i}", str(i)) for i in range(len(stale))]
+    conn.executemany(
+        'INSERT INTO party_sessions (party_id, user_id, game_name, joined_at) VALUES (?, ?, ?, ?)',
+        ((pid, uid, 'Game', past.isoformat()) for pid, uid in stale))
+    conn.commit()
+    conn.close()
+    return candidates
+
+
+def legacy_restore(candidates: dict, now: datetime, conn: sqlite3.Connection):
+    """以前の TrackerCog._restore_parties"""
+    cur = conn.cursor()
+    for (pid, user_id), (game_name, size) in candidates.items():
+        cur.execute("SELECT 1 FROM party_sessions WHERE party_id=? AND user_id=? AND left_at IS NULL",
+                    (pid, user_id))
+        if not cur.fetchone():
+            PartyJoined(pid, user_id, game_name, size[0], size[1], now).apply(conn)
+
+
+def timed(path: str, restore, candidates: dict):
+    conn = sqlite3.connect(path)
+    t0 = time.perf_counter()
+    restore(candidates, datetime.now(), conn)
+    conn.commit()
+    elapsed = time.perf_counter() - t0
+    open_rows = sorted(conn.execute(
+        'SELECT party_id, user_id FROM party_sessions WHERE left_at IS NULL'))
+    conn.close()
+    return elapsed, open_rows
+
+
+def main():
+    n_candidates = int(sys.argv[1]) if len(sys.argv) > 1 else CANDIDATES
+    n_history = int(sys.argv[2]) if len(sys.argv) > 2 else HISTORY
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'base.db')
+        candidates = make_db(base, n_candidates, n_history)
+        legacy_db, indexed_db, bulk_db = (os.path.join(tmp, f"{name}.db")
+                                          for name in ('legacy', 'indexed', 'bulk'))
+        for path in (legacy_db, indexed_db, bulk_db):
+            shutil.copy(base, path)
+        for path in (indexed_db, bulk_db):
+            conn = sqlite3.connect(path)
+            _m006_open_party_index(conn)
+            conn.commit()
+            conn.close()
+
+        t_legacy, legacy_open = timed(legacy_db, legacy_restore, candidates)
+        t_indexed, _ = timed(indexed_db, legacy_restore, candidates)
+        t_bulk, bulk_open = timed(
+            bulk_db, lambda c, now, conn: TrackerCog._restore_parties(None, c, now, conn), candidates)
+
+    expected = sorted(candidates)
+    print(f"{n_candidates} party candidates, {n_history} closed rows")
+    print(f"per-candidate SELECT  {t_legacy * 1000:>8.1f}ms  "
+          f"open rows {len(legacy_open)} (stale left open: {len(legacy_open) - len(expected)})")
+    print(f"  + open-row index    {t_indexed * 1000:>8.1f}ms  (stale rows still left open)")
+    print(f"bulk + executemany    {t_bulk * 1000:>8.1f}ms  "
+          f"open rows {len(bulk_open)}  ({t_legacy / t_bulk:.0f}x)")
+    print(f"open rows match current parties: {bulk_open == expected}")
+
+
+if __name__ == '__main__':
+    main()
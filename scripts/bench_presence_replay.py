@@ -0,0 +1,232 @@
+"""
+ベンチマーク: プレゼンス更新のリプレイ（旧リスナー vs cogs.presence の早期スキップ）
+ステータス変更・Spotify の曲変更・details 変更・ゲーム開始/終了・パーティ変更を混ぜた
+合成トレースを、共通ギルド数ぶん重複させて流し、スキップされた件数と処理時間を比較する。
+使い方: python3 scripts/bench_presence_replay.py [イベント数] [メンバー数]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.presence import PresenceChange, PresenceDispatcher  # noqa: E402
+
+EVENTS = 100_000
+MEMBERS = 2_000
+GAMES = ['Apex Legends', 'VALORANT', 'Minecraft', 'League of Legends', 'Overwatch 2',
+         'Fortnite', 'Monster Hunter', 'Splatoon 3', 'Rust', 'Terraria']
+# (種類, 重み): 実運用のゲートウェイ観測に近い比率
+KINDS = [('status', 35), ('spotify', 25), ('details', 25), ('game', 10), ('party', 5)]
+# 共通ギルド数の分布
+FANOUT = [(1, 60), (2, 30), (3, 10)]
+# この件数ごとにループを譲ってリスナーの Task を実行させる
+BURST = 500
+
+
+class Member(SimpleNamespace):
+    pass
+
+
+def _pick(rng, weighted):
+    return rng.choices([k for k, _ in weighted], [w for _, w in weighted])[0]
+
+
+def _game(name, details, party):
+    return discord.Activity(type=discord.ActivityType.playing, name=name, details=details,
+                            party={'id': party, 'size': [2, 4]} if party else {})
+
+
+def make_trace(n: int, n_members: int, seed: int = 1):
+    """[(kind, before, after, fanout)]; before/after are the member as each guild sees it."""
+    rng = random.Random(seed)
+    state = {uid: {'status': 'online', 'game': rng.choice(GAMES + [None] * 5),
+                   'details': 'In Lobby', 'party': None, 'track': 0}
+             for uid in range(n_members)}
+    fanout = {uid: _pick(rng, FANOUT) for uid in range(n_members)}
+
+    def member(uid):
+        s = state[uid]
+        acts = [discord.Activity(type=discord.ActivityType.listening, name='Spotify',
+                                 details=f"track {s['track']}")]
+        if s['game']:
+            acts.append(_game(s['game'], s['details'], s['party']))
+        return Member(id=uid, name=f"user{uid}", status=s['status'], activities=tuple(acts))
+
+    trace = []
+    while len(trace) < n:
+        uid = rng.randrange(n_members)
+        kind = _pick(rng, KINDS)
+        s = state[uid]
+        before = member(uid)
+        if kind == 'status':
+            s['status'] = rng.choice(['online', 'idle', 'dnd'])
+        elif kind == 'spotify':
+            s['track'] += 1
+        elif kind == 'details':
+            s['details'] = rng.choice(['In Lobby', 'In Match', 'Ranked', 'Menu'])
+        elif kind == 'game':
+            s['game'] = None if s['game'] else rng.choice(GAMES)
+            s['party'] = None
+        elif s['game']:
+            s['party'] = None if s['party'] else f"party{rng.randrange(n_members // 4)}"
+        trace.append((kind, before, member(uid), fanout[uid]))
+    return trace
+
+
+class LegacyListeners:
+    """以前の HistoryCog / TrackerCog.on_presence_update（DB 書き込みは記録のみ）"""
+
+    def __init__(self):
+        self.active_sessions = {}
+        self.tracked_parties = set()
+        self.records = []
+
+    def history(self, before, after):
+        if after.activities:
+            for activity in after.activities:
+                if activity.type == discord.ActivityType.playing:
+                    if (after.id, activity.name) in self.active_sessions:
+                        continue
+                    if (not before.activities or activity.name not in [a.name for a in before.activities]):
+                        self.active_sessions[(after.id, activity.name)] = {
+                            'start_time': datetime.now(), 'details': getattr(activity, 'details', None)}
+                        self.records.append(('start', after.id, activity.name))
+        if before.activities:
+            for activity in before.activities:
+                if (activity.type == discord.ActivityType.playing and
+                        (not after.activities or activity.name not in [a.name for a in after.activities])):
+                    if self.active_sessions.pop((before.id, activity.name), None):
+                        datetime.now()
+                        self.records.append(('end', before.id, activity.name))
+
+    def tracker(self, before, after):
+        datetime.now()
+        before_parties, after_parties = {}, {}
+        for act in before.activities:
+            if act.type == discord.ActivityType.playing and getattr(act, 'party', None):
+                if act.party.get('id'):
+                    before_parties[act.party['id']] = act
+        for act in after.activities:
+            if act.type == discord.ActivityType.playing and getattr(act, 'party', None):
+                if act.party.get('id'):
+                    after_parties[act.party['id']] = act
+        for pid, act in after_parties.items():
+            if pid not in before_parties:
+                if (pid, str(after.id)) in self.tracked_parties:
+                    continue
+                self.tracked_parties.add((pid, str(after.id)))
+                self.records.append(('join', after.id, pid))
+        for pid in before_parties:
+            if pid not in after_parties:
+                self.tracked_parties.discard((pid, str(after.id)))
+                self.records.append(('leave', after.id, pid))
+
+
+class Handlers:
+    """現在の HistoryCog / TrackerCog._on_presence_change（DB 書き込みは記録のみ）"""
+
+    def __init__(self):
+        self.active_sessions = {}
+        self.records = []
+
+    def history(self, change: PresenceChange):
+        for act in change.started:
+            if (change.user_id, act.name) in self.active_sessions:
+                continue
+            self.active_sessions[(change.user_id, act.name)] = {
+                'start_time': change.at, 'details': act.details}
+            self.records.append(('start', change.user_id, act.name))
+        for act in change.stopped:
+            if self.active_sessions.pop((change.user_id, act.name), None):
+                self.records.append(('end', change.user_id, act.name))
+
+    def tracker(self, change: PresenceChange):
+        for act in change.parties_joined:
+            self.records.append(('join', change.user_id, act.party_id))
+        for act in change.parties_left:
+            self.records.append(('leave', change.user_id, act.party_id))
+
+
+async def _replay(listeners, trace):
+    # discord.py はリスナーごとに Task を作ってイベントを配る
+    loop = asyncio.get_running_loop()
+    for i, (_, before, after, fanout) in enumerate(trace):
+        for _ in range(fanout):
+            for listener in listeners:
+                loop.create_task(listener(before, after))
+        if i % BURST == 0:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+def run_legacy(trace):
+    legacy = LegacyListeners()
+
+    async def history(before, after):
+        legacy.history(before, after)
+
+    async def tracker(before, after):
+        legacy.tracker(before, after)
+
+    t0 = time.perf_counter()
+    asyncio.run(_replay([history, tracker], trace))
+    return legacy.records, time.perf_counter() - t0
+
+
+def run_dispatcher(trace):
+    dispatcher = PresenceDispatcher()
+    handlers = Handlers()
+    dispatcher._handlers = [handlers.history, handlers.tracker]
+    t0 = time.perf_counter()
+    asyncio.run(_replay([dispatcher.on_presence_update], trace))
+    elapsed = time.perf_counter() - t0
+    # 種類ごとの通過数は計測の外で別のディスパッチャに数えさせる
+    passed = Counter()
+    probe = PresenceDispatcher()
+    for kind, before, after, fanout in trace:
+        for _ in range(fanout):
+            if probe.feed(before, after) is not None:
+                passed[kind] += 1
+    return handlers.records, elapsed, dispatcher.stats(), passed
+
+
+def collapse(records):
+    """旧リスナーがギルド数ぶん繰り返した同一の書き込みを 1 件にまとめる"""
+    return [r for i, r in enumerate(records) if i == 0 or records[i - 1] != r]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    n_members = int(sys.argv[2]) if len(sys.argv) > 2 else MEMBERS
+    trace = make_trace(n, n_members)
+    received = Counter()
+    for kind, _, _, fanout in trace:
+        received[kind] += fanout
+    total = sum(received.values())
+
+    legacy, t_legacy = run_legacy(trace)
+    records, t_new, st, passed = run_dispatcher(trace)
+
+    print(f"{n} presence changes from {n_members} members -> {total} gateway events (guild fan-out)")
+    print(f"{'kind':<10}{'received':>10}{'processed':>11}{'skipped':>9}")
+    for kind, _ in KINDS:
+        r, p = received[kind], passed[kind]
+        print(f"{kind:<10}{r:>10}{p:>11}{(r - p) / r:>9.1%}")
+    print(f"short-circuited    {st['short_circuited']} / {st['received']} "
+          f"({st['short_circuited'] / st['received']:.1%})")
+    print(f"legacy listeners   {t_legacy / total * 1e6:.2f}us / event")
+    print(f"presence dispatch  {t_new / total * 1e6:.2f}us / event  ({t_legacy / t_new:.1f}x)")
+    print(f"writes             legacy {len(legacy)} / dispatcher {len(records)}  "
+          f"same after collapsing fan-out repeats: {collapse(legacy) == records}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+ベンチマーク: !profile 時間帯グラフ（matplotlib vs PIL）
+従来の matplotlib Figure による描画と、cogs.profile_render の PIL 描画を比較する。
+各方式を別プロセスで実行し、import 時間・初回描画・平均描画時間・PNG サイズ・RSS 増分を出す。
+matplotlib が入っていない環境では PIL のみ計測する。
+使い方: python3 scripts/bench_profile_chart.py [回数]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROUNDS = 20
+HOURS = [18, 20, 22, 0, 2, 14, 16, 21, 23, 1]
+COUNTS = [2, 15, 25, 18, 5, 4, 8, 30, 12, 7]
+
+
+def _legacy_import():
+    from matplotlib.figure import Figure
+    import io
+
+    def render_hours_chart(hours, counts):
+        # 置き換え前の cogs/profile_render.py と同じ描画
+        fig = Figure(figsize=(10, 4))
+        ax = fig.subplots()
+        ax.bar(hours, counts, color='#6464e8', alpha=0.8)
+        ax.set_title('Distribution of Playing Time')
+        ax.set_xlabel('Hour of Day')
+        ax.set_ylabel('Session Count')
+        ax.set_xticks(range(0, 24, 2))
+        ax.set_xlim(-0.5, 23.5)
+        ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=150)
+        return buf.getvalue()
+    return render_hours_chart
+
+
+def _pil_import():
+    from cogs.profile_render import render_hours_chart
+    return render_hours_chart
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(kind: str, rounds: int):
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    render = _legacy_import() if kind == 'matplotlib' else _pil_import()
+    imported = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    png = render(HOURS, COUNTS)
+    first = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        render(HOURS, COUNTS)
+    mean = (time.perf_counter() - t0) / rounds
+    print(json.dumps({'import': imported, 'first': first, 'mean': mean,
+                      'size': len(png), 'rss': _rss_mb() - rss0}))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    print(f"mean of {rounds} renders, one fresh process per renderer")
+    print(f"{'':<12} {'import':>8} {'first':>8} {'mean':>8} {'PNG':>9} {'+RSS':>8}")
+    for kind in ('matplotlib', 'PIL'):
+        proc = subprocess.run([sys.executable, __file__, '--child', kind, str(rounds)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{kind:<12} skipped: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{kind:<12} {r['import']*1000:>6.0f}ms {r['first']*1000:>6.0f}ms "
+              f"{r['mean']*1000:>6.1f}ms {r['size']/1024:>7.1f}KB {r['rss']:>6.1f}MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,125 @@
+"""
+ベンチマーク: !history / !top / !mygames / !profile の DB 読み込み（pandas vs cogs.queries）
+旧実装（コマンドごとに接続 + pd.read_sql_query + iterrows）と、
+cogs.queries（スレッドごとに再利用する接続 + NamedTuple）で同じ文字列を作る時間を比較する。
+使い方: python3 scripts/bench_queries.py [ユーザー数] [回数]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs import queries  # noqa: E402
+from cogs.schema import rebuild_rollups  # noqa: E402
+from scripts.bench_user_vectors import make_db  # noqa: E402
+
+USERS = 1_000
+ROUNDS = 50
+SINCE_DAY = '1970-01-01'
+
+
+def legacy_commands(path: str, uid: str) -> list[str]:
+    import pandas as pd
+    out = []
+    conn = sqlite3.connect(path, timeout=10)
+    df = pd.read_sql_query('''
+        SELECT user_id, game_name,
+               SUM(session_count) as session_count, SUM(total_seconds) as total_duration
+        FROM daily_user_game_stats WHERE day >= ?
+        GROUP BY user_id, game_name ORDER BY total_duration DESC
+    ''', conn, params=(SINCE_DAY,))
+    conn.close()
+    out.append('\n'.join(f"{r['user_id']} - {r['game_name']}: {r['total_duration']/3600:.1f}h "
+                         f"({r['session_count']}回)" for _, r in df.iterrows()))
+
+    conn = sqlite3.connect(path, timeout=10)
+    df = pd.read_sql_query('''
+        SELECT game_name, COUNT(DISTINCT user_id) as player_count,
+               SUM(session_count) as session_count, SUM(total_seconds) as total_duration
+        FROM daily_user_game_stats WHERE day >= ?
+        GROUP BY game_name ORDER BY player_count DESC, total_duration DESC LIMIT 10
+    ''', conn, params=(SINCE_DAY,))
+    conn.close()
+    out.append('\n'.join(f"{r['game_name']}: {r['player_count']}人 / {r['total_duration']/3600:.1f}h"
+                         for _, r in df.iterrows()))
+
+    conn = sqlite3.connect(path, timeout=10)
+    df = pd.read_sql_query('''
+        SELECT game_name, SUM(session_count) as session_count,
+               SUM(total_seconds) as total_duration,
+               CAST(SUM(total_seconds) AS REAL) / SUM(session_count) as avg_duration
+        FROM daily_user_game_stats WHERE user_id=? AND day >= ?
+        GROUP BY game_name ORDER BY total_duration DESC
+    ''', conn, params=(uid, SINCE_DAY))
+    conn.close()
+    out.append('\n'.join(f"{r['game_name']}: {r['total_duration']/3600:.1f}h / "
+                         f"平均{r['avg_duration']/60:.0f}分 ({r['session_count']}回)"
+                         for _, r in df.iterrows()))
+
+    conn = sqlite3.connect(path, timeout=10)
+    favs = pd.read_sql_query('''
+        SELECT game_name, SUM(total_seconds) as total
+        FROM daily_user_game_stats WHERE user_id=?
+        GROUP BY game_name ORDER BY total DESC LIMIT 5
+    ''', conn, params=(uid,))
+    hours = pd.read_sql_query('''
+        SELECT hour, session_count as count
+        FROM user_hour_stats WHERE user_id=? ORDER BY count DESC
+    ''', conn, params=(uid,))
+    conn.close()
+    out.append(repr((favs[['game_name', 'total']].values.tolist(),
+                     [int(h) for h in hours['hour']], hours['count'].tolist())))
+    return out
+
+
+def query_commands(uid: str) -> list[str]:
+    out = ['\n'.join(f"{r.user_id} - {r.game_name}: {r.total_seconds/3600:.1f}h ({r.session_count}回)"
+                     for r in queries.history_totals(SINCE_DAY)),
+           '\n'.join(f"{r.game_name}: {r.player_count}人 / {r.total_seconds/3600:.1f}h"
+                     for r in queries.popular_games(SINCE_DAY)),
+           '\n'.join(f"{r.game_name}: {r.total_seconds/3600:.1f}h / 平均{r.avg_seconds/60:.0f}分 "
+                     f"({r.session_count}回)" for r in queries.my_games(uid, SINCE_DAY))]
+    hours = queries.hour_counts(uid)
+    out.append(repr(([list(f) for f in queries.favorite_games(uid)],
+                     [h.hour for h in hours], [h.session_count for h in hours])))
+    return out
+
+
+def timed(fn, rounds: int, *args):
+    result = fn(*args)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(*args)
+    return result, (time.perf_counter() - t0) / rounds
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else USERS
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else ROUNDS
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = make_db(path, n_users)
+        rebuild_rollups(conn)
+        conn.commit()
+        uid = conn.execute('SELECT user_id FROM game_sessions LIMIT 1').fetchone()[0]
+        conn.close()
+
+        queries.DB_PATH = path
+        t0 = time.perf_counter()
+        import pandas  # noqa: F401
+        pandas_import = time.perf_counter() - t0
+        legacy, t_legacy = timed(legacy_commands, rounds, path, uid)
+        fast, t_fast = timed(query_commands, rounds, uid)
+
+    print(f"{n_users} users, 4 commands, mean of {rounds} rounds "
+          f"(pandas import {pandas_import*1000:.0f}ms, paid once)")
+    print(f"pandas + iterrows  {t_legacy*1000:>7.1f}ms")
+    print(f"cogs.queries       {t_fast*1000:>7.1f}ms  ({t_legacy / t_fast:.1f}x)  "
+          f"same output: {legacy == fast}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+ベンチマーク: !recommend のスコアリング（CF + コンテンツベース + プレイ中ユーザー）
+旧実装（未プレイのゲームごとに sim_scores を Python でループ）と新実装
+（重み付き行列積 + 埋め込み行列との行列ベクトル積 + 類似度順の列マスク）を比較し、
+上位の推薦結果が一致することも確認する。旧実装は大きいサイズでは遅すぎるため小さいサイズのみ計測する。
+使い方: python3 scripts/bench_recommend.py [ユーザー数xゲーム数 ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.matching import (  # noqa: E402
+    _build_user_embeddings, _players_of, _recommend_scores, _similarity_vectors,
+)
+
+SIZES = [(200, 500), (1_000, 2_000), (10_000, 5_000)]
+LEGACY_MAX_CELLS = 2_000_000
+GAMES_PER_USER = 12
+DIM = 64
+TOP_K = 5
+
+
+def _cosine_similarity(a, b) -> float:
+    na, nb = np.linalg.norm(a), np.linalg.norm(b)
+    if na == 0 or nb == 0:
+        return 0.0
+    return float(np.dot(a, b) / (na * nb))
+
+
+def _legacy(me, score, game_mat, user_embs, game_embs, has_emb):
+    """Per-game loop implementation kept here as the reference for the benchmark."""
+    sim_scores = {i: float(score[i]) for i in range(len(score)) if i != me}
+    unplayed = [j for j, v in enumerate(game_mat[me]) if v == 0]
+    rec_cf = {}
+    for j in unplayed:
+        s = sum(sim * np.log1p(game_mat[i, j]) for i, sim in sim_scores.items() if sim > 0)
+        if s > 0:
+            rec_cf[j] = s
+    max_cf = max(rec_cf.values())
+    final_rec = []
+    for j, cf_raw in rec_cf.items():
+        cf_score = cf_raw / max_cf
+        cb_score = _cosine_similarity(user_embs[me], game_embs[j]) if has_emb[j] else 0.0
+        final_rec.append((j, cf_score * 0.5 + max(0, cb_score) * 0.5, cf_score, cb_score))
+    final_rec.sort(key=lambda x: x[1], reverse=True)
+    players = {}
+    for j, *_ in final_rec[:TOP_K]:
+        found = [(i, sim_scores[i]) for i in sim_scores if game_mat[i, j] > 0]
+        found.sort(key=lambda x: x[1], reverse=True)
+        players[j] = [i for i, _ in found]
+    return final_rec[:TOP_K], players
+
+
+def _vectorized(me, score, game_mat, user_embs, game_embs, has_emb):
+    final_rec, _ = _recommend_scores(me, score, game_mat, user_embs, game_embs, has_emb, k=TOP_K)
+    others = np.flatnonzero(np.arange(len(score)) != me)
+    by_similarity = others[np.lexsort((others, -score[others]))]
+    players = {j: _players_of(j, by_similarity, game_mat).tolist() for j, *_ in final_rec}
+    return final_rec, players
+
+
+def make_data(n_users: int, n_games: int):
+    rng = np.random.default_rng(n_users)
+    weights = 1 / np.arange(1, n_games + 1)
+    weights /= weights.sum()
+    game_mat = np.zeros((n_users, n_games), dtype=np.float64)
+    for u in range(n_users):
+        games = rng.choice(n_games, size=GAMES_PER_USER, replace=False, p=weights)
+        game_mat[u, games] = rng.integers(600, 200 * 3600, size=GAMES_PER_USER)
+    hour_mat = rng.poisson(2.0, size=(n_users, 24)).astype(np.float64)
+    game_embs = rng.standard_normal((n_games, DIM)).astype(np.float32)
+    has_emb = rng.random(n_games) < 0.8
+    game_embs[~has_emb] = 0
+    return game_mat, hour_mat, game_embs, has_emb
+
+
+def same_output(a, b) -> bool:
+    (recs_a, players_a), (recs_b, players_b) = a, b
+    return ([j for j, *_ in recs_a] == [j for j, *_ in recs_b]
+            and np.allclose([r[1:] for r in recs_a], [r[1:] for r in recs_b])
+            and players_a == players_b)
+
+
+def main():
+    sizes = [tuple(int(v) for v in a.split('x')) for a in sys.argv[1:]] or SIZES
+    print(f"{'users x games':>15} {'legacy':>10} {'vectorized':>11}  match")
+    for n_users, n_games in sizes:
+        game_mat, hour_mat, game_embs, has_emb = make_data(n_users, n_games)
+        user_embs = _build_user_embeddings(game_mat, game_embs, has_emb)
+        me = 0
+        sg, sh, sc = _similarity_vectors(me, game_mat, hour_mat, user_embs)
+        score = sg * 0.3 + sh * 0.2 + sc * 0.5
+        args = (me, score, game_mat, user_embs, game_embs, has_emb)
+
+        t0 = time.perf_counter()
+        fast = _vectorized(*args)
+        t_fast = time.perf_counter() - t0
+        legacy_col, match = '-', '-'
+        if n_users * n_games <= LEGACY_MAX_CELLS:
+            t0 = time.perf_counter()
+            legacy = _legacy(*args)
+            legacy_col = f'{(time.perf_counter() - t0) * 1000:.1f}ms'
+            match = same_output(legacy, fast)
+        print(f"{f'{n_users}x{n_games}':>15} {legacy_col:>10} {t_fast*1000:>9.1f}ms  {match}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+ベンチマーク: !calendar 画像の同時生成（スレッド vs 描画用プロセスプール）
+同じ週のセッションを N 件同時に描画し、全体の所要時間とイベントループの最大遅延を比較する。
+使い方: python3 scripts/bench_render.py [同時数] [ワーカー数]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs import calendar_render  # noqa: E402
+from cogs.executor import run_blocking, shutdown_executor  # noqa: E402
+from cogs.render import Renderer  # noqa: E402
+
+CONCURRENT = 5
+
+
+def make_week():
+    rng = random.Random(0)
+    today = datetime.now()
+    week_start = (today - timedelta(days=today.weekday())).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    week_end = week_start + timedelta(days=6, hours=23, minutes=59, seconds=59)
+    games = ['Valorant', 'Apex Legends', 'Minecraft', 'Genshin Impact'] + [
+        f'Game {i}' for i in range(8)]
+    sessions = []
+    for day in range(7):
+        for _ in range(rng.randint(2, 5)):
+            start = week_start + timedelta(days=day, minutes=rng.randint(0, 22 * 60))
+            end = start + timedelta(minutes=rng.randint(20, 180))
+            sessions.append((rng.choice(games), start.isoformat(), end.isoformat(),
+                             int((end - start).total_seconds())))
+    sessions.sort(key=lambda s: s[1])
+    return sessions, week_start, week_end
+
+
+async def _loop_lag(stop: asyncio.Event, out: list):
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - t0 - 0.001)
+    out.append(worst)
+
+
+async def measure(render, n: int, args):
+    stop, lag = asyncio.Event(), []
+    probe = asyncio.create_task(_loop_lag(stop, lag))
+    t0 = time.perf_counter()
+    await asyncio.gather(*[render('bench', calendar_render.render_png, *args) for _ in range(n)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    return elapsed, lag[0]
+
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else CONCURRENT
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    args = make_week()
+
+    renderer = Renderer(workers=workers)
+    renderer.start()
+    # Let the workers finish warming up before timing
+    await renderer.render('warm-up', calendar_render.render_png, *args)
+    await asyncio.sleep(1)
+
+    threads = await measure(run_blocking, n, args)
+    pool = await measure(renderer.render, n, args)
+    renderer.shutdown()
+    shutdown_executor()
+
+    print(f"{n} concurrent renders, {os.cpu_count()} CPU(s), {renderer.workers} render worker(s)")
+    print(f"{'':<14} {'total':>8} {'max loop lag':>13}")
+    for label, (elapsed, lag) in (('thread pool', threads), ('process pool', pool)):
+        print(f"{label:<14} {elapsed*1000:>6.0f}ms {lag*1000:>11.1f}ms")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""
+ベンチマーク: 再接続時の on_ready（全メンバーの再走査 vs cogs.resync の差分再同期）
+大きなギルドのキャッシュを模したメンバー集合で初回同期を行い、切断中に一部のメンバーの
+ゲーム・パーティ・VC を変えてから再同期する。差分だけが各 Cog のハンドラに届くこと、
+変化がなければ何も書かれないこと、ループを止める最長時間を確認する。
+使い方: python3 scripts/bench_resync.py [メンバー数] [切断中に変化した割合]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import discord
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs import resync  # noqa: E402
+from cogs.presence import get_presence  # noqa: E402
+
+MEMBERS = 20_000
+CHANGED = 0.01
+GUILDS = 4
+GAMES = ['Apex Legends', 'VALORANT', 'Minecraft', 'Overwatch 2', 'Fortnite']
+
+
+class FakeBot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+
+    def add_listener(self, fn, name):
+        pass
+
+    def remove_listener(self, fn, name):
+        pass
+
+
+def _activities(rng):
+    game = rng.choice(GAMES + [None] * 5)
+    if not game:
+        return ()
+    party = {'id': f"p{rng.randrange(2000)}", 'size': [2, 4]} if rng.random() < 0.2 else {}
+    return (discord.Activity(type=discord.ActivityType.playing, name=game, party=party),)
+
+
+def make_guilds(n_members: int, seed: int = 1):
+    """GUILDS guilds over one member pool (some members shared), a few voice channels each."""
+    rng = random.Random(seed)
+    members = [SimpleNamespace(id=i, name=f"user{i}", activities=_activities(rng), voice=None)
+               for i in range(n_members)]
+    guilds = []
+    for g in range(GUILDS):
+        pool = [m for m in members if m.id % GUILDS == g or rng.random() < 0.05]
+        vcs = [SimpleNamespace(id=g * 100 + c, name=f"vc{g}-{c}", members=[]) for c in range(5)]
+        guilds.append(SimpleNamespace(members=pool, voice_channels=vcs,
+                                      get_member={m.id: m for m in pool}.get))
+    for guild in guilds:
+        for m in rng.sample(guild.members, 40):
+            if m.voice is None:
+                vc = rng.choice(guild.voice_channels)
+                m.voice = SimpleNamespace(channel=vc)
+                vc.members.append(m)
+    return guilds, members
+
+
+def disconnect_changes(guilds, members, fraction: float, seed: int = 2) -> int:
+    """切断中の変化: ゲームの開始/終了とパーティの出入り、VC の出入り"""
+    rng = random.Random(seed)
+    changed = rng.sample(members, int(len(members) * fraction))
+    for m in changed:
+        m.activities = _activities(rng)
+        if rng.random() < 0.2:
+            if m.voice:
+                m.voice.channel.members.remove(m)
+                m.voice = None
+            else:
+                guild = next(g for g in guilds if g.get_member(m.id) is m)
+                vc = rng.choice(guild.voice_channels)
+                m.voice = SimpleNamespace(channel=vc)
+                vc.members.append(m)
+    return len(changed)
+
+
+async def run(bot, fn):
+    """fn を実行し、その間にイベントループが止まっていた最長時間を測る"""
+    stalls = []
+
+    async def ticker():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    await fn()
+    elapsed = time.perf_counter() - t0
+    tick.cancel()
+    return elapsed, max(stalls, default=elapsed)
+
+
+async def legacy_rescan(bot):
+    """以前の on_ready（HistoryCog + TrackerCog）: 全ギルドの全メンバーを一度に走査する"""
+    current_playing, party_candidates, vc_pairs = {}, {}, {}
+    for guild in bot.guilds:
+        for member in guild.members:
+            for activity in member.activities:
+                if activity.type == discord.ActivityType.playing:
+                    current_playing[(str(member.id), activity.name)] = member.name
+                    if activity.party and activity.party.get('id'):
+                        party_candidates.setdefault((activity.party['id'], str(member.id)), activity.name)
+        for vc in guild.voice_channels:
+            for i, m1 in enumerate(vc.members):
+                for m2 in vc.members[i + 1:]:
+                    vc_pairs.setdefault(tuple(sorted((m1.id, m2.id))) + (vc.id,), vc.name)
+    return len(current_playing) + len(party_candidates)
+
+
+async def main_async(n_members: int, fraction: float):
+    guilds, members = make_guilds(n_members)
+    bot = FakeBot(guilds)
+    engine = resync.ResyncEngine()
+    engine._bot = bot
+    records = []
+    get_presence()._handlers = [lambda change: records.append(change)]
+    engine._voice_handlers = [lambda change: records.append(change)]
+
+    async def initial(snapshot):
+        records.append(snapshot)
+    engine._initial = [initial]
+
+    t_initial, stall_initial = await run(bot, engine.on_ready)
+    t_legacy, stall_legacy = await run(bot, lambda: legacy_rescan(bot))
+
+    n_changed = disconnect_changes(guilds, members, fraction)
+    records.clear()
+    t_delta, stall_delta = await run(bot, engine.on_ready)
+    deltas = list(records)
+    delta_stats = engine.stats()
+
+    records.clear()
+    t_again, _ = await run(bot, engine.on_ready)
+    again = list(records)
+
+    # 差分適用後のキャッシュが現在のゲートウェイ状態と一致するか
+    expected_voice = {m.id: (str(m.voice.channel.id), m.voice.channel.name)
+                      for m in members if m.voice and any(g.get_member(m.id) is m for g in guilds)}
+    cached = engine._voice == expected_voice and all(
+        get_presence()._last.get(m.id, (frozenset(),))[0] == frozenset(
+            (a.name, (a.party or {}).get('id')) for a in m.activities)
+        for m in members)
+
+    print(f"{n_members} members over {GUILDS} guilds, {n_changed} changed while disconnected")
+    print(f"full rescan (old on_ready)  {t_legacy * 1000:>7.1f}ms  loop blocked up to "
+          f"{stall_legacy * 1000:.1f}ms")
+    print(f"initial sync                {t_initial * 1000:>7.1f}ms  loop blocked up to "
+          f"{stall_initial * 1000:.1f}ms")
+    print(f"delta resync                {t_delta * 1000:>7.1f}ms  loop blocked up to "
+          f"{stall_delta * 1000:.1f}ms  -> {len(deltas)} changes dispatched "
+          f"(games +{delta_stats['games_started']}/-{delta_stats['games_stopped']}, "
+          f"parties +{delta_stats['parties_joined']}/-{delta_stats['parties_left']}, "
+          f"VC +{delta_stats['voice_joined']}/-{delta_stats['voice_left']})")
+    print(f"resync with no changes      {t_again * 1000:>7.1f}ms  -> {len(again)} changes dispatched")
+    print(f"cached state matches gateway: {cached}")
+
+
+def main():
+    n_members = int(sys.argv[1]) if len(sys.argv) > 1 else MEMBERS
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else CHANGED
+    asyncio.run(main_async(n_members, fraction))
+
+
+if __name__ == '__main__':
+    main()
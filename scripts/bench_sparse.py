@@ -0,0 +1,96 @@
+"""
+ベンチマーク: ユーザー×ゲーム行列の密（ndarray）と疎（scipy CSR）の比較
+行列の構築からユーザー埋め込み・!similar の上位抽出・!recommend のスコアリングまでを
+同じ合成データで実行し、所要時間とピークメモリ（tracemalloc）を比較する。
+上位の結果が一致することも確認する。
+使い方: python3 scripts/bench_sparse.py [ユーザー数xゲーム数 ...]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.matching import (  # noqa: E402
+    _build_user_embeddings, _players_of, _recommend_scores, _score_players,
+    _similarity_vectors,
+)
+
+SIZES = [(1_000, 2_000), (5_000, 8_000), (10_000, 5_000)]
+GAMES_PER_USER = 15
+DIM = 64
+
+
+def make_entries(n_users: int, n_games: int):
+    """(rows, cols, seconds) for a Zipf-like title popularity, GAMES_PER_USER titles each."""
+    rng = np.random.default_rng(n_users + n_games)
+    p = 1 / np.arange(1, n_games + 1)
+    p /= p.sum()
+    rows = np.repeat(np.arange(n_users), GAMES_PER_USER)
+    cols = np.concatenate([rng.choice(n_games, GAMES_PER_USER, replace=False, p=p)
+                           for _ in range(n_users)])
+    values = rng.integers(600, 200 * 3600, size=len(rows)).astype(np.float64)
+    hour_mat = rng.poisson(2.0, size=(n_users, 24)).astype(np.float64)
+    game_embs = rng.standard_normal((n_games, DIM)).astype(np.float32)
+    has_emb = rng.random(n_games) < 0.8
+    game_embs[~has_emb] = 0
+    return rows, cols, values, hour_mat, game_embs, has_emb
+
+
+def pipeline(kind: str, n_users: int, n_games: int, data):
+    rows, cols, values, hour_mat, game_embs, has_emb = data
+    shape = (n_users, n_games)
+    if kind == 'sparse':
+        game_mat = sparse.csr_matrix((values, (rows, cols)), shape=shape)
+        game_mat.sum_duplicates()
+    else:
+        game_mat = np.zeros(shape, dtype=np.float64)
+        np.add.at(game_mat, (rows, cols), values)
+    user_ids = [str(i) for i in range(n_users)]
+    all_games = [f'Game {j}' for j in range(n_games)]
+    user_embs = _build_user_embeddings(game_mat, game_embs, has_emb)
+
+    me = 0
+    similar = _score_players(me, user_ids, all_games, game_mat, hour_mat, user_embs, k=10)
+    sg, sh, sc = _similarity_vectors(me, game_mat, hour_mat, user_embs)
+    score = sg * 0.3 + sh * 0.2 + sc * 0.5
+    recs, _ = _recommend_scores(me, score, game_mat, user_embs, game_embs, has_emb, k=5)
+    others = np.flatnonzero(np.arange(n_users) != me)
+    by_similarity = others[np.lexsort((others, -score[others]))]
+    players = [_players_of(j, by_similarity, game_mat)[:3].tolist() for j, *_ in recs]
+
+    mat_bytes = (game_mat.nbytes if kind == 'dense'
+                 else game_mat.data.nbytes + game_mat.indices.nbytes + game_mat.indptr.nbytes)
+    return ([u for u, *_ in similar], [j for j, *_ in recs], players), mat_bytes
+
+
+def measure(kind: str, n_users: int, n_games: int, data):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out, mat_bytes = pipeline(kind, n_users, n_games, data)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, mat_bytes, peak
+
+
+def main():
+    sizes = [tuple(int(v) for v in a.split('x')) for a in sys.argv[1:]] or SIZES
+    mb = 1024 * 1024
+    print(f"{'users x games':>14} {'kind':>7} {'time':>9} {'game_mat':>10} {'peak':>9}  match")
+    for n_users, n_games in sizes:
+        data = make_entries(n_users, n_games)
+        dense = measure('dense', n_users, n_games, data)
+        sparse_ = measure('sparse', n_users, n_games, data)
+        for kind, (out, elapsed, mat_bytes, peak) in (('dense', dense), ('sparse', sparse_)):
+            match = '' if kind == 'dense' else str(out == dense[0])
+            print(f"{f'{n_users}x{n_games}':>14} {kind:>7} {elapsed*1000:>7.0f}ms "
+                  f"{mat_bytes/mb:>8.1f}MB {peak/mb:>7.1f}MB  {match}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+ベンチマーク: _build_user_vectors（ユーザー×ゲーム / ユーザー×時間帯 行列）
+旧実装（ユーザーごとに2クエリ）と新実装（行列ごとに1クエリ + np.add.at）を比較し、
+結果が一致することも確認する。
+使い方: python3 scripts/bench_user_vectors.py [ユーザー数 ...]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.matching import _build_user_vectors  # noqa: E402
+from cogs.schema import apply_migrations, cutoff_epoch  # noqa: E402
+
+SIZES = [100, 1_000, 10_000]
+SESSIONS_PER_USER = 40
+FAVOURITES_MAX = 6
+N_GAMES = 800
+DAYS = 30
+
+
+def _legacy_build_user_vectors(cursor, days: int):
+    """Per-user loop implementation kept here as the reference for the benchmark."""
+    since = cutoff_epoch(days)
+    cursor.execute(
+        "SELECT DISTINCT game_name FROM game_sessions WHERE start_epoch > ?", (since,))
+    all_games = sorted([r[0] for r in cursor.fetchall()])
+    game_idx = {g: i for i, g in enumerate(all_games)}
+
+    cursor.execute(
+        "SELECT DISTINCT user_id FROM game_sessions WHERE start_epoch > ?", (since,))
+    user_ids = [r[0] for r in cursor.fetchall()]
+
+    n, m = len(user_ids), len(all_games)
+    game_mat = np.zeros((n, m), dtype=np.float64)
+    hour_mat = np.zeros((n, 24), dtype=np.float64)
+
+    for ui, uid in enumerate(user_ids):
+        cursor.execute('''
+            SELECT game_name, SUM(duration) FROM game_sessions
+            WHERE user_id=? AND start_epoch > ?
+            GROUP BY game_name
+        ''', (uid, since))
+        for gname, total in cursor.fetchall():
+            if gname in game_idx:
+                game_mat[ui, game_idx[gname]] = total
+
+        cursor.execute('''
+            SELECT CAST(strftime('%H', start_time) AS INTEGER) as h, COUNT(*)
+            FROM game_sessions
+            WHERE user_id=? AND start_epoch > ?
+            GROUP BY h
+        ''', (uid, since))
+        for hour, cnt in cursor.fetchall():
+            hour_mat[ui, hour] = cnt
+
+    return user_ids, all_games, game_mat, hour_mat
+
+
+def make_db(path: str, n_users: int):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE game_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT, user_name TEXT, game_name TEXT,
+        start_time TEXT, end_time TEXT, duration INTEGER, details TEXT
+    )''')
+    apply_migrations(conn)
+    rng = random.Random(n_users)
+    now = datetime.now()
+    # Zipf-like popularity so a few titles dominate, as on real servers;
+    # each member keeps returning to a handful of favourites
+    weights = [1 / (i + 1) for i in range(N_GAMES)]
+    games = [f'Game {i:04d}' for i in range(N_GAMES)]
+    rows = []
+    for u in range(n_users):
+        uid = str(10**17 + u)
+        favourites = rng.choices(games, weights, k=rng.randint(1, FAVOURITES_MAX))
+        for game in rng.choices(favourites, k=SESSIONS_PER_USER):
+            start = now - timedelta(days=rng.uniform(0, DAYS + 10))
+            dur = rng.randint(600, 4 * 3600)
+            end = start + timedelta(seconds=dur)
+            rows.append((uid, f'user{u}', game, start.isoformat(), end.isoformat(), dur,
+                         int(start.timestamp()), int(end.timestamp())))
+    conn.executemany('''
+        INSERT INTO game_sessions
+        (user_id, user_name, game_name, start_time, end_time, duration, start_epoch, end_epoch)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return conn
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def same_output(a, b) -> bool:
+    """Compare two builder outputs after aligning rows by user_id."""
+    ua, ga, gma, hma = a
+    ub, gb, gmb, hmb = b
+    if ga != gb or sorted(ua) != sorted(ub):
+        return False
+    # game_mat is CSR on large windows (see _use_sparse)
+    gma, gmb = (m.toarray() if hasattr(m, 'toarray') else m for m in (gma, gmb))
+    order_b = {u: i for i, u in enumerate(ub)}
+    perm = [order_b[u] for u in ua]
+    return np.array_equal(gma, gmb[perm]) and np.array_equal(hma, hmb[perm])
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'users':>8} {'legacy':>10} {'vectorized':>11} {'speedup':>8}  match")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            conn = make_db(os.path.join(tmp, f'bench_{n}.db'), n)
+            legacy, t_legacy = timed(_legacy_build_user_vectors, conn.cursor(), DAYS)
+            fast, t_fast = timed(_build_user_vectors, DAYS, conn)
+            conn.close()
+            print(f"{n:>8} {t_legacy*1000:>8.1f}ms {t_fast*1000:>9.1f}ms "
+                  f"{t_legacy / t_fast:>7.1f}x  {same_output(legacy, fast)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+ベンチマーク: VC共同参加の記録（ペアごとのセッション vs 個人の滞在区間 + スイープライン集計）
+大人数のイベントVCで参加・退出を繰り返し、旧方式（ペアごとのメモリ上セッションと退出ごとの
+ペア行書き込み）と、voice_intervals への 1 行書き込み + cogs.voice_overlap.materialize を比較する。
+使い方: python3 scripts/bench_voice_overlap.py [同時参加人数] [退出・再参加の回数]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs import voice_overlap  # noqa: E402
+from cogs.events import VoiceInterval  # noqa: E402
+from cogs.schema import apply_migrations  # noqa: E402
+
+MEMBERS = 40
+CHURN = 2_000
+CHANNEL = '1'
+
+
+def make_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE game_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL, user_name TEXT, game_name TEXT NOT NULL,
+        start_time TEXT NOT NULL, end_time TEXT, duration INTEGER, details TEXT
+    )''')
+    conn.execute('''CREATE TABLE voice_co_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id_a TEXT NOT NULL, user_id_b TEXT NOT NULL,
+        channel_id TEXT NOT NULL, channel_name TEXT,
+        game_name_a TEXT, game_name_b TEXT,
+        start_time TEXT NOT NULL, end_time TEXT, duration INTEGER
+    )''')
+    conn.commit()
+    apply_migrations(conn)
+    return conn
+
+
+def make_trace(n_members: int, churn: int, seed: int = 1):
+    """[(time, member, 'join' | 'leave')]: everyone joins, then random members leave and rejoin."""
+    rng = random.Random(seed)
+    t = datetime(2024, 1, 1, 20, 0)
+    trace = [(t, m, 'join') for m in range(n_members)]
+    inside = set(range(n_members))
+    for _ in range(churn):
+        t += timedelta(seconds=rng.randint(5, 120))
+        m = rng.randrange(n_members)
+        trace.append((t, m, 'leave' if m in inside else 'join'))
+        inside ^= {m}
+    t += timedelta(seconds=60)
+    trace.extend((t, m, 'leave') for m in sorted(inside))
+    return trace
+
+
+def run_pairs(conn, trace):
+    """以前の TrackerCog: 参加時にペアを作り、退出時に残りの全員分の行を書く"""
+    sessions, peak, rows = {}, 0, 0
+    inside = set()
+    t0 = time.perf_counter()
+    for t, m, kind in trace:
+        if kind == 'join':
+            for other in inside:
+                sessions.setdefault(tuple(sorted((str(m), str(other)))), t)
+            inside.add(m)
+            peak = max(peak, len(sessions))
+            continue
+        inside.discard(m)
+        batch = []
+        for other in inside:
+            key = tuple(sorted((str(m), str(other))))
+            start = sessions.pop(key, None)
+            if start is not None:
+                batch.append((*key, CHANNEL, 'event', None, None, start.isoformat(),
+                              t.isoformat(), int((t - start).total_seconds())))
+        conn.executemany('''
+            INSERT INTO voice_co_sessions
+            (user_id_a, user_id_b, channel_id, channel_name,
+             game_name_a, game_name_b, start_time, end_time, duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+        conn.commit()
+        rows += len(batch)
+    return time.perf_counter() - t0, peak, rows
+
+
+def run_intervals(conn, trace):
+    """現在の TrackerCog: 退出時に本人の区間だけを書き、ペアはまとめて集計する"""
+    joins, peak, rows = {}, 0, 0
+    t0 = time.perf_counter()
+    for t, m, kind in trace:
+        if kind == 'join':
+            joins[m] = t
+            peak = max(peak, len(joins))
+            continue
+        VoiceInterval(str(m), CHANNEL, 'event', None, joins.pop(m), t).apply(conn)
+        conn.commit()
+        rows += 1
+    listen = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pairs = voice_overlap.materialize(conn)
+    conn.commit()
+    return listen, time.perf_counter() - t0, peak, rows, pairs
+
+
+def pair_totals(conn, table):
+    return dict(((a, b), s) for a, b, s in conn.execute(
+        f'SELECT user_id_a, user_id_b, SUM(duration) FROM {table} GROUP BY user_id_a, user_id_b'))
+
+
+def main():
+    n_members = int(sys.argv[1]) if len(sys.argv) > 1 else MEMBERS
+    churn = int(sys.argv[2]) if len(sys.argv) > 2 else CHURN
+    trace = make_trace(n_members, churn)
+    leaves = sum(kind == 'leave' for _, _, kind in trace)
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = make_db(os.path.join(tmp, 'legacy.db'))
+        legacy.execute('DROP VIEW voice_co_sessions')
+        legacy.execute('ALTER TABLE voice_co_overlaps RENAME TO voice_co_sessions')
+        t_pairs, peak_pairs, pair_rows = run_pairs(legacy, trace)
+        expected = pair_totals(legacy, 'voice_co_sessions')
+
+        current = make_db(os.path.join(tmp, 'current.db'))
+        t_listen, t_sweep, peak_joins, interval_rows, overlap_rows = run_intervals(current, trace)
+        got = pair_totals(current, 'voice_co_overlaps')
+        legacy.close()
+        current.close()
+
+    print(f"{n_members} members, {leaves} leaves")
+    print(f"pair sessions   peak {peak_pairs} entries in memory, {pair_rows} rows written "
+          f"on leave ({pair_rows / leaves:.1f}/leave), {t_pairs * 1000:.0f}ms")
+    print(f"intervals       peak {peak_joins} entries in memory, {interval_rows} rows written "
+          f"on leave (1/leave), {t_listen * 1000:.0f}ms")
+    print(f"overlap sweep   {overlap_rows} pair rows in {t_sweep * 1000:.0f}ms (one batch)")
+    print(f"same pair totals: {expected == got}")
+
+
+if __name__ == '__main__':
+    main()
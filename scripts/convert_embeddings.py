@@ -0,0 +1,47 @@
+"""
+ゲーム埋め込みの変換スクリプト
+data/game_embeddings.pkl（{タイトル: ベクトル}）を読み込み、平均中心化・L2正規化済みの
+float32 行列（.npy）とタイトル一覧（.names.json）を書き出す。
+Bot は起動後の初回利用時にこの .npy を np.load(mmap_mode='r') でメモリマップする。
+使い方: python3 scripts/convert_embeddings.py [入力.pkl] [出力.npy]
+"""
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.embedding_store import NPY_PATH, PKL_PATH, center_and_normalize  # noqa: E402
+
+
+def names_path_for(npy_path: str) -> str:
+    return os.path.splitext(npy_path)[0] + '.names.json'
+
+
+def convert(pkl_path: str = PKL_PATH, npy_path: str = NPY_PATH):
+    with open(pkl_path, 'rb') as f:
+        raw = pickle.load(f)
+    names = list(raw)
+    if not names:
+        raise SystemExit(f"{pkl_path} に埋め込みがありません")
+    matrix = center_and_normalize([raw[g] for g in names])
+
+    # Write to temp files and swap them in, so a running bot never maps a half-written file
+    names_path = names_path_for(npy_path)
+    tmp_npy, tmp_names = npy_path + '.tmp', names_path + '.tmp'
+    with open(tmp_npy, 'wb') as f:
+        np.save(f, matrix)
+    with open(tmp_names, 'w', encoding='utf-8') as f:
+        json.dump(names, f, ensure_ascii=False)
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_names, names_path)
+
+    size_mb = os.path.getsize(npy_path) / 1024 / 1024
+    print(f"{len(names)} titles x {matrix.shape[1]} dims -> {npy_path} ({size_mb:.1f} MB), {names_path}")
+
+
+if __name__ == '__main__':
+    convert(*sys.argv[1:3])
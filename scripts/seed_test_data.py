@@ -2,10 +2,16 @@
 テスト用DBシードスクリプト
 使い方: python3 scripts/seed_test_data.py
 """
+import os
 import sqlite3
+import sys
 from datetime import datetime, timedelta
 import random
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.schema import rebuild_rollups  # noqa: E402
+
 DB_PATH = 'game_history.db'
 
 # テスト用ユーザーID（実際のDiscordユーザーIDに変更してください）
@@ -109,11 +115,20 @@ def seed_vc_sessions(conn):
     conn.commit()
     print("✅ voice_co_sessions: 5件のテストデータを挿入しました")
 
+def refresh_rollups(conn):
+    """集計テーブルがあれば作り直す（閉じた行を直接入れたため。未作成ならBot起動時のマイグレーションで作られる）"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='daily_user_game_stats'").fetchone():
+        return
+    with conn:
+        rows = rebuild_rollups(conn)
+    print(f"✅ daily_user_game_stats: {rows}行を再集計しました")
+
 if __name__ == '__main__':
     conn = sqlite3.connect(DB_PATH)
     init_db(conn)
     seed_game_sessions(conn)
     seed_vc_sessions(conn)
+    refresh_rollups(conn)
     conn.close()
     print("\n🎮 テストデータの準備完了！")
     print("次のステップ: python3 main.py でBotを起動してください")
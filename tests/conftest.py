@@ -0,0 +1,96 @@
+"""pytest fixtures: databases laid out the way the cogs create them.
+
+tests/ is run from the repository root (python -m pytest tests/); the
+benchmark scripts are importable too, so their reference implementations
+double as the expected results here.
+"""
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'scripts')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+USERS = [str(10**17 + u) for u in range(12)]
+GAMES = ['Apex Legends', 'VALORANT', 'Minecraft', 'Overwatch 2', 'osu!']
+
+
+def create_base_tables(conn: sqlite3.Connection):
+    """Tables as HistoryCog / TrackerCog `_init_db` create them, before any migration."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS game_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT, user_name TEXT, game_name TEXT,
+        start_time TEXT, end_time TEXT, duration INTEGER, details TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS voice_co_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id_a TEXT NOT NULL, user_id_b TEXT NOT NULL,
+        channel_id TEXT NOT NULL, channel_name TEXT,
+        game_name_a TEXT, game_name_b TEXT,
+        start_time TEXT NOT NULL, end_time TEXT, duration INTEGER
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS party_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        party_id TEXT NOT NULL, user_id TEXT NOT NULL, game_name TEXT NOT NULL,
+        party_size_current INTEGER, party_size_max INTEGER,
+        joined_at TEXT NOT NULL, left_at TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS mention_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        from_user_id TEXT NOT NULL, to_user_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL, timestamp TEXT NOT NULL
+    )''')
+    conn.commit()
+
+
+def fill_legacy_rows(conn: sqlite3.Connection, seed: int = 1):
+    """Rows written by the pre-migration cogs: ISO times only, a few sessions still open."""
+    rng = random.Random(seed)
+    now = datetime(2024, 6, 30, 23, 0)
+    sessions, pairs, parties = [], [], []
+    for uid in USERS:
+        for _ in range(30):
+            start = now - timedelta(days=rng.uniform(0, 20))
+            duration = rng.randint(60, 4 * 3600)
+            end = start + timedelta(seconds=duration)
+            sessions.append((uid, f'name{uid[-2:]}', rng.choice(GAMES),
+                             start.isoformat(), end.isoformat(), duration))
+        sessions.append((uid, f'name{uid[-2:]}', rng.choice(GAMES), now.isoformat(), None, 0))
+    for _ in range(60):
+        a, b = sorted(rng.sample(USERS, 2))
+        start = now - timedelta(days=rng.uniform(0, 20))
+        duration = rng.randint(60, 3 * 3600)
+        pairs.append((a, b, '1', 'vc', None, None, start.isoformat(),
+                      (start + timedelta(seconds=duration)).isoformat(), duration))
+    for p in range(20):
+        joined = now - timedelta(hours=rng.uniform(1, 200))
+        left = None if p % 4 == 0 else (joined + timedelta(minutes=30)).isoformat()
+        parties.append((f'party{p}', rng.choice(USERS), rng.choice(GAMES), 2, 4,
+                        joined.isoformat(), left))
+    conn.executemany('''INSERT INTO game_sessions
+        (user_id, user_name, game_name, start_time, end_time, duration)
+        VALUES (?, ?, ?, ?, ?, ?)''', sessions)
+    conn.executemany('''INSERT INTO voice_co_sessions
+        (user_id_a, user_id_b, channel_id, channel_name, game_name_a, game_name_b,
+         start_time, end_time, duration)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', pairs)
+    conn.executemany('''INSERT INTO party_sessions
+        (party_id, user_id, game_name, party_size_current, party_size_max, joined_at, left_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)''', parties)
+    conn.commit()
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A populated database from before the schema migrations."""
+    conn = sqlite3.connect(tmp_path / 'game_history.db')
+    create_base_tables(conn)
+    fill_legacy_rows(conn)
+    yield conn
+    conn.close()
@@ -0,0 +1,21 @@
+"""Executor helpers."""
+import asyncio
+
+from cogs.executor import log_task_errors
+
+
+def test_log_task_errors_prints_failures_only(capsys):
+    async def fail():
+        raise ValueError('disk full')
+
+    async def main():
+        tasks = [asyncio.create_task(fail()), asyncio.create_task(asyncio.sleep(0)),
+                 asyncio.create_task(asyncio.sleep(10))]
+        for label, task in zip(('failing', 'ok', 'cancelled'), tasks):
+            task.add_done_callback(log_task_errors(label))
+        tasks[2].cancel()
+        await asyncio.wait(tasks)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert capsys.readouterr().out.splitlines() == ["failing failed: ValueError('disk full')"]
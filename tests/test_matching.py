@@ -0,0 +1,130 @@
+"""cogs.matching against the per-user / per-game loops it replaced (kept in scripts/bench_*)."""
+import sqlite3
+import time
+
+import bench_recommend
+import bench_sparse
+import bench_user_vectors
+import numpy as np
+import pytest
+
+from cogs import matching
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    """Both builders call cutoff_epoch(); pin the clock so they see the same window."""
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+
+
+@pytest.mark.parametrize('n_users', [50, 300])
+def test_user_vectors_match_per_user_queries(tmp_path, frozen_time, n_users):
+    conn = bench_user_vectors.make_db(str(tmp_path / 'vectors.db'), n_users)
+    expected = bench_user_vectors._legacy_build_user_vectors(conn.cursor(), bench_user_vectors.DAYS)
+    got = matching._build_user_vectors(bench_user_vectors.DAYS, conn)
+    assert bench_user_vectors.same_output(expected, got)
+
+
+def _pairwise_similar(me, user_ids, all_games, game_mat, hour_mat, user_embs, k):
+    """The original !similar: one cosine per pair, stable sort of every user."""
+    cos = bench_recommend._cosine_similarity
+    results = []
+    for i, uid in enumerate(user_ids):
+        if i == me:
+            continue
+        sg = cos(game_mat[me], game_mat[i])
+        sh = cos(hour_mat[me], hour_mat[i])
+        sc = cos(user_embs[me], user_embs[i])
+        common = [g for j, g in enumerate(all_games) if game_mat[me, j] > 0 and game_mat[i, j] > 0]
+        results.append((uid, sg * 0.3 + sh * 0.2 + sc * 0.5, sg, sh, sc, common))
+    results.sort(key=lambda r: r[1], reverse=True)
+    return results[:k]
+
+
+@pytest.fixture
+def synthetic():
+    game_mat, hour_mat, game_embs, has_emb = bench_recommend.make_data(120, 300)
+    user_embs = matching._build_user_embeddings(game_mat, game_embs, has_emb)
+    user_ids = [str(i) for i in range(len(game_mat))]
+    all_games = [f'Game {j}' for j in range(game_mat.shape[1])]
+    return user_ids, all_games, game_mat, hour_mat, game_embs, has_emb, user_embs
+
+
+@pytest.mark.parametrize('me', [0, 7, 119])
+def test_score_players_matches_pairwise_cosine(synthetic, me):
+    user_ids, all_games, game_mat, hour_mat, _, _, user_embs = synthetic
+    expected = _pairwise_similar(me, user_ids, all_games, game_mat, hour_mat, user_embs, k=10)
+    got = matching._score_players(me, user_ids, all_games, game_mat, hour_mat, user_embs, k=10)
+    assert [r[0] for r in got] == [r[0] for r in expected]
+    assert np.allclose([r[1:5] for r in got], [r[1:5] for r in expected])
+    assert [r[5] for r in got] == [r[5] for r in expected]
+
+
+def test_precomputed_norms_and_exclude(synthetic):
+    user_ids, all_games, game_mat, hour_mat, _, _, user_embs = synthetic
+    norms = tuple(matching._row_norms(m) for m in (game_mat, hour_mat, user_embs))
+    args = (0, user_ids, all_games, game_mat, hour_mat, user_embs)
+    assert (matching._score_players(*args, k=10, norms=norms)
+            == matching._score_players(*args, k=10))
+
+    everyone = matching._score_players(*args)
+    exclude = matching._user_mask(user_ids, [r[0] for r in everyone[:3]])
+    assert matching._score_players(*args, k=5, exclude=exclude) == everyone[3:8]
+
+
+@pytest.mark.parametrize('size', [(80, 200), (300, 600)])
+@pytest.mark.parametrize('me', [0, 42])
+def test_recommend_scores_match_per_game_loop(size, me):
+    game_mat, hour_mat, game_embs, has_emb = bench_recommend.make_data(*size)
+    user_embs = matching._build_user_embeddings(game_mat, game_embs, has_emb)
+    sg, sh, sc = matching._similarity_vectors(me, game_mat, hour_mat, user_embs)
+    args = (me, sg * 0.3 + sh * 0.2 + sc * 0.5, game_mat, user_embs, game_embs, has_emb)
+    assert bench_recommend.same_output(bench_recommend._legacy(*args),
+                                       bench_recommend._vectorized(*args))
+
+
+@pytest.mark.parametrize('size', [(200, 500), (600, 1500)])
+def test_sparse_pipeline_matches_dense(size):
+    data = bench_sparse.make_entries(*size)
+    dense, _ = bench_sparse.pipeline('dense', *size, data)
+    sparse_, _ = bench_sparse.pipeline('sparse', *size, data)
+    assert sparse_ == dense
+
+
+def test_user_vectors_switch_to_csr(tmp_path, frozen_time, monkeypatch):
+    conn = bench_user_vectors.make_db(str(tmp_path / 'vectors.db'), 200)
+    dense = matching._build_user_vectors(bench_user_vectors.DAYS, conn)
+    monkeypatch.setattr(matching, 'SPARSE_MIN_CELLS', 0)
+    monkeypatch.setattr(matching, 'SPARSE_MAX_DENSITY', 1.0)
+    csr = matching._build_user_vectors(bench_user_vectors.DAYS, conn)
+    assert matching._is_sparse(csr[2]) and not matching._is_sparse(dense[2])
+    assert bench_user_vectors.same_output(dense, csr)
+
+
+def test_user_vectors_read_one_snapshot(tmp_path, frozen_time, monkeypatch):
+    """A user whose first session commits between the two scans is in neither (no KeyError)."""
+    path = str(tmp_path / 'vectors.db')
+    conn = bench_user_vectors.make_db(path, 50)
+    conn.execute('PRAGMA journal_mode=WAL')
+    baseline = matching._build_user_vectors(bench_user_vectors.DAYS, conn)
+    newcomer = str(10**17 + 999)
+    scan_games = matching.queries.iter_user_game_seconds
+
+    def scan_then_commit(since, conn=None):
+        yield from scan_games(since, conn)
+        now = int(time.time())
+        writer = sqlite3.connect(path, timeout=0)
+        writer.execute('''INSERT INTO game_sessions
+            (user_id, user_name, game_name, start_time, start_epoch)
+            VALUES (?, 'newcomer', 'Game 0000', datetime('now'), ?)''', (newcomer, now))
+        writer.commit()
+        writer.close()
+
+    monkeypatch.setattr(matching.queries, 'iter_user_game_seconds', scan_then_commit)
+    got = matching._build_user_vectors(bench_user_vectors.DAYS, conn)
+    assert newcomer not in got[0]
+    assert bench_user_vectors.same_output(baseline, got)
+
+    monkeypatch.undo()
+    assert newcomer in matching._build_user_vectors(bench_user_vectors.DAYS, conn)[0]
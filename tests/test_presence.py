@@ -0,0 +1,90 @@
+"""PresenceDispatcher: duplicate-guild and no-op presences short-circuit; state is dropped on leave."""
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+from cogs.presence import PresenceDispatcher
+
+
+def _member(uid, *games, details=None, status='online'):
+    acts = tuple(discord.Activity(type=discord.ActivityType.playing, name=g, details=details)
+                 for g in games)
+    return SimpleNamespace(id=uid, name=f'user{uid}', activities=acts, status=status)
+
+
+class Bot:
+    def __init__(self, *guilds):
+        self.guilds = list(guilds)
+        self.listeners = {}
+
+    def add_listener(self, fn, name):
+        self.listeners[name] = fn
+
+    def remove_listener(self, fn, name):
+        self.listeners.pop(name, None)
+
+
+def _guild(*members):
+    cached = {m.id: m for m in members}
+    return SimpleNamespace(members=list(members), get_member=cached.get, cached=cached)
+
+
+def _feed(dispatcher, events):
+    async def main():
+        for before, after in events:
+            await dispatcher.on_presence_update(before, after)
+    asyncio.run(main())
+
+
+def test_duplicate_and_noop_presences_reach_subscribers_once():
+    dispatcher, changes = PresenceDispatcher(), []
+    dispatcher.subscribe(Bot(), changes.append)
+    idle, apex = _member(1), _member(1, 'Apex Legends')
+    _feed(dispatcher, [
+        (idle, apex), (idle, apex),                          # same start from two guilds
+        (apex, _member(1, 'Apex Legends', details='Ranked')),  # details only
+        (apex, _member(1, 'Apex Legends', status='idle')),     # status only
+        (apex, idle), (apex, idle),                          # same stop from two guilds
+    ])
+    assert [([p.name for p in c.started], [p.name for p in c.stopped]) for c in changes] == [
+        (['Apex Legends'], []), ([], ['Apex Legends'])]
+    stats = dispatcher.stats()
+    assert (stats['received'], stats['processed'], stats['short_circuited']) == (6, 2, 4)
+
+
+def test_failing_subscriber_does_not_block_the_others():
+    dispatcher, changes = PresenceDispatcher(), []
+
+    def broken(change):
+        raise RuntimeError('boom')
+
+    bot = Bot()
+    dispatcher.subscribe(bot, broken)
+    dispatcher.subscribe(bot, changes.append)
+    _feed(dispatcher, [(_member(1), _member(1, 'osu!'))])
+    assert len(changes) == 1
+
+
+def test_state_is_dropped_when_the_member_leaves_every_guild():
+    a, b = _member(1, 'Minecraft'), _member(2, 'VALORANT')
+    first, second = _guild(a, b), _guild(a)
+    bot = Bot(first, second)
+    dispatcher = PresenceDispatcher()
+    dispatcher.subscribe(bot, lambda change: None)
+    for member in (a, b):
+        dispatcher.seed(member)
+
+    async def leave(guild, member):
+        del guild.cached[member.id]
+        await bot.listeners['on_member_remove'](member)
+
+    # Still in the second guild: kept, so its duplicate events are still dropped
+    asyncio.run(leave(first, a))
+    assert set(dispatcher.playing_now()) == {1, 2}
+    asyncio.run(leave(second, a))
+    assert set(dispatcher.playing_now()) == {2}
+
+    bot.guilds.remove(first)
+    asyncio.run(bot.listeners['on_guild_remove'](first))
+    assert dispatcher.stats()['members'] == 0
@@ -0,0 +1,44 @@
+"""RecommenderCog name resolution: who is shown under each BOT_MEMBER_CACHE mode."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from cogs import recommender_cog
+from cogs.member_cache import get_member_cache
+
+
+def _user(uid):
+    return SimpleNamespace(display_name=f'member{uid}',
+                           display_avatar=SimpleNamespace(url=f'https://avatar/{uid}'))
+
+
+@pytest.fixture
+def cog(monkeypatch):
+    # users 1..4 are visible to the bot; 5 and 6 left every guild
+    bot = SimpleNamespace(get_user=lambda uid: _user(uid) if uid <= 4 else None)
+    monkeypatch.setattr(recommender_cog, '_recorded_names',
+                        lambda ids: {uid: f'recorded{uid}' for uid in ids})
+    return recommender_cog.RecommenderCog(bot)
+
+
+def _results(ids):
+    return [(uid, 0.9 - i / 100, 0.5, 0.5, 0.5, ['Apex Legends']) for i, uid in enumerate(ids)]
+
+
+def test_unresolved_users_are_dropped_with_full_cache(cog, monkeypatch):
+    monkeypatch.setattr(get_member_cache(), 'lazy', False)
+    ids = ['5', '1', '6', '2', '3', '4']
+    users = asyncio.run(cog._resolve_users('test', None, ids))
+    assert sorted(users) == ['1', '2', '3', '4']
+
+    entries = recommender_cog.build_similar_entries(_results(ids), users, limit=3)
+    assert [e['user_id'] for e in entries] == [1, 2, 3]
+    assert entries[0]['display_name'] == 'member1'
+
+
+def test_recorded_names_stand_in_with_lazy_cache(cog, monkeypatch):
+    monkeypatch.setattr(get_member_cache(), 'lazy', True)
+    users = asyncio.run(cog._resolve_users('test', None, ['5', '1']))
+    assert users['1'] == ('member1', 'https://avatar/1')
+    assert users['5'] == ('recorded5', recommender_cog._DEFAULT_AVATAR_URL)
@@ -0,0 +1,49 @@
+"""RenderCache tiers and current-week versions."""
+from datetime import datetime
+
+from cogs.render_cache import RenderCache
+
+WEEK = datetime(2024, 6, 24)
+PNG = b'\x89PNG fake image bytes'
+
+
+def test_memory_then_disk_then_miss(tmp_path):
+    first = RenderCache(str(tmp_path))
+    key = first.content_key('1', WEEK, [('Apex Legends', '2024-06-24T20:00:00', '2024-06-24T21:00:00', 3600)])
+    first.put(key, PNG, disk=True)
+    assert first.get(key) == PNG
+    assert first.stats()['memory_hits'] == 1
+
+    # A restarted process: memory is empty, the disk tier still has the week
+    second = RenderCache(str(tmp_path))
+    assert second.get(key) is None
+    assert second.get(key, disk=True) == PNG
+    assert second.get(key) == PNG
+    stats = second.stats()
+    assert (stats['misses'], stats['disk_hits'], stats['memory_hits']) == (1, 1, 1)
+
+    assert second.get('0' * 64, disk=True) is None
+    assert second.stats()['misses'] == 2
+
+
+def test_disk_budget_evicts_oldest(tmp_path):
+    cache = RenderCache(str(tmp_path), disk_bytes=len(PNG) * 2)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, PNG, disk=True)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['b.png', 'c.png']
+
+
+def test_bump_invalidates_current_week(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    key, other = cache.current_key('1', WEEK), cache.current_key('2', WEEK)
+    cache.put(key, PNG)
+    assert cache.get(key) == PNG
+
+    cache.bump(1)
+    assert cache.current_key('1', WEEK) != key
+    assert cache.get(cache.current_key('1', WEEK)) is None
+    assert cache.current_key('2', WEEK) == other
+
+    cache.bump_all()
+    assert cache.current_key('2', WEEK) != other
+
@@ -0,0 +1,90 @@
+"""ResyncEngine: a full snapshot on the first on_ready, only the differences on later ones."""
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from cogs import presence
+from cogs.presence import PresenceDispatcher
+from cogs.resync import ResyncEngine
+
+
+class Bot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+
+    def add_listener(self, fn, name):
+        pass
+
+    def remove_listener(self, fn, name):
+        pass
+
+
+def _playing(*games):
+    return tuple(discord.Activity(type=discord.ActivityType.playing, name=g) for g in games)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """Three members of one guild; member 0 plays and sits in the voice channel."""
+    monkeypatch.setattr(presence, '_dispatcher', PresenceDispatcher())
+    vc = SimpleNamespace(id=9, name='vc', members=[])
+    members = [SimpleNamespace(id=i, name=f'user{i}', activities=(), voice=None) for i in range(3)]
+    guild = SimpleNamespace(members=members, voice_channels=[vc],
+                            get_member={m.id: m for m in members}.get)
+
+    def move(member, channel):
+        if member.voice:
+            member.voice.channel.members.remove(member)
+        member.voice = SimpleNamespace(channel=channel) if channel else None
+        if channel:
+            channel.members.append(member)
+
+    members[0].activities = _playing('Apex Legends')
+    move(members[0], vc)
+    return SimpleNamespace(bot=Bot([guild]), members=members, vc=vc, move=move)
+
+
+def test_initial_snapshot_then_deltas(gateway):
+    engine, snapshots, changes, voice = ResyncEngine(), [], [], []
+
+    async def initial(snapshot):
+        snapshots.append(snapshot)
+
+    engine.subscribe(gateway.bot, initial=initial, voice=voice.append)
+    presence.get_presence().subscribe(gateway.bot, changes.append)
+
+    def run():
+        asyncio.run(engine.on_ready())
+
+    run()
+    assert len(snapshots) == 1
+    assert {uid: [p.name for p in acts] for uid, acts in snapshots[0].playing.items()} == {
+        0: ['Apex Legends']}
+    assert snapshots[0].voice == {0: ('9', 'vc')}
+    assert (changes, voice, engine.stats()['kind']) == ([], [], '初回同期')
+
+    # While disconnected: member 0 stops and leaves voice, member 2 starts and joins
+    m0, _, m2 = gateway.members
+    m0.activities = ()
+    gateway.move(m0, None)
+    m2.activities = _playing('VALORANT')
+    gateway.move(m2, gateway.vc)
+    run()
+    assert len(snapshots) == 1
+    assert sorted((c.user_id, [p.name for p in c.started], [p.name for p in c.stopped])
+                  for c in changes) == [(0, [], ['Apex Legends']), (2, ['VALORANT'], [])]
+    assert sorted((v.user_id, v.before, v.after) for v in voice) == [
+        (0, ('9', 'vc'), None), (2, None, ('9', 'vc'))]
+    stats = engine.stats()
+    assert stats['kind'] == '差分再同期'
+    assert [stats[k] for k in ('members', 'games_started', 'games_stopped',
+                               'voice_joined', 'voice_left')] == [3, 1, 1, 1, 1]
+
+    # Nothing changed: nothing is dispatched
+    changes.clear()
+    voice.clear()
+    run()
+    assert (changes, voice) == ([], [])
+    assert engine.stats()['games_started'] == engine.stats()['voice_joined'] == 0
@@ -0,0 +1,117 @@
+"""daily_user_game_stats / user_hour_stats against the game_sessions rows they summarize."""
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import GAMES, USERS
+
+from cogs import queries
+from cogs.events import GameEnded, GameStarted
+from cogs.schema import apply_migrations, rebuild_rollups
+
+
+def _expected(conn):
+    """Rollups recomputed in Python from the closed game_sessions rows."""
+    daily, daily_count, hourly = Counter(), Counter(), Counter()
+    for user_id, game, start_time, duration in conn.execute(
+            'SELECT user_id, game_name, start_time, duration FROM game_sessions '
+            'WHERE end_time IS NOT NULL'):
+        start = datetime.fromisoformat(start_time)
+        key = (start.date().isoformat(), user_id, game)
+        daily[key] += duration or 0
+        daily_count[key] += 1
+        hourly[(user_id, start.hour)] += 1
+    return ({k: (daily_count[k], daily[k]) for k in daily}, dict(hourly))
+
+
+def _rollups(conn):
+    daily = {(day, uid, game): (count, total) for day, uid, game, count, total in conn.execute(
+        'SELECT day, user_id, game_name, session_count, total_seconds FROM daily_user_game_stats')}
+    hourly = {(uid, hour): count for uid, hour, count in conn.execute(
+        'SELECT user_id, hour, session_count FROM user_hour_stats')}
+    return daily, hourly
+
+
+def test_migration_builds_rollups_from_sessions(legacy_db):
+    apply_migrations(legacy_db)
+    assert _rollups(legacy_db) == _expected(legacy_db)
+
+
+def test_closed_sessions_keep_rollups_in_sync(legacy_db):
+    """Sessions closed through the write-behind records match a full rebuild."""
+    apply_migrations(legacy_db)
+    # Close the sessions left open by the legacy rows, then record new ones
+    open_rows = legacy_db.execute(
+        'SELECT user_id, game_name, start_time FROM game_sessions WHERE end_time IS NULL').fetchall()
+    for user_id, game, start_time in open_rows:
+        start = datetime.fromisoformat(start_time)
+        GameEnded(user_id, game, start, start + timedelta(minutes=45), 45 * 60).apply(legacy_db)
+    start = datetime(2024, 7, 1, 23, 30)
+    for i, user_id in enumerate(USERS):
+        game = GAMES[i % len(GAMES)]
+        GameStarted(user_id, f'name{user_id[-2:]}', game, start, None).apply(legacy_db)
+        end = start + timedelta(hours=1)  # crosses midnight; the start day owns it
+        GameEnded(user_id, game, start, end, 3600).apply(legacy_db)
+    legacy_db.commit()
+
+    incremental = _rollups(legacy_db)
+    assert incremental == _expected(legacy_db)
+    rebuild_rollups(legacy_db)
+    assert _rollups(legacy_db) == incremental
+
+
+def _baseline(conn, sql, *params):
+    """The same stats read straight from game_sessions, open rows included (as before the rollups)."""
+    return [tuple(r) for r in conn.execute(sql, params)]
+
+
+def test_stats_reads_match_sessions(legacy_db):
+    """Rollup reads agree with COUNT / SUM over game_sessions, in-progress sessions included."""
+    apply_migrations(legacy_db)
+    since_day, uid = '2024-06-20', USERS[3]
+    # One user whose only session is still open
+    GameStarted('42', 'newcomer', 'VALORANT', datetime(2024, 7, 1, 12, 0), None).apply(legacy_db)
+
+    got = {(r.user_id, r.game_name): r[2:] for r in queries.history_totals(since_day, legacy_db)}
+    assert got == {(u, g): (n, t) for u, g, n, t in _baseline(legacy_db, '''
+        SELECT user_id, game_name, COUNT(*), SUM(duration) FROM game_sessions
+        WHERE date(start_time) >= ? GROUP BY user_id, game_name''', since_day)}
+    assert got[('42', 'VALORANT')] == (1, 0)
+
+    assert [tuple(r) for r in queries.popular_games(since_day, 10, legacy_db)] == _baseline(legacy_db, '''
+        SELECT game_name, COUNT(DISTINCT user_id) AS players, COUNT(*), SUM(duration) AS total
+        FROM game_sessions WHERE date(start_time) >= ?
+        GROUP BY game_name ORDER BY players DESC, total DESC LIMIT 10''', since_day)
+
+    mine = {r.game_name: r[1:] for r in queries.my_games(uid, since_day, legacy_db)}
+    assert mine == {g: (n, t, pytest.approx(a)) for g, n, t, a in _baseline(legacy_db, '''
+        SELECT game_name, COUNT(*), SUM(duration), AVG(duration) FROM game_sessions
+        WHERE user_id=? AND date(start_time) >= ? GROUP BY game_name''', uid, since_day)}
+
+    assert dict(queries.favorite_games(uid, 10, legacy_db)) == dict(_baseline(legacy_db, '''
+        SELECT game_name, SUM(duration) FROM game_sessions WHERE user_id=? GROUP BY game_name''', uid))
+    assert queries.favorite_games('42', 5, legacy_db) == [('VALORANT', 0)]
+
+    assert dict(queries.hour_counts(uid, legacy_db)) == dict(_baseline(legacy_db, '''
+        SELECT CAST(strftime('%H', start_time) AS INTEGER), COUNT(*) FROM game_sessions
+        WHERE user_id=? GROUP BY 1''', uid))
+    assert queries.hour_counts('42', legacy_db) == [(12, 1)]
+
+
+def test_game_ended_closes_only_the_newest_open_row(legacy_db):
+    """Duplicate open rows (crash leftovers): one end event closes one session, as the rollup counts."""
+    apply_migrations(legacy_db)
+    user_id, game = USERS[0], 'Minecraft'
+    older, newer = datetime(2024, 7, 1, 20, 0), datetime(2024, 7, 1, 21, 0)
+    for start in (older, newer):
+        GameStarted(user_id, 'dup', game, start, None).apply(legacy_db)
+    GameEnded(user_id, game, newer, newer + timedelta(hours=1), 3600).apply(legacy_db)
+    # Nothing left open for this pair: no row changes and no rollup is added
+    GameEnded('0', game, newer, newer + timedelta(hours=1), 3600).apply(legacy_db)
+    legacy_db.commit()
+
+    rows = legacy_db.execute(
+        "SELECT start_time, end_time IS NULL FROM game_sessions WHERE user_name='dup' ORDER BY id"
+    ).fetchall()
+    assert rows == [(older.isoformat(), 1), (newer.isoformat(), 0)]
+    assert _rollups(legacy_db) == _expected(legacy_db)
@@ -0,0 +1,68 @@
+"""cogs.schema migrations on a database written by the pre-migration cogs."""
+import sqlite3
+from datetime import datetime
+
+from conftest import create_base_tables, fill_legacy_rows
+
+from cogs.schema import MIGRATIONS, apply_migrations
+
+
+def _snapshot(conn: sqlite3.Connection):
+    """Every schema object and every table's rows (minus schema_migrations.applied_at)."""
+    objects = sorted(conn.execute(
+        "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+    rows = {}
+    for name, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+        cols = 'version, name' if name == 'schema_migrations' else '*'
+        rows[name] = sorted(conn.execute(f'SELECT {cols} FROM {name}'), key=repr)
+    return objects, rows
+
+
+def _versions(conn: sqlite3.Connection) -> list[int]:
+    return [v for v, in conn.execute('SELECT version FROM schema_migrations ORDER BY version')]
+
+
+def test_apply_migrations_twice_changes_nothing(legacy_db):
+    apply_migrations(legacy_db)
+    assert _versions(legacy_db) == [m[0] for m in MIGRATIONS]
+    before = _snapshot(legacy_db)
+
+    apply_migrations(legacy_db)
+    assert _snapshot(legacy_db) == before
+
+
+def test_each_migration_reruns_cleanly(legacy_db):
+    """Re-running a migration body on a migrated database leaves schema and data unchanged."""
+    apply_migrations(legacy_db)
+    before = _snapshot(legacy_db)
+    for version, _, _, migrate in MIGRATIONS:
+        legacy_db.execute('BEGIN')
+        migrate(legacy_db)
+        legacy_db.commit()
+        assert _snapshot(legacy_db) == before, f'migration {version}'
+
+
+def test_migrations_wait_for_missing_tables(tmp_path):
+    """HistoryCog may start before TrackerCog: the voice / party migrations wait for their tables."""
+    conn = sqlite3.connect(tmp_path / 'game_history.db')
+    conn.execute('''CREATE TABLE game_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT, user_name TEXT, game_name TEXT,
+        start_time TEXT, end_time TEXT, duration INTEGER, details TEXT
+    )''')
+    apply_migrations(conn)
+    assert _versions(conn) == [1, 2, 3]
+
+    create_base_tables(conn)
+    fill_legacy_rows(conn)
+    apply_migrations(conn)
+    assert _versions(conn) == [m[0] for m in MIGRATIONS]
+
+
+def test_epoch_columns_match_iso_times(legacy_db):
+    apply_migrations(legacy_db)
+    for start_time, end_time, start_epoch, end_epoch in legacy_db.execute(
+            'SELECT start_time, end_time, start_epoch, end_epoch FROM game_sessions'):
+        assert start_epoch == int(datetime.fromisoformat(start_time).timestamp())
+        assert end_epoch == (int(datetime.fromisoformat(end_time).timestamp()) if end_time else None)
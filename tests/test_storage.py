@@ -0,0 +1,122 @@
+"""Storage: the write-behind queue, pump and writer thread."""
+import asyncio
+import sqlite3
+
+import pytest
+
+from cogs.storage import Storage
+
+
+class Insert:
+    def __init__(self, value):
+        self.value = value
+
+    def apply(self, conn):
+        conn.execute('INSERT INTO t (v) VALUES (?)', (self.value,))
+
+
+class Broken:
+    def apply(self, conn):
+        raise sqlite3.OperationalError('no such table: missing')
+
+
+def _values(path) -> list[int]:
+    conn = sqlite3.connect(path)
+    try:
+        return [v for (v,) in conn.execute('SELECT v FROM t ORDER BY v')]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'storage.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (v INTEGER)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_close_drains_the_queue(db):
+    async def main():
+        # A long interval: only close() can make these commit
+        storage = Storage(db, flush_interval=60)
+        await storage.open()
+        for v in range(100):
+            storage.submit(Insert(v))
+        await storage.close()
+        return storage
+
+    storage = asyncio.run(main())
+    assert _values(db) == list(range(100))
+    assert (storage.committed, storage.depth()) == (100, 0)
+
+
+def test_records_submitted_while_stopping_are_written(db):
+    async def main():
+        storage = Storage(db, flush_interval=60)
+        await storage.open()
+        for v in range(3):
+            storage.submit(Insert(v))
+        stopping = asyncio.create_task(storage.shutdown())
+        # shutdown() has flushed and queued the sentinel; the pump is winding down
+        while storage._pump is not None:
+            await asyncio.sleep(0)
+        storage.submit(Insert(3))
+        await stopping
+
+    asyncio.run(main())
+    assert _values(db) == [0, 1, 2, 3]
+
+
+def test_submit_drops_at_max_pending(db):
+    async def main():
+        storage = Storage(db, flush_interval=60, max_pending=2)
+        await storage.open()
+        accepted = [storage.submit(Insert(v)) for v in range(3)]
+        await storage.close()
+        return storage, accepted
+
+    storage, accepted = asyncio.run(main())
+    assert accepted == [True, True, False]
+    assert (storage.submitted, storage.dropped, storage.committed) == (2, 1, 2)
+    assert _values(db) == [0, 1]
+
+
+def test_failing_item_does_not_drop_its_batch(db):
+    async def main():
+        storage = Storage(db, flush_interval=60)
+        await storage.open()
+        storage.submit(Insert(1))
+        storage.submit(Broken())
+        storage.submit(Insert(2))
+        failed = storage.run(lambda conn: 1 / 0)
+        counted = storage.run(lambda conn: conn.execute('SELECT COUNT(*) FROM t').fetchone()[0])
+        with pytest.raises(ZeroDivisionError):
+            await failed
+        count = await counted
+        await storage.close()
+        return count
+
+    assert asyncio.run(main()) == 2
+    assert _values(db) == [1, 2]
+
+
+def test_queueing_requires_an_open_storage(db):
+    async def main():
+        storage = Storage(db)
+        with pytest.raises(RuntimeError):
+            storage.submit(Insert(1))
+        await storage.open()
+        await storage.close()
+        with pytest.raises(RuntimeError):
+            storage.submit(Insert(2))
+        with pytest.raises(RuntimeError):
+            storage.run(lambda conn: None)
+        with pytest.raises(RuntimeError):
+            storage.notify(lambda: None)
+        await storage.flush()
+
+    asyncio.run(main())
+    assert _values(db) == []
@@ -0,0 +1,115 @@
+"""cogs.voice_overlap: pair totals from per-member intervals vs the pair sessions they replaced."""
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import combinations
+
+import bench_voice_overlap
+import pytest
+
+from cogs import queries, schema, voice_overlap
+from cogs.events import VoiceInterval
+
+
+@pytest.fixture
+def voice_db(tmp_path):
+    conn = bench_voice_overlap.make_db(str(tmp_path / 'voice.db'))
+    yield conn
+    conn.close()
+
+
+def _random_stays(n_members: int, n_channels: int, n_stays: int, seed: int = 1):
+    """VoiceInterval rows in leave order; members hop between channels, one at a time."""
+    rng = random.Random(seed)
+    t0 = datetime(2024, 1, 1, 20, 0)
+    free_at = {m: t0 for m in range(n_members)}
+    stays = []
+    for _ in range(n_stays):
+        m = rng.randrange(n_members)
+        join = free_at[m] + timedelta(seconds=rng.randint(0, 300))
+        leave = join + timedelta(seconds=rng.randint(30, 1800))
+        free_at[m] = leave
+        channel = str(rng.randrange(n_channels))
+        stays.append(VoiceInterval(str(m), channel, f'vc{channel}', None, join, leave))
+    return sorted(stays, key=lambda s: s.leave_time)
+
+
+def _brute_force_totals(stays):
+    totals = Counter()
+    for a, b in combinations(stays, 2):
+        if a.channel_id != b.channel_id or a.user_id == b.user_id:
+            continue
+        overlap = (min(a.leave_time, b.leave_time) - max(a.join_time, b.join_time)).total_seconds()
+        if overlap > 0:
+            totals[tuple(sorted((a.user_id, b.user_id)))] += int(overlap)
+    return dict(totals)
+
+
+def test_sweep_matches_pair_sessions(tmp_path):
+    trace = bench_voice_overlap.make_trace(25, 400)
+    legacy = bench_voice_overlap.make_db(str(tmp_path / 'legacy.db'))
+    legacy.execute('DROP VIEW voice_co_sessions')
+    legacy.execute('ALTER TABLE voice_co_overlaps RENAME TO voice_co_sessions')
+    bench_voice_overlap.run_pairs(legacy, trace)
+
+    current = bench_voice_overlap.make_db(str(tmp_path / 'current.db'))
+    bench_voice_overlap.run_intervals(current, trace)
+    assert (bench_voice_overlap.pair_totals(current, 'voice_co_overlaps')
+            == bench_voice_overlap.pair_totals(legacy, 'voice_co_sessions'))
+
+
+@pytest.mark.parametrize('every', [1, 7, 10_000])
+def test_incremental_runs_match_brute_force(voice_db, every):
+    """Materializing after every N leaves emits each overlapping pair exactly once."""
+    stays = _random_stays(n_members=15, n_channels=3, n_stays=300)
+    for i, stay in enumerate(stays, 1):
+        stay.apply(voice_db)
+        if i % every == 0:
+            voice_overlap.materialize(voice_db)
+    voice_overlap.materialize(voice_db)
+    voice_db.commit()
+    assert bench_voice_overlap.pair_totals(voice_db, 'voice_co_overlaps') == _brute_force_totals(stays)
+
+
+def _overlap_sums(conn):
+    """(user_lo, user_hi) -> (seconds, last end_time) straight from voice_co_overlaps."""
+    return {(lo, hi): (secs, last) for lo, hi, secs, last in conn.execute('''
+        SELECT min(user_id_a, user_id_b), max(user_id_a, user_id_b),
+               SUM(COALESCE(duration, 0)), MAX(end_time)
+        FROM voice_co_overlaps GROUP BY 1, 2''')}
+
+
+def _pair_totals(conn):
+    return {(lo, hi): (secs, last) for lo, hi, secs, last in conn.execute(
+        'SELECT user_lo, user_hi, total_seconds, last_seen FROM voice_pair_totals')}
+
+
+def test_pair_totals_follow_overlaps(voice_db):
+    stays = _random_stays(n_members=15, n_channels=3, n_stays=300, seed=2)
+    for i, stay in enumerate(stays, 1):
+        stay.apply(voice_db)
+        if i % 5 == 0:
+            voice_overlap.materialize(voice_db)
+    voice_overlap.materialize(voice_db)
+    # Writers that still insert through the compatibility view count too
+    voice_db.execute('''INSERT INTO voice_co_sessions
+        (user_id_a, user_id_b, channel_id, channel_name, start_time, end_time, duration)
+        VALUES ('3', '1', '9', 'seed', '2024-02-01T10:00:00', '2024-02-01T11:00:00', 3600)''')
+    voice_db.commit()
+
+    incremental = _pair_totals(voice_db)
+    assert incremental == _overlap_sums(voice_db)
+    assert schema.rebuild_voice_pair_totals(voice_db) == len(incremental)
+    assert _pair_totals(voice_db) == incremental
+
+    for user in map(str, range(15)):
+        expected = {}
+        for (lo, hi), (secs, _) in incremental.items():
+            if user in (lo, hi):
+                expected[hi if user == lo else lo] = secs
+        assert queries.voice_co_seconds(user, voice_db) == expected
+
+
+def test_migration_totals_legacy_pair_rows(legacy_db):
+    schema.apply_migrations(legacy_db)
+    assert _pair_totals(legacy_db) == _overlap_sums(legacy_db)